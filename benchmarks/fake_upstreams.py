@@ -0,0 +1,206 @@
+"""
+Local stand-ins for xkcd (metadata and images) and the vision model API.
+
+Both servers answer from deterministic synthetic data, so the comics seeded by
+benchmarks.seed match what the fake xkcd serves. Latency and failures can be injected
+per upstream to see how the service behaves when its dependencies degrade.
+
+Usage:
+    python -m benchmarks.fake_upstreams --xkcd-port 8901 --model-port 8902 \
+        --comics 2000 --xkcd-latency-ms 40 --model-latency-ms 800 --model-error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import AsyncIterator, Dict
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# A 1x1 transparent PNG, padded so image responses have a realistic size.
+PNG_BYTES = (
+    b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00"
+    b"\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\rIDATx\x9cc\xf8\x0f\x00\x00\x01\x01\x00\x05"
+    b"\x18\xd8N\x00\x00\x00\x00IEND\xaeB`\x82"
+) + b"\x00" * 32 * 1024
+
+FIRST_COMIC_DATE = date(2006, 1, 1)
+
+
+@dataclass
+class FaultConfig:
+    """
+    Injected behaviour of one fake upstream.
+    """
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    async def apply(self) -> bool:
+        """
+        Sleeps for the configured latency and returns True if this request should fail.
+        """
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        return random.random() < self.error_rate
+
+
+def comic_document(number: int) -> Dict:
+    """
+    Returns the synthetic info.0.json document of a comic.
+    """
+    published = FIRST_COMIC_DATE + timedelta(days=number * 2)
+    return {
+        "num": number,
+        "title": f"Synthetic Comic {number}",
+        "safe_title": f"Synthetic Comic {number}",
+        "alt": f"Alt text of comic {number} about orbital mechanics and regular expressions.",
+        "img": f"https://imgs.xkcd.com/comics/synthetic_{number}.png",
+        "year": str(published.year),
+        "month": str(published.month),
+        "day": str(published.day),
+        "transcript": "",
+        "link": "",
+        "news": "",
+    }
+
+
+def create_xkcd_app(comics: int, faults: FaultConfig) -> Starlette:
+    """
+    Fake xkcd serving comics 1..comics (except 404, like the real site) and their images.
+    """
+
+    async def latest(request: Request) -> Response:
+        if await faults.apply():
+            return Response(status_code=503)
+        return JSONResponse(comic_document(comics))
+
+    async def comic(request: Request) -> Response:
+        if await faults.apply():
+            return Response(status_code=503)
+        number = request.path_params["number"]
+        if number < 1 or number > comics or number == 404:
+            return Response(status_code=404)
+        return JSONResponse(comic_document(number))
+
+    async def image(request: Request) -> Response:
+        if await faults.apply():
+            return Response(status_code=503)
+        return Response(PNG_BYTES, media_type="image/png")
+
+    return Starlette(
+        routes=[
+            Route("/info.0.json", latest),
+            Route("/{number:int}/info.0.json", comic),
+            Route("/comics/{name}", image),
+        ]
+    )
+
+
+def create_model_app(faults: FaultConfig) -> Starlette:
+    """
+    Fake chat completions API returning a canned explanation of the requested comic.
+    Streamed requests get the words one by one as server-sent events, with the latency
+    spread over them.
+    """
+
+    async def stream_completion(content: str) -> AsyncIterator[bytes]:
+        words = content.split(" ")
+        for position, word in enumerate(words):
+            delay = faults.latency_ms + random.uniform(-faults.jitter_ms, faults.jitter_ms)
+            if delay > 0:
+                await asyncio.sleep(delay / len(words) / 1000)
+            chunk = {
+                "id": "chatcmpl-fake",
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": word if position == 0 else f" {word}"},
+                    }
+                ],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    async def completions(request: Request) -> Response:
+        payload = await request.json()
+        prompt = payload["messages"][0]["content"][0]["text"]
+        content = f"This comic is about: {prompt[:200]}"
+        if payload.get("stream"):
+            if random.random() < faults.error_rate:
+                return JSONResponse(
+                    {"error": {"message": "injected failure"}}, status_code=500
+                )
+            return StreamingResponse(
+                stream_completion(content), media_type="text/event-stream"
+            )
+        if await faults.apply():
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=500)
+        return JSONResponse(
+            {
+                "id": "chatcmpl-fake",
+                "model": payload.get("model", "fake"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {
+                            "role": "assistant",
+                            "content": content,
+                        },
+                    }
+                ],
+            }
+        )
+
+    return Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+
+
+async def serve(args: argparse.Namespace) -> None:
+    xkcd = FaultConfig(args.xkcd_latency_ms, args.xkcd_jitter_ms, args.xkcd_error_rate)
+    model = FaultConfig(args.model_latency_ms, args.model_jitter_ms, args.model_error_rate)
+    servers = [
+        uvicorn.Server(
+            uvicorn.Config(
+                create_xkcd_app(args.comics, xkcd),
+                host=args.host,
+                port=args.xkcd_port,
+                log_level="warning",
+            )
+        ),
+        uvicorn.Server(
+            uvicorn.Config(
+                create_model_app(model),
+                host=args.host,
+                port=args.model_port,
+                log_level="warning",
+            )
+        ),
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--xkcd-port", type=int, default=8901)
+    parser.add_argument("--model-port", type=int, default=8902)
+    parser.add_argument("--comics", type=int, default=2000)
+    for upstream in ("xkcd", "model"):
+        parser.add_argument(f"--{upstream}-latency-ms", type=float, default=0.0)
+        parser.add_argument(f"--{upstream}-jitter-ms", type=float, default=0.0)
+        parser.add_argument(f"--{upstream}-error-rate", type=float, default=0.0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(parse_args()))
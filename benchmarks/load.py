@@ -0,0 +1,424 @@
+"""
+Load benchmark for project.server:app.
+
+Starts the fake xkcd and model servers (benchmarks.fake_upstreams) and the app under
+uvicorn pointed at them, then drives every route in turn at a fixed concurrency and
+prints throughput, latency percentiles and error counts per route as JSON. The database
+at DATABASE_URL must have been seeded with benchmarks.seed using the same --comics and
+--users values.
+
+Usage:
+    python -m benchmarks.seed --comics 2000 --users 500
+    python -m benchmarks.load --concurrency 32 --requests 2000 --output results.json
+    python -m benchmarks.load --routes comic --model-latency-ms 800 --model-error-rate 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.seed import LANGUAGES, comic_id, comic_numbers, explanation_id, user_id
+
+# Words of the synthetic titles, alt texts and explanations, one a prefix as if typed.
+SEARCH_QUERIES = (
+    "orbital mechanics",
+    "regular expressions",
+    "science joke",
+    "comic 12",
+    "orb",
+)
+
+
+@dataclass
+class RequestSpec:
+    method: str
+    path: str
+    params: Optional[Dict[str, Any]] = None
+    json: Any = None
+
+
+@dataclass
+class Scenario:
+    name: str
+    build: Callable[[random.Random], RequestSpec]
+
+
+def scenarios(comics: int, users: int) -> List[Scenario]:
+    """
+    One scenario per route, each building requests against the seeded data set.
+    """
+    numbers = comic_numbers(comics)
+    explained = numbers[::2]
+
+    def number(rng: random.Random) -> int:
+        return rng.choice(numbers)
+
+    def user(rng: random.Random) -> str:
+        return user_id(rng.randrange(users))
+
+    return [
+        Scenario(
+            "GET /comic/random",
+            lambda rng: RequestSpec("GET", "/comic/random", {"user_id": user(rng)}),
+        ),
+        Scenario(
+            "GET /comic/{number}",
+            lambda rng: RequestSpec("GET", f"/comic/{number(rng)}"),
+        ),
+        Scenario(
+            "GET /comic/popular",
+            lambda rng: RequestSpec(
+                "GET", "/comic/popular", {"window": rng.choice(["hour", "day", "week"])}
+            ),
+        ),
+        Scenario(
+            "GET /comic/{number}/similar",
+            lambda rng: RequestSpec("GET", f"/comic/{number(rng)}/similar"),
+        ),
+        Scenario(
+            "GET /user/recommendations",
+            lambda rng: RequestSpec(
+                "GET", "/user/recommendations", {"user_id": user(rng)}
+            ),
+        ),
+        Scenario(
+            "GET /comic/{number}/image",
+            lambda rng: RequestSpec("GET", f"/comic/{number(rng)}/image"),
+        ),
+        Scenario(
+            "POST /comic/batch",
+            lambda rng: RequestSpec(
+                "POST", "/comic/batch", json={"numbers": rng.sample(numbers, 20)}
+            ),
+        ),
+        Scenario(
+            "GET /explanation/{comicId}",
+            lambda rng: RequestSpec("GET", f"/explanation/{comic_id(number(rng))}"),
+        ),
+        Scenario(
+            "GET /explanation/{comicId}/stream",
+            lambda rng: RequestSpec(
+                "GET",
+                f"/explanation/{comic_id(number(rng))}/stream",
+                {"format": rng.choice(["sse", "ndjson"])},
+            ),
+        ),
+        Scenario(
+            "POST /explanation/batch",
+            lambda rng: RequestSpec(
+                "POST",
+                "/explanation/batch",
+                json={"comicIds": [comic_id(n) for n in rng.sample(numbers, 20)]},
+            ),
+        ),
+        Scenario(
+            "GET /user/preferences",
+            lambda rng: RequestSpec("GET", "/user/preferences", {"user_id": user(rng)}),
+        ),
+        Scenario(
+            "PUT /user/preferences",
+            lambda rng: RequestSpec(
+                "PUT",
+                "/user/preferences",
+                {"userId": user(rng), "language": rng.choice(LANGUAGES)},
+                json=[comic_id(n) for n in rng.sample(numbers, 10)],
+            ),
+        ),
+        Scenario(
+            "PUT /i18n/language",
+            lambda rng: RequestSpec(
+                "PUT",
+                "/i18n/language",
+                {"user_id": user(rng), "language": rng.choice(LANGUAGES)},
+            ),
+        ),
+        Scenario(
+            "GET /api/external/{serviceName}/{action}",
+            lambda rng: RequestSpec("GET", "/api/external/xkcd/info.0.json"),
+        ),
+        Scenario(
+            "POST /moderation/flag/{explanationId}",
+            lambda rng: RequestSpec(
+                "POST", f"/moderation/flag/{explanation_id(rng.choice(explained))}"
+            ),
+        ),
+        Scenario(
+            "PUT /moderation/review/{explanationId}",
+            lambda rng: RequestSpec(
+                "PUT",
+                f"/moderation/review/{explanation_id(rng.choice(explained))}",
+                {"approvalStatus": "true", "reviewComment": "benchmark"},
+            ),
+        ),
+        Scenario(
+            "GET /moderation/queue",
+            lambda rng: RequestSpec("GET", "/moderation/queue", {"limit": 50}),
+        ),
+        Scenario(
+            "POST /moderation/review",
+            lambda rng: RequestSpec(
+                "POST",
+                "/moderation/review",
+                json={
+                    "explanationIds": [
+                        explanation_id(n) for n in rng.sample(explained, 100)
+                    ],
+                    "approvalStatus": True,
+                    "reviewComment": "benchmark",
+                },
+            ),
+        ),
+        Scenario(
+            "POST /explanation/{comicId}/generate",
+            lambda rng: RequestSpec(
+                "POST", f"/explanation/{comic_id(number(rng))}/generate"
+            ),
+        ),
+        Scenario(
+            "POST /explanation/generate-all",
+            lambda rng: RequestSpec("POST", "/explanation/generate-all"),
+        ),
+        Scenario(
+            "GET /search",
+            lambda rng: RequestSpec(
+                "GET", "/search", {"q": rng.choice(SEARCH_QUERIES), "limit": 20}
+            ),
+        ),
+        Scenario("GET /cache/stats", lambda rng: RequestSpec("GET", "/cache/stats")),
+        Scenario("GET /metrics", lambda rng: RequestSpec("GET", "/metrics")),
+    ]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    warmup: int,
+    rng: random.Random,
+) -> Dict[str, Any]:
+    """
+    Sends `requests` requests for one scenario from `concurrency` concurrent workers.
+    """
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    remaining = warmup + requests
+    measured_start: Optional[float] = None
+
+    async def send() -> Tuple[float, str]:
+        spec = scenario.build(rng)
+        start = time.perf_counter()
+        try:
+            response = await client.request(
+                spec.method, spec.path, params=spec.params, json=spec.json
+            )
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        return time.perf_counter() - start, status
+
+    async def worker() -> None:
+        nonlocal remaining, measured_start
+        while remaining > 0:
+            remaining -= 1
+            measured = remaining < requests
+            if measured and measured_start is None:
+                measured_start = time.perf_counter()
+            elapsed, status = await send()
+            if measured:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    # Warm-up requests are sent by the same workers but left out of the results.
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - measured_start if measured_start else 0.0
+    latencies.sort()
+    # Transport failures and 5xx responses are errors; 4xx are valid answers.
+    errors = sum(
+        count
+        for status, count in statuses.items()
+        if not status.isdigit() or int(status) >= 500
+    )
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ok(url: str, timeout: float = 60.0, interval: float = 0.2) -> None:
+    """
+    Polls a URL until it answers with a 2xx status.
+    """
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(url)).is_success:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout}s")
+            await asyncio.sleep(interval)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_services(args: argparse.Namespace, tmpdir: str) -> List[subprocess.Popen]:
+    """
+    Starts the fake upstreams and the app, returning the processes to stop afterwards.
+    """
+    xkcd_port, model_port = _free_port(), _free_port()
+    fakes = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_upstreams",
+            "--xkcd-port", str(xkcd_port),
+            "--model-port", str(model_port),
+            "--comics", str(args.comics),
+            "--xkcd-latency-ms", str(args.xkcd_latency_ms),
+            "--xkcd-jitter-ms", str(args.xkcd_jitter_ms),
+            "--xkcd-error-rate", str(args.xkcd_error_rate),
+            "--model-latency-ms", str(args.model_latency_ms),
+            "--model-jitter-ms", str(args.model_jitter_ms),
+            "--model-error-rate", str(args.model_error_rate),
+        ]
+    )  # fmt: skip
+    xkcd_url = f"http://127.0.0.1:{xkcd_port}"
+    env = {
+        **os.environ,
+        "XKCD_BASE_URL": xkcd_url,
+        "XKCD_IMAGES_BASE_URL": xkcd_url,
+        "VISION_BASE_URL": f"http://127.0.0.1:{model_port}",
+        "EXPLANATION_MODEL_URL": f"http://127.0.0.1:{model_port}/v1/chat/completions",
+        "EXPLANATION_BACKEND": "vision",
+        "IMAGE_CACHE_DIR": os.path.join(tmpdir, "images"),
+        # All load comes from one address, so per-client limits would cap the benchmark.
+        "ADMISSION_CLIENT_RATE": os.environ.get("ADMISSION_CLIENT_RATE", "0"),
+    }
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "project.server:app",
+            "--host", "127.0.0.1",
+            "--port", str(args.port),
+            "--workers", str(args.workers),
+            "--log-level", "warning",
+        ],
+        env=env,
+    )  # fmt: skip
+    return [server, fakes]
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    processes: List[subprocess.Popen] = []
+    tmpdir = tempfile.mkdtemp(prefix="horser-bench-")
+    base_url = args.server_url
+    try:
+        if base_url is None:
+            processes = start_services(args, tmpdir)
+            base_url = f"http://127.0.0.1:{args.port}"
+        await wait_until_ok(f"{base_url}/readyz")
+        rng = random.Random(args.seed)
+        selected = [
+            scenario
+            for scenario in scenarios(args.comics, args.users)
+            if not args.routes or any(part in scenario.name for part in args.routes)
+        ]
+        limits = httpx.Limits(
+            max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+        )
+        results = {}
+        async with httpx.AsyncClient(
+            base_url=base_url, limits=limits, timeout=args.timeout
+        ) as client:
+            for scenario in selected:
+                results[scenario.name] = await run_scenario(
+                    client, scenario, args.requests, args.concurrency, args.warmup, rng
+                )
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "args": vars(args),
+        },
+        "routes": results,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--comics", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000, help="Per route.")
+    parser.add_argument("--warmup", type=int, default=50, help="Per route.")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--routes", nargs="*", help="Only run routes whose name contains one of these."
+    )
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--server-url", help="Benchmark an already running server instead of starting one."
+    )
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    for upstream in ("xkcd", "model"):
+        parser.add_argument(f"--{upstream}-latency-ms", type=float, default=0.0)
+        parser.add_argument(f"--{upstream}-jitter-ms", type=float, default=0.0)
+        parser.add_argument(f"--{upstream}-error-rate", type=float, default=0.0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
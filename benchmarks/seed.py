@@ -0,0 +1,182 @@
+"""
+Seeds the database at DATABASE_URL with synthetic users, comics, favorites, views and
+explanations for the load benchmark.
+
+Ids are derived deterministically from each row's index, so benchmarks.load can build
+requests for seeded rows without querying the database.
+
+Usage:
+    python -m benchmarks.seed --comics 2000 --users 500 --views 50000
+"""
+
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from benchmarks.fake_upstreams import comic_document
+
+NAMESPACE = uuid.UUID("5f0c1f4e-0d6a-4c65-9a1e-3b8d2f6e7a10")
+EXPLAINER_EMAIL = "explainer@horser.local"
+LANGUAGES = ("en", "de", "fr", "es", "ja")
+CHUNK_SIZE = 5000
+
+
+def comic_id(number: int) -> str:
+    return str(uuid.uuid5(NAMESPACE, f"comic:{number}"))
+
+
+def user_id(index: int) -> str:
+    return str(uuid.uuid5(NAMESPACE, f"user:{index}"))
+
+
+def explanation_id(number: int) -> str:
+    return str(uuid.uuid5(NAMESPACE, f"explanation:{number}"))
+
+
+def comic_numbers(comics: int) -> List[int]:
+    """
+    Numbers of the comics the fake xkcd serves; 404 does not exist, like on the real site.
+    """
+    return [number for number in range(1, comics + 1) if number != 404]
+
+
+async def _create_chunked(actions, rows: List[Dict]) -> int:
+    created = 0
+    for start in range(0, len(rows), CHUNK_SIZE):
+        created += await actions.create_many(
+            data=rows[start : start + CHUNK_SIZE], skip_duplicates=True
+        )
+    return created
+
+
+async def seed(
+    db, comics: int, users: int, favorites: int, views: int, seed_value: int
+) -> Dict[str, int]:
+    """
+    Inserts the synthetic data set. Re-running with the same arguments is a no-op.
+
+    Returns:
+        Dict[str, int]: Number of rows created per model.
+    """
+    rng = random.Random(seed_value)
+    numbers = comic_numbers(comics)
+    explainer = await db.user.upsert(
+        where={"email": EXPLAINER_EMAIL},
+        data={
+            "create": {"email": EXPLAINER_EMAIL, "passwordHash": "!"},
+            "update": {},
+        },
+    )
+    created = {}
+    created["comics"] = await _create_chunked(
+        db.comic,
+        [
+            {
+                "id": comic_id(number),
+                "number": number,
+                "title": document["title"],
+                "imageUrl": document["img"],
+                "altText": document["alt"],
+                "publishedAt": datetime(
+                    int(document["year"]), int(document["month"]), int(document["day"])
+                ),
+            }
+            for number, document in ((n, comic_document(n)) for n in numbers)
+        ],
+    )
+    created["users"] = await _create_chunked(
+        db.user,
+        [
+            {
+                "id": user_id(index),
+                "email": f"user{index}@bench.horser.local",
+                "passwordHash": "!",
+            }
+            for index in range(users)
+        ],
+    )
+    created["preferences"] = await _create_chunked(
+        db.preferences,
+        [
+            {"userId": user_id(index), "language": rng.choice(LANGUAGES)}
+            for index in range(users)
+        ],
+    )
+    created["favorites"] = await _create_chunked(
+        db.favorite,
+        [
+            {"userId": user_id(index), "comicId": comic_id(number)}
+            for index in range(users)
+            for number in rng.sample(numbers, min(favorites, len(numbers)))
+        ],
+    )
+    now = datetime.utcnow()
+    created["views"] = await _create_chunked(
+        db.comicview,
+        [
+            {
+                # Views follow a rough power law so some comics are much more popular.
+                "comicId": comic_id(numbers[int(rng.paretovariate(1.2)) % len(numbers)]),
+                "userId": user_id(rng.randrange(users)),
+                "viewDate": now - timedelta(seconds=rng.randrange(30 * 24 * 3600)),
+            }
+            for _ in range(views)
+        ],
+    )
+    # Every other comic has an explanation so both cache paths are exercised.
+    created["explanations"] = await _create_chunked(
+        db.explanation,
+        [
+            {
+                "id": explanation_id(number),
+                "comicId": comic_id(number),
+                "generatedBy": explainer.id,
+                "text": f"Comic {number} explains a joke about science. " * 20,
+            }
+            for number in numbers[::2]
+        ],
+    )
+    # The app reads popular comics from hourly rollups, not from ComicView.
+    from project.popularity import backfill_rollups
+
+    created["view_rollups"] = await backfill_rollups()
+    await db.synccheckpoint.upsert(
+        where={"name": "comics"},
+        data={
+            "create": {"name": "comics", "lastNumber": comics},
+            "update": {"lastNumber": comics},
+        },
+    )
+    return created
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--comics", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--favorites", type=int, default=20, help="Favorites per user.")
+    parser.add_argument("--views", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+async def main(args: argparse.Namespace) -> None:
+    # Imported here so benchmarks.load can use the id helpers without a generated client.
+    from prisma import Prisma
+
+    db = Prisma(auto_register=True)
+    await db.connect()
+    try:
+        created = await seed(
+            db, args.comics, args.users, args.favorites, args.views, args.seed
+        )
+    finally:
+        await db.disconnect()
+    print(created)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
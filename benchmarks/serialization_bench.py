@@ -0,0 +1,90 @@
+"""
+Micro-benchmark of the per-request response serialization cost.
+
+Compares FastAPI's default path for a route with a response_model (validate the returned
+model against response_model, run jsonable_encoder, render with json.dumps) against the
+ORJSONModelResponse path the routes use now (one model.dict() plus orjson.dumps).
+
+Usage:
+    python -m benchmarks.serialization_bench [iterations]
+"""
+
+import asyncio
+import json
+import sys
+import time
+from typing import Awaitable, Callable, Dict
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from project.get_comic_batch_service import ComicBatchItem, ComicBatchResponse
+from project.get_comic_explanation_service import GetComicExplanationResponseModel
+from project.get_random_comic_service import RandomComicResponse
+from project.responses import model_response
+
+COMIC = RandomComicResponse(
+    title="Barrel - Part 1",
+    img_url="https://imgs.xkcd.com/comics/barrel_cropped_(1).jpg",
+    num=1,
+    alt_text="Don't we all.",
+    date="2006-01-01",
+)
+SAMPLES = {
+    "comic": COMIC,
+    "explanation": GetComicExplanationResponseModel(
+        comicId="0b6c6e1c-6d0e-4b8e-9f0a-1f3f3a2c9d11",
+        explanation="A boy drifts out to sea in a barrel. " * 40,
+        generatedBy="6c1f7e6a-3d35-4e42-9a39-0b0e9c6f7d22",
+        createdAt="2024-04-12T18:30:37.664339",
+    ),
+    "comic_batch_50": ComicBatchResponse(
+        items=[ComicBatchItem(num=n, comic=COMIC) for n in range(50)]
+    ),
+}
+
+
+def fastapi_default(model) -> Callable[[], Awaitable[bytes]]:
+    field = create_response_field(name="response", type_=type(model))
+
+    async def run() -> bytes:
+        content = await serialize_response(
+            field=field, response_content=model, is_coroutine=True
+        )
+        return JSONResponse(content).body
+
+    return run
+
+
+def orjson_once(model) -> Callable[[], Awaitable[bytes]]:
+    async def run() -> bytes:
+        return model_response(model).body
+
+    return run
+
+
+async def measure(fn: Callable[[], Awaitable[bytes]], iterations: int) -> float:
+    await fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def main(iterations: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, model in SAMPLES.items():
+        before = await measure(fastapi_default(model), iterations)
+        after = await measure(orjson_once(model), iterations)
+        results[name] = {
+            "fastapi_default_us": round(before, 2),
+            "orjson_once_us": round(after, 2),
+            "speedup": round(before / after, 2),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(json.dumps(asyncio.run(main(iterations)), indent=2))
@@ -0,0 +1,136 @@
+"""
+Compares per-process caching with per-process plus host-shared caching across workers.
+
+Each simulated worker is a separate process with its own AsyncTTLCache, like a uvicorn
+worker. Workers read keys drawn from a Zipf distribution and a miss sleeps for
+--load-ms, standing in for a database query or upstream call. The report gives, per
+mode, the local and shared hit rates, how many loads reached the source and the lookup
+latency. No database or upstream is needed.
+
+Usage:
+    python -m benchmarks.shared_cache_bench --workers 4 --lookups 20000
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List
+
+
+def zipf_cum_weights(keys: int, exponent: float) -> List[float]:
+    return list(itertools.accumulate(1 / rank**exponent for rank in range(1, keys + 1)))
+
+
+async def run_worker(args, worker: int, shared: bool) -> Dict[str, Any]:
+    # Imported here so SHARED_CACHE_PATH is set before the shared cache module reads it.
+    from project.cache import AsyncTTLCache
+    from project.shared_cache import Codec, close_shared_cache
+
+    cache: AsyncTTLCache[Dict] = AsyncTTLCache(
+        "bench",
+        max_entries=args.local_entries,
+        ttl=3600.0,
+        shared=Codec() if shared else None,
+    )
+    loads = 0
+
+    async def load(key: int) -> Dict:
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(args.load_ms / 1000)
+        return {"num": key, "title": f"Comic {key}", "alt": "x" * args.value_bytes}
+
+    rng = random.Random(worker)
+    cum_weights = zipf_cum_weights(args.keys, args.zipf)
+    keys = rng.choices(range(args.keys), cum_weights=cum_weights, k=args.lookups)
+    latencies = []
+    for key in keys:
+        start = time.perf_counter()
+        await cache.get_or_load(key, lambda: load(key))
+        latencies.append(time.perf_counter() - start)
+    await close_shared_cache()
+    return {
+        "loads": loads,
+        "local_hits": cache.stats.hits,
+        "shared_hits": cache.stats.shared_hits,
+        "latencies": latencies,
+    }
+
+
+def worker_main(args, worker: int, shared: bool, path: str, barrier, results) -> None:
+    os.environ["SHARED_CACHE_PATH"] = path
+    barrier.wait()
+    results.put(asyncio.run(run_worker(args, worker, shared)))
+
+
+def run_mode(args, shared: bool) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    path = os.path.join(tempfile.mkdtemp(prefix="horser-shared-cache-"), "cache.sqlite3")
+    barrier = context.Barrier(args.workers)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=worker_main, args=(args, worker, shared, path, barrier, results)
+        )
+        for worker in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    lookups = args.workers * args.lookups
+    latencies = sorted(l for report in reports for l in report["latencies"])
+    local_hits = sum(report["local_hits"] for report in reports)
+    shared_hits = sum(report["shared_hits"] for report in reports)
+    return {
+        "lookups": lookups,
+        "source_loads": sum(report["loads"] for report in reports),
+        "local_hit_rate": round(local_hits / lookups, 4),
+        "shared_hit_rate": round(shared_hits / lookups, 4),
+        "hit_rate": round((local_hits + shared_hits) / lookups, 4),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 4),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 4),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 4),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=20000, help="Per worker.")
+    parser.add_argument("--keys", type=int, default=5000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--local-entries", type=int, default=1000)
+    parser.add_argument("--load-ms", type=float, default=2.0)
+    parser.add_argument("--value-bytes", type=int, default=512)
+    parser.add_argument("--output", help="Also write the report to this file.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    report = {
+        "config": vars(args),
+        "per_process": run_mode(args, shared=False),
+        "shared": run_mode(args, shared=True),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Measures how long a fresh app process takes to become live (/healthz) and ready (/readyz).
+
+Each run starts the fake upstreams and the app under uvicorn like benchmarks.load, so the
+database at DATABASE_URL must be reachable and should be seeded with benchmarks.seed for
+warm-up to have data to preload. The app's own breakdown of the last run, as reported
+by /readyz, is included.
+
+Usage:
+    python -m benchmarks.startup_bench [runs]
+"""
+
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+import httpx
+
+from benchmarks.load import parse_args, start_services, wait_until_ok
+
+
+async def measure_once(args) -> Dict[str, Any]:
+    processes = start_services(args, tempfile.mkdtemp(prefix="horser-startup-"))
+    base_url = f"http://127.0.0.1:{args.port}"
+    start = time.perf_counter()
+    try:
+        await wait_until_ok(f"{base_url}/healthz", interval=0.01)
+        live = time.perf_counter() - start
+        await wait_until_ok(f"{base_url}/readyz", interval=0.01)
+        ready = time.perf_counter() - start
+        async with httpx.AsyncClient() as client:
+            phases = (await client.get(f"{base_url}/readyz")).json()["phases"]
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    return {"live_s": live, "ready_s": ready, "phases": phases}
+
+
+async def main(runs: int) -> Dict[str, Any]:
+    # Reuse the load benchmark's defaults for ports, data set size and fault injection.
+    sys.argv = sys.argv[:1]
+    args = parse_args()
+    results = [await measure_once(args) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "live_median_s": round(statistics.median(r["live_s"] for r in results), 3),
+        "ready_median_s": round(statistics.median(r["ready_s"] for r in results), 3),
+        "last_run_phases": results[-1]["phases"],
+    }
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(json.dumps(asyncio.run(main(runs)), indent=2))
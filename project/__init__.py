@@ -0,0 +1,4 @@
+import time
+
+# Taken when the package is first imported, so startup reporting includes import time.
+IMPORT_STARTED_AT = time.monotonic()
@@ -0,0 +1,376 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import orjson
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from project.http_client import UPSTREAMS
+
+# Requests per second and burst allowed to each client IP, on any route. Behind a proxy
+# the client IP is taken from X-Forwarded-For, which uvicorn only trusts from the
+# addresses in FORWARDED_ALLOW_IPS.
+ADMISSION_CLIENT_RATE = float(os.environ.get("ADMISSION_CLIENT_RATE", "50"))
+ADMISSION_CLIENT_BURST = float(os.environ.get("ADMISSION_CLIENT_BURST", "100"))
+# Clients whose buckets are remembered. The least recently seen are forgotten first.
+ADMISSION_MAX_CLIENTS = int(os.environ.get("ADMISSION_MAX_CLIENTS", "100000"))
+# How long a request may wait for an upstream slot before it is shed, and how many may
+# wait at once per upstream.
+ADMISSION_MAX_QUEUE_WAIT = float(os.environ.get("ADMISSION_MAX_QUEUE_WAIT", "0.25"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "64"))
+
+# Requests per second and burst per route template, shared by all clients. Routes not
+# listed are only limited per client. Overridden by ADMISSION_ROUTE_RATES, e.g.
+# "/comic/random=500:1000,/explanation/generate-all=0.1:1".
+ROUTE_RATES: Dict[str, Tuple[float, float]] = {
+    "/api/external/{serviceName}/{action}": (20.0, 40.0),
+    "/comic/random": (500.0, 1000.0),
+    "/explanation/{comicId}/generate": (5.0, 10.0),
+    "/explanation/{comicId}/stream": (20.0, 40.0),
+    "/explanation/generate-all": (0.1, 1.0),
+    "/export/{model}": (1.0, 4.0),
+    "/import/{model}": (1.0, 4.0),
+}
+
+# Routes that may call an upstream, and which upstream a request calls. A route that
+# calls one only on some requests, e.g. /comic/random on a catalog miss, takes the slot
+# itself through AdmissionController.upstream_slot.
+ROUTE_UPSTREAMS: Dict[str, Callable[[Dict[str, Any]], Optional[str]]] = {
+    "/api/external/{serviceName}/{action}": lambda params: params.get("serviceName"),
+    "/comic/{number}/image": lambda params: "xkcd-images",
+}
+# Requests in flight per upstream, overridable per upstream, e.g. VISION_MAX_CONCURRENCY.
+# The explanation pipeline's model calls also hold a GPT-4-vision slot.
+UPSTREAM_CONCURRENCY = {"xkcd": 64, "xkcd-images": 64, "GPT-4-vision": 8}
+
+# Probes and scrapes must keep working while the service sheds load.
+EXEMPT_PATHS = {"/healthz", "/readyz", "/metrics"}
+
+
+class OverloadedError(Exception):
+    """
+    Raised when a request cannot get an upstream concurrency slot in time.
+    """
+
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(f"Too many requests to {upstream} in flight, retry later.")
+        self.retry_after = retry_after
+
+
+def parse_route_rates(value: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Parses "route=rate:burst" pairs separated by commas.
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, limits = item.rpartition("=")
+        rate, _, burst = limits.partition(":")
+        if not route or not rate:
+            raise ValueError(f"Invalid route rate {item!r}, expected route=rate:burst.")
+        rates[route] = (float(rate), float(burst or rate))
+    return rates
+
+
+class TokenBuckets:
+    """
+    One token bucket per key, all with the same rate and burst. Each request takes a
+    token, and tokens are refilled continuously at rate per second up to burst.
+    """
+
+    def __init__(
+        self, rate: float, burst: float, max_keys: int = ADMISSION_MAX_CLIENTS
+    ) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_keys = max_keys
+        # key -> (tokens, time of the last update), least recently used first.
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str) -> float:
+        """
+        Takes a token from a key's bucket.
+
+        Returns:
+            float: 0 if a token was taken, else the seconds until one is available.
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = self.burst
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            self._buckets.move_to_end(key)
+        if tokens >= 1.0:
+            self._buckets[key] = (tokens - 1.0, now)
+            return 0.0
+        self._buckets[key] = (tokens, now)
+        return (1.0 - tokens) / self.rate
+
+
+class ConcurrencyLimit:
+    """
+    Caps the requests in flight to one upstream. Requests beyond the cap wait for a slot,
+    but only up to max_wait seconds and only max_queue at a time, so under overload they
+    are turned away quickly instead of piling up.
+    """
+
+    def __init__(self, limit: int, max_queue: int, max_wait: float) -> None:
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> bool:
+        """
+        Takes a slot, waiting for one if needed.
+
+        Returns:
+            bool: False if the request should be shed instead.
+        """
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Holds a slot while a call made outside a request runs, waiting for one as long as
+        needed instead of being shed.
+        """
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def _upstream_concurrency(name: str) -> int:
+    prefix, _ = UPSTREAMS[name]
+    default = UPSTREAM_CONCURRENCY.get(name, 32)
+    return int(os.environ.get(f"{prefix}_MAX_CONCURRENCY", str(default)))
+
+
+class AdmissionController:
+    """
+    Decides which requests are served.
+
+    A request is turned away with 429 when its client IP, or its route as a whole, has
+    used up its rate limit. A request to a route that calls an upstream then
+    needs one of that upstream's concurrency slots. It is turned away with 503 when no
+    slot frees up within the queue wait target. Both carry Retry-After. Admitted and shed
+    requests are counted per route so the limits can be tuned.
+    """
+
+    def __init__(
+        self,
+        client_rate: float = ADMISSION_CLIENT_RATE,
+        client_burst: float = ADMISSION_CLIENT_BURST,
+        route_rates: Optional[Dict[str, Tuple[float, float]]] = None,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait: float = ADMISSION_MAX_QUEUE_WAIT,
+    ) -> None:
+        self.clients = TokenBuckets(client_rate, client_burst)
+        self.routes = {
+            route: TokenBuckets(rate, burst, max_keys=1)
+            for route, (rate, burst) in (route_rates or ROUTE_RATES).items()
+        }
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.upstreams: Dict[str, ConcurrencyLimit] = {}
+        self.admitted: Dict[str, int] = {}
+        # (route, reason) -> requests shed
+        self.shed: Dict[Tuple[str, str], int] = {}
+
+    def upstream_limit(self, name: str) -> Optional[ConcurrencyLimit]:
+        """
+        Returns the concurrency limit of an upstream, None if the upstream is unknown.
+        """
+        limit = self.upstreams.get(name)
+        if limit is None and name in UPSTREAMS:
+            limit = self.upstreams[name] = ConcurrencyLimit(
+                _upstream_concurrency(name), self.max_queue, self.max_wait
+            )
+        return limit
+
+    def _count_shed(self, route: str, reason: str) -> None:
+        self.shed[(route, reason)] = self.shed.get((route, reason), 0) + 1
+
+    def check_rates(self, route: str, client: str) -> Optional[float]:
+        """
+        Takes a token for the client and the route.
+
+        Returns:
+            Optional[float]: None if admitted, else the seconds to wait before retrying.
+        """
+        # Keyed on the address only: requests carry no authenticated identity, and a
+        # user id taken from the request would let anyone drain another user's bucket.
+        wait = self.clients.take(f"ip:{client}")
+        if wait:
+            self._count_shed(route, "client_rate")
+            return wait
+        bucket = self.routes.get(route)
+        if bucket is not None:
+            wait = bucket.take(route)
+            if wait:
+                self._count_shed(route, "route_rate")
+                return wait
+        return None
+
+    async def acquire(self, route: str, upstream: str) -> Optional[ConcurrencyLimit]:
+        """
+        Takes a concurrency slot of an upstream, to be released once the response is sent.
+
+        Returns:
+            Optional[ConcurrencyLimit]: The limit holding the slot, None if the upstream is
+            unknown.
+
+        Raises:
+            OverloadedError: If no slot freed up in time.
+        """
+        limit = self.upstream_limit(upstream)
+        if limit is not None and not await limit.acquire():
+            self._count_shed(route, "concurrency")
+            raise OverloadedError(upstream, self.max_wait)
+        return limit
+
+    @asynccontextmanager
+    async def upstream_slot(self, route: str, upstream: str) -> AsyncIterator[None]:
+        """
+        Holds a concurrency slot of an upstream around a call a route makes only on some
+        requests.
+
+        Raises:
+            OverloadedError: If no slot freed up in time.
+        """
+        limit = await self.acquire(route, upstream)
+        try:
+            yield
+        finally:
+            if limit is not None:
+                limit.release()
+
+    def record_admitted(self, route: str) -> None:
+        self.admitted[route] = self.admitted.get(route, 0) + 1
+
+    def stats(self) -> Dict[Tuple[str, str], int]:
+        """
+        Returns request counts keyed by (route, outcome), the outcome being "admitted" or
+        the reason a request was shed.
+        """
+        counts = {(route, "admitted"): count for route, count in self.admitted.items()}
+        counts.update(self.shed)
+        return counts
+
+
+admission = AdmissionController(
+    route_rates={
+        **ROUTE_RATES,
+        **parse_route_rates(os.environ.get("ADMISSION_ROUTE_RATES", "")),
+    }
+)
+
+
+def _match_route(scope: Scope) -> Tuple[str, Dict[str, Any]]:
+    for route in scope["app"].routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched"), child_scope.get("path_params", {})
+    return "unmatched", {}
+
+
+async def _reject(send: Send, status: int, error: str, retry_after: float) -> None:
+    body = orjson.dumps({"error": error})
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the admission controller to every request, except health
+    probes and metrics scrapes. Rejected requests are answered here, before any work is
+    done for them.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController = admission) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        route, path_params = _match_route(scope)
+        client = scope["client"][0] if scope.get("client") else "unknown"
+        wait = self.controller.check_rates(route, client)
+        if wait is not None:
+            await _reject(send, 429, "Rate limit exceeded, retry later.", wait)
+            return
+        limit: Optional[ConcurrencyLimit] = None
+        upstream_of = ROUTE_UPSTREAMS.get(route)
+        upstream = upstream_of(path_params) if upstream_of else None
+        if upstream is not None:
+            try:
+                limit = await self.controller.acquire(route, upstream)
+            except OverloadedError as e:
+                await _reject(send, 503, str(e), e.retry_after)
+                return
+        self.controller.record_admitted(route)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if limit is not None:
+                limit.release()
+
+
+def upstream_concurrency_stats() -> List[Tuple[str, int, int]]:
+    """
+    Returns (upstream, requests in flight, requests waiting) for every upstream seen.
+    """
+    return [
+        (name, limit.active, limit.waiting)
+        for name, limit in admission.upstreams.items()
+    ]
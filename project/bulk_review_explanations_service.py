@@ -0,0 +1,71 @@
+from typing import List, Optional
+
+import prisma
+import prisma.enums
+from pydantic import BaseModel
+
+from project.get_comic_explanation_service import invalidate_explanation
+
+MAX_BULK_REVIEW_SIZE = 1000
+
+
+class BulkReviewRequest(BaseModel):
+    """
+    A moderator's decision applied to many explanations at once.
+    """
+
+    explanationIds: List[str]
+    approvalStatus: bool
+    reviewComment: Optional[str] = None
+
+
+class BulkReviewResponse(BaseModel):
+    """
+    Reports how many explanations were reviewed and which ids did not exist.
+    """
+
+    updated: int
+    notFound: List[str]
+    status: str
+
+
+async def bulk_review_explanations(
+    explanationIds: List[str], approvalStatus: bool, reviewComment: Optional[str] = None
+) -> BulkReviewResponse:
+    """
+    Endpoint for moderators to approve or reject many explanations in one transaction.
+
+    Args:
+        explanationIds (List[str]): The explanations to review, at most MAX_BULK_REVIEW_SIZE.
+        approvalStatus (bool): True to approve every explanation, False to reject them.
+        reviewComment (Optional[str]): Comment stored on every reviewed explanation.
+
+    Returns:
+        BulkReviewResponse: The number of reviewed explanations and the unknown ids.
+    """
+    if len(explanationIds) > MAX_BULK_REVIEW_SIZE:
+        raise ValueError(
+            f"At most {MAX_BULK_REVIEW_SIZE} explanations can be reviewed at once."
+        )
+    ids = list(dict.fromkeys(explanationIds))
+    status = (
+        prisma.enums.ExplanationStatus.APPROVED
+        if approvalStatus
+        else prisma.enums.ExplanationStatus.REJECTED
+    )
+    async with prisma.get_client().tx() as transaction:
+        explanations = await transaction.explanation.find_many(
+            where={"id": {"in": ids}}
+        )
+        updated = await transaction.explanation.update_many(
+            where={"id": {"in": ids}},
+            data={"status": status, "reviewComment": reviewComment},
+        )
+    for comic_id in {explanation.comicId for explanation in explanations}:
+        invalidate_explanation(comic_id)
+    found = {explanation.id for explanation in explanations}
+    return BulkReviewResponse(
+        updated=updated,
+        notFound=[explanation_id for explanation_id in ids if explanation_id not in found],
+        status=status.value,
+    )
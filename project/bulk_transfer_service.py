@@ -0,0 +1,369 @@
+import os
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import Enum
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+
+import orjson
+import prisma
+import prisma.enums
+import prisma.errors
+import prisma.models
+from pydantic import BaseModel, Field
+
+from project.comic_catalog import comic_catalog
+from project.get_comic_explanation_service import invalidate_explanation
+from project.search_index import search_index
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "5000"))
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "2000"))
+# A longer line is rejected rather than buffered.
+MAX_LINE_BYTES = 1024 * 1024
+# Bytes inflated at a time from a gzipped import, so a small body cannot expand all at once.
+INFLATE_CHUNK_BYTES = 256 * 1024
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ComicRecord(BaseModel):
+    """
+    One Comic row as exported and imported.
+    """
+
+    id: str
+    title: str
+    imageUrl: str
+    number: int
+    altText: str = ""
+    publishedAt: Optional[datetime] = None
+    createdAt: datetime = Field(default_factory=_now)
+    updatedAt: datetime = Field(default_factory=_now)
+
+
+class ExplanationRecord(BaseModel):
+    """
+    One Explanation row as exported and imported.
+    """
+
+    id: str
+    text: str
+    comicId: str
+    generatedBy: str
+    # Required: an import keeps the moderation state rows had when exported, which
+    # always includes it, rather than approving or holding back text on its own.
+    status: prisma.enums.ExplanationStatus
+    reviewComment: Optional[str] = None
+    createdAt: datetime = Field(default_factory=_now)
+    updatedAt: datetime = Field(default_factory=_now)
+
+
+class ComicViewRecord(BaseModel):
+    """
+    One ComicView row as exported and imported.
+    """
+
+    id: str
+    comicId: str
+    userId: str
+    viewDate: datetime = Field(default_factory=_now)
+
+
+class ImportResponse(BaseModel):
+    """
+    Reports how many rows of an NDJSON import were read and written.
+    """
+
+    model: str
+    received: int
+    upserted: int
+    batches: int
+
+
+async def _comics_imported(records: List[ComicRecord]) -> None:
+    comics = await prisma.models.Comic.prisma().find_many(
+        where={"id": {"in": [record.id for record in records]}}
+    )
+    for comic in comics:
+        comic_catalog.add(comic)
+        search_index.add_comic(comic)
+
+
+async def _explanations_imported(records: List[ExplanationRecord]) -> None:
+    for comic_id in {record.comicId for record in records}:
+        invalidate_explanation(comic_id)
+
+
+@dataclass(frozen=True)
+class BulkModel:
+    """
+    How a table is exported and imported: its record model, the Postgres type of each
+    column, what to refresh in memory after rows were imported and whether imported rows
+    update the rows already stored.
+    """
+
+    table: str
+    record: Type[BaseModel]
+    columns: Dict[str, str]
+    actions: Callable[[], Any]
+    imported: Optional[Callable[[List[Any]], Awaitable[None]]] = None
+    update_existing: bool = True
+
+
+BULK_MODELS: Dict[str, BulkModel] = {
+    "comics": BulkModel(
+        "Comic",
+        ComicRecord,
+        {
+            "id": "text",
+            "title": "text",
+            "imageUrl": "text",
+            "number": "integer",
+            "altText": "text",
+            "publishedAt": "timestamp(3)",
+            "createdAt": "timestamp(3)",
+            "updatedAt": "timestamp(3)",
+        },
+        lambda: prisma.models.Comic.prisma(),
+        _comics_imported,
+        # Published comics are served as immutable, so an import only adds missing ones.
+        update_existing=False,
+    ),
+    "explanations": BulkModel(
+        "Explanation",
+        ExplanationRecord,
+        {
+            "id": "text",
+            "text": "text",
+            "comicId": "text",
+            "generatedBy": "text",
+            "status": '"ExplanationStatus"',
+            "reviewComment": "text",
+            "createdAt": "timestamp(3)",
+            "updatedAt": "timestamp(3)",
+        },
+        lambda: prisma.models.Explanation.prisma(),
+        _explanations_imported,
+    ),
+    # Imported views are not counted into popularity or the co-view model until the next
+    # rollup backfill or restart.
+    "views": BulkModel(
+        "ComicView",
+        ComicViewRecord,
+        {"id": "text", "comicId": "text", "userId": "text", "viewDate": "timestamp(3)"},
+        lambda: prisma.models.ComicView.prisma(),
+    ),
+}
+
+
+def get_bulk_model(model: str) -> BulkModel:
+    spec = BULK_MODELS.get(model)
+    if spec is None:
+        raise ValueError(f"Model must be one of {', '.join(BULK_MODELS)}.")
+    return spec
+
+
+def upsert_sql(spec: BulkModel) -> str:
+    """
+    Builds the statement upserting a batch of rows passed as one JSON array, so a batch
+    is a single round trip and a single short transaction. For a model that does not
+    update existing rows, rows conflicting with a stored one on any unique column are
+    skipped.
+    """
+    columns = ", ".join(f'"{column}"' for column in spec.columns)
+    types = ", ".join(f'"{column}" {type_}' for column, type_ in spec.columns.items())
+    if spec.update_existing:
+        updates = ", ".join(
+            f'"{column}" = EXCLUDED."{column}"'
+            for column in spec.columns
+            if column != "id"
+        )
+        conflict = f'ON CONFLICT ("id") DO UPDATE SET {updates}'
+    else:
+        conflict = "ON CONFLICT DO NOTHING"
+    return (
+        f'INSERT INTO "{spec.table}" ({columns}) SELECT {columns} '
+        f"FROM jsonb_to_recordset($1::jsonb) AS r({types}) {conflict}"
+    )
+
+
+async def export_records(
+    model: str, after: Optional[str] = None, batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Endpoint for exporting every row of a table as newline-delimited JSON.
+
+    Rows are read in id order, one page at a time, each page starting after the last id
+    of the previous one. Memory use does not depend on the table size and no transaction
+    is held open between pages.
+
+    Args:
+        model (str): One of "comics", "explanations" or "views".
+        after (Optional[str]): Only export rows with a greater id, to resume an export.
+        batch_size (int): Rows read per query.
+
+    Returns:
+        AsyncIterator[bytes]: The NDJSON body, one page of rows per chunk.
+    """
+    spec = get_bulk_model(model)
+    fields = tuple(spec.columns)
+
+    async def pages() -> AsyncIterator[bytes]:
+        cursor = after
+        while True:
+            rows = await spec.actions().find_many(
+                where={"id": {"gt": cursor}} if cursor is not None else {},
+                order={"id": "asc"},
+                take=batch_size,
+            )
+            if not rows:
+                return
+            yield b"".join(
+                orjson.dumps({field: getattr(row, field) for field in fields}) + b"\n"
+                for row in rows
+            )
+            if len(rows) < batch_size:
+                return
+            cursor = rows[-1].id
+
+    return pages()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Compresses a streamed body with gzip as it is produced.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def _inflate(body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    inflater = zlib.decompressobj(31)
+    async for data in body:
+        while data:
+            try:
+                chunk = inflater.decompress(data, INFLATE_CHUNK_BYTES)
+            except zlib.error as e:
+                raise ValueError(f"Body is not valid gzip: {e}") from None
+            data = inflater.unconsumed_tail
+            if chunk:
+                yield chunk
+    tail = inflater.flush()
+    if tail:
+        yield tail
+
+
+async def _lines(body: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    number = 0
+    pending = b""
+    async for chunk in body:
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, line
+        if len(pending) > MAX_LINE_BYTES:
+            raise ValueError(f"Line {number + 1} is longer than {MAX_LINE_BYTES} bytes.")
+    if pending:
+        yield number + 1, pending
+
+
+def _column_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        # The columns are timestamps without time zone, holding UTC.
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+async def import_records(
+    model: str,
+    body: AsyncIterator[bytes],
+    gzipped: bool = False,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> ImportResponse:
+    """
+    Endpoint for importing rows of a table from newline-delimited JSON, in the format
+    written by the export.
+
+    The body is read as it arrives and written in batches of batch_size rows. Each batch
+    is one INSERT ... ON CONFLICT statement, so rows whose id exists are updated and
+    importing the same file twice is harmless. Comics already stored are left as they
+    are, as clients cache them as immutable. Batches are committed one by one: if a
+    batch fails, the batches before it stay imported.
+
+    Args:
+        model (str): One of "comics", "explanations" or "views".
+        body (AsyncIterator[bytes]): The NDJSON request body.
+        gzipped (bool): Whether the body is gzip compressed.
+        batch_size (int): Rows written per statement.
+
+    Returns:
+        ImportResponse: How many rows were read and written.
+
+    Raises:
+        ValueError: If a line is not a valid row, or the database rejects a batch.
+    """
+    spec = get_bulk_model(model)
+    sql = upsert_sql(spec)
+    client = prisma.get_client()
+    if gzipped:
+        body = _inflate(body)
+    received = upserted = batches = 0
+    # Keyed by id, as a statement cannot update the same row twice.
+    batch: Dict[str, BaseModel] = {}
+    last_line = 0
+
+    async def flush() -> None:
+        nonlocal upserted, batches
+        rows = [
+            {column: _column_value(getattr(record, column)) for column in spec.columns}
+            for record in batch.values()
+        ]
+        try:
+            upserted += await client.execute_raw(sql, orjson.dumps(rows).decode())
+        except prisma.errors.DataError as e:
+            raise ValueError(
+                f"Batch ending at line {last_line} was rejected, {upserted} rows were "
+                f"imported before it: {e}"
+            ) from None
+        batches += 1
+        if spec.imported is not None:
+            await spec.imported(list(batch.values()))
+        batch.clear()
+
+    async for last_line, line in _lines(body):
+        if not line.strip():
+            continue
+        try:
+            record = spec.record.parse_obj(orjson.loads(line))
+        except ValueError as e:
+            # Reported as bad input, whether the line is not JSON or not a valid row.
+            raise ValueError(f"Line {last_line}: {e}") from None
+        batch[record.id] = record
+        received += 1
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return ImportResponse(
+        model=model, received=received, upserted=upserted, batches=batches
+    )
@@ -0,0 +1,388 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from project.shared_cache import Codec, SharedCache, get_shared_cache
+
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[V]):
+    """
+    Coalesces concurrent loads of the same key so only one of them runs.
+
+    The load runs in its own task, so a cancelled caller does not cancel the load for the
+    other callers waiting on it.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, "asyncio.Task[V]"] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(
+        self, key: Hashable, loader: Callable[[], Awaitable[V]]
+    ) -> Tuple[V, bool]:
+        """
+        Runs the loader for a key, or joins the load already running for it.
+
+        Args:
+            key (Hashable): Identifies the load.
+            loader (Callable[[], Awaitable[V]]): Produces the value when no load is in flight.
+
+        Returns:
+            Tuple[V, bool]: The loaded value and whether it was shared with an earlier caller.
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), shared
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+    refresh_errors: int = 0
+    shared_hits: int = 0
+    shared_misses: int = 0
+
+
+@dataclass
+class _Entry(Generic[V]):
+    value: V
+    fresh_until: float
+    stale_until: float
+    # Shared invalidation versions of the key and the cache when the value was read.
+    version: Optional[Tuple[int, ...]] = None
+
+
+class AsyncTTLCache(Generic[V]):
+    """
+    Bounded LRU cache with per-entry TTL, stale-while-revalidate and single-flight loading.
+
+    An entry is served as a hit until its TTL runs out. For stale_ttl seconds after that it
+    is still served, while one background load refreshes it. Misses for the same key are
+    coalesced into a single load.
+
+    With a shared codec, values are also published to the host-wide shared cache, which is
+    read on a local miss before loading. Worker processes then load each key once between
+    them instead of once each. With shared_invalidation, invalidating a key bumps its
+    version in the shared cache, and a local entry read at an older version is treated as
+    a miss, so every worker stops serving it within SHARED_CACHE_VERSION_TTL. Versions are
+    read from memory, so a hit does not wait for SQLite.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        ttl: float,
+        stale_ttl: float = 0.0,
+        shared: Optional[Codec] = None,
+        shared_invalidation: bool = False,
+    ) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.codec = shared
+        self.shared_invalidation = shared_invalidation and shared is not None
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[Hashable, _Entry[V]]" = OrderedDict()
+        self._flights: SingleFlight[V] = SingleFlight()
+        self._refreshes: Set["asyncio.Task[Any]"] = set()
+        # Bumped on invalidation so loads that started earlier don't store stale values.
+        self.generation = 0
+        # Shared-tier deletes not yet applied, per key and for clear(). Until they are, the
+        # shared tier may still return the invalidated value and is not read.
+        self._pending_deletes: Dict[Hashable, "Future[None]"] = {}
+        self._pending_clear: Optional["Future[None]"] = None
+        _caches[name] = self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _shared_cache(self) -> Optional[SharedCache]:
+        return get_shared_cache() if self.codec is not None else None
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"{self.name}:{key!r}"
+
+    def version(self, key: Hashable) -> Optional[Tuple[int, ...]]:
+        """
+        Returns how many times the key, and the whole cache, have been invalidated by any
+        worker, or None without shared invalidation.
+        """
+        if not self.shared_invalidation:
+            return None
+        shared = self._shared_cache()
+        if shared is None:
+            return None
+        return shared.versions(self._shared_key(key), f"{self.name}:")
+
+    def _current(self, key: Hashable, entry: "_Entry[V]") -> bool:
+        if entry.version is None:
+            return True
+        version = self.version(key)
+        return version is None or version == entry.version
+
+    def _store(self, key: Hashable, entry: "_Entry[V]") -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _invalidation_pending(self, key: Hashable) -> bool:
+        if self._pending_clear is not None:
+            if not self._pending_clear.done():
+                return True
+            self._pending_clear = None
+        pending = self._pending_deletes.get(key)
+        if pending is None:
+            return False
+        if not pending.done():
+            return True
+        del self._pending_deletes[key]
+        return False
+
+    def _get_shared(
+        self, key: Hashable, version: Optional[Tuple[int, ...]] = None
+    ) -> Optional[V]:
+        shared = self._shared_cache()
+        if shared is None:
+            return None
+        # Like set() after a load, a shared-tier fill must not bring back a value that was
+        # invalidated, which the shared tier holds until its queued delete is applied.
+        if self._invalidation_pending(key):
+            self.stats.shared_misses += 1
+            return None
+        # Read before the row, as an invalidation deletes the row before bumping the version.
+        if version is None:
+            version = self.version(key)
+        row = shared.get(self._shared_key(key))
+        try:
+            value = self.codec.decode(row[0]) if row is not None else None
+        except (TypeError, ValueError):
+            value = None
+        if value is None:
+            self.stats.shared_misses += 1
+            return None
+        self.stats.shared_hits += 1
+        # The shared tier keeps wall-clock times, this cache monotonic ones.
+        offset = time.monotonic() - time.time()
+        self._store(key, _Entry(value, row[1] + offset, row[2] + offset, version))
+        return value
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """
+        Returns the fresh value for a key without loading it, or None.
+        """
+        entry = self._entries.get(key)
+        if (
+            entry is None
+            or entry.fresh_until <= time.monotonic()
+            or not self._current(key, entry)
+        ):
+            return self._get_shared(key)
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def peek(self, key: Hashable) -> Optional[V]:
+        """
+        Returns the last value stored for a key even if it has expired, or None. Used to
+        serve something when the source of truth is unavailable.
+        """
+        entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+
+    def set(
+        self,
+        key: Hashable,
+        value: V,
+        ttl: Optional[float] = None,
+        stale_ttl: Optional[float] = None,
+        generation: Optional[int] = None,
+        version: Optional[Tuple[int, ...]] = None,
+    ) -> None:
+        """
+        Stores a value, evicting the least recently used entries beyond max_entries.
+
+        If generation is given and the cache has been invalidated since, the value was read
+        before that invalidation and is not stored. The same holds for an invalidation by
+        any worker when version, as returned by version() before the read, is given.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        current = self.version(key)
+        if version is not None and current is not None and version != current:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        now = time.monotonic()
+        self._store(key, _Entry(value, now + ttl, now + ttl + stale_ttl, current))
+        shared = self._shared_cache()
+        if shared is not None:
+            try:
+                data = self.codec.encode(value)
+            except TypeError:
+                return
+            wall_now = time.time()
+            shared.put(
+                self._shared_key(key), data, wall_now + ttl, wall_now + ttl + stale_ttl
+            )
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        self.generation += 1
+        shared = self._shared_cache()
+        if shared is not None:
+            pending = shared.delete(self._shared_key(key))
+            if self.shared_invalidation:
+                pending = shared.bump_version(self._shared_key(key)) or pending
+            self._pending_deletes = {
+                k: f for k, f in self._pending_deletes.items() if not f.done()
+            }
+            if pending is not None:
+                self._pending_deletes[key] = pending
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.generation += 1
+        shared = self._shared_cache()
+        if shared is not None:
+            self._pending_clear = shared.delete_prefix(f"{self.name}:")
+            if self.shared_invalidation:
+                self._pending_clear = (
+                    shared.bump_version(f"{self.name}:") or self._pending_clear
+                )
+            self._pending_deletes.clear()
+
+    async def _load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[V]],
+        ttl: Union[None, float, Callable[[V], float]],
+        stale_ttl: Optional[float],
+    ) -> V:
+        generation = self.generation
+        version = self.version(key)
+        # Another worker may already have loaded, or refreshed, this key.
+        value = self._get_shared(key, version)
+        if value is not None:
+            return value
+        value = await loader()
+        self.set(
+            key,
+            value,
+            ttl(value) if callable(ttl) else ttl,
+            stale_ttl,
+            generation,
+            version,
+        )
+        return value
+
+    def _refresh(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[V]],
+        ttl: Union[None, float, Callable[[V], float]],
+        stale_ttl: Optional[float],
+    ) -> None:
+        if key in self._flights:
+            return
+
+        async def refresh() -> None:
+            try:
+                await self._flights.do(
+                    key, lambda: self._load(key, loader, ttl, stale_ttl)
+                )
+            except Exception:
+                self.stats.refresh_errors += 1
+
+        task = asyncio.ensure_future(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[V]],
+        ttl: Union[None, float, Callable[[V], float]] = None,
+        stale_ttl: Optional[float] = None,
+    ) -> Tuple[V, bool]:
+        """
+        Returns the cached value for a key, loading it on a miss.
+
+        Args:
+            key (Hashable): The cache key.
+            loader (Callable[[], Awaitable[V]]): Fetches the value from the source of truth.
+            ttl (Union[None, float, Callable[[V], float]]): Freshness override for this key in
+                seconds, or a function computing it from the loaded value.
+            stale_ttl (Optional[float]): Stale-while-revalidate override for this key, in seconds.
+
+        Returns:
+            Tuple[V, bool]: The value and whether it was served from the cache.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and not self._current(key, entry):
+            # Invalidated by another worker.
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            now = time.monotonic()
+            if entry.fresh_until > now:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry.value, True
+            if entry.stale_until > now:
+                self._entries.move_to_end(key)
+                self.stats.stale_hits += 1
+                self._refresh(key, loader, ttl, stale_ttl)
+                return entry.value, True
+        self.stats.misses += 1
+        value, shared = await self._flights.do(
+            key, lambda: self._load(key, loader, ttl, stale_ttl)
+        )
+        if shared:
+            self.stats.coalesced += 1
+        return value, False
+
+
+_caches: Dict[str, AsyncTTLCache] = {}
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Returns the hit, miss and eviction counters of every cache, keyed by cache name.
+    """
+    return {
+        name: {**asdict(cache.stats), "entries": len(cache)}
+        for name, cache in _caches.items()
+    }
@@ -0,0 +1,92 @@
+import random
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import prisma.models
+
+
+class ComicCatalog:
+    """
+    In-memory mirror of the Comic table.
+
+    Comic numbers are kept in a compact int array so a random pick is O(1), and the rows
+    themselves are kept in a dict keyed by number so serving a pick needs no I/O.
+    """
+
+    def __init__(self) -> None:
+        self._numbers = array("i")
+        self._comics: Dict[int, prisma.models.Comic] = {}
+        self._by_id: Dict[str, prisma.models.Comic] = {}
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def __contains__(self, number: int) -> bool:
+        return number in self._comics
+
+    def __iter__(self) -> Iterator[prisma.models.Comic]:
+        return iter(self._comics.values())
+
+    def add(self, comic: prisma.models.Comic) -> None:
+        if comic.number not in self._comics:
+            self._numbers.append(comic.number)
+        self._comics[comic.number] = comic
+        self._by_id[comic.id] = comic
+
+    def add_many(self, comics: Iterable[prisma.models.Comic]) -> None:
+        for comic in comics:
+            self.add(comic)
+
+    def get(self, number: int) -> Optional[prisma.models.Comic]:
+        return self._comics.get(number)
+
+    def get_by_id(self, comic_id: str) -> Optional[prisma.models.Comic]:
+        return self._by_id.get(comic_id)
+
+    def random(self) -> Optional[prisma.models.Comic]:
+        """
+        Returns a uniformly random comic, or None while the catalog is empty.
+        """
+        if not self._numbers:
+            return None
+        return self._comics[self._numbers[random.randrange(len(self._numbers))]]
+
+    async def load(self, batch_size: int = 1000) -> int:
+        """
+        Loads every mirrored comic from the database.
+
+        Args:
+            batch_size (int): Number of rows fetched per query.
+
+        Returns:
+            int: The number of comics in the catalog after loading.
+        """
+        last_number = 0
+        while True:
+            comics = await prisma.models.Comic.prisma().find_many(
+                where={"number": {"gt": last_number}},
+                order={"number": "asc"},
+                take=batch_size,
+            )
+            self.add_many(comics)
+            if len(comics) < batch_size:
+                return len(self)
+            last_number = comics[-1].number
+
+    async def refresh(self) -> List[prisma.models.Comic]:
+        """
+        Loads the comics stored since the catalog was loaded, e.g. by the comic sync or an
+        import in another worker. Comics are only ever added, so the catalog is reloaded
+        only when the table holds more comics than it does.
+
+        Returns:
+            List[prisma.models.Comic]: The comics new to the catalog.
+        """
+        if await prisma.models.Comic.prisma().count() <= len(self):
+            return []
+        known = set(self._comics)
+        await self.load()
+        return [comic for number, comic in self._comics.items() if number not in known]
+
+
+comic_catalog = ComicCatalog()
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+import httpx
+import prisma.models
+
+from project.comic_catalog import comic_catalog
+from project.get_random_comic_service import comic_date, fetch_comic_data
+from project.host_lock import HostLock
+from project.latest_comic_number import latest_comic_number
+from project.search_index import search_index
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = "comics"
+SYNC_CONCURRENCY = int(os.environ.get("COMIC_SYNC_CONCURRENCY", "8"))
+SYNC_BATCH_SIZE = int(os.environ.get("COMIC_SYNC_BATCH_SIZE", "100"))
+SYNC_INTERVAL = float(os.environ.get("COMIC_SYNC_INTERVAL", "3600"))
+# How often workers that do not sync look for comics another worker stored.
+CATALOG_REFRESH_INTERVAL = float(
+    os.environ.get("COMIC_CATALOG_REFRESH_INTERVAL", "60")
+)
+
+
+async def _mirror_comic(number: int, semaphore: asyncio.Semaphore) -> None:
+    async with semaphore:
+        try:
+            comic_data = await fetch_comic_data(number)
+        except httpx.HTTPStatusError as e:
+            # xkcd has gaps, most famously comic 404.
+            if e.response.status_code == 404:
+                return
+            raise
+    fields = {
+        "title": comic_data["title"],
+        "imageUrl": comic_data["img"],
+        "altText": comic_data["alt"],
+        "publishedAt": comic_date(comic_data),
+    }
+    comic = await prisma.models.Comic.prisma().upsert(
+        where={"number": number},
+        data={"create": {"number": number, **fields}, "update": fields},
+    )
+    comic_catalog.add(comic)
+    search_index.add_comic(comic)
+
+
+async def _load_checkpoint() -> int:
+    checkpoint = await prisma.models.SyncCheckpoint.prisma().find_unique(
+        where={"name": CHECKPOINT_NAME}
+    )
+    return checkpoint.lastNumber if checkpoint else 0
+
+
+async def _save_checkpoint(last_number: int) -> None:
+    await prisma.models.SyncCheckpoint.prisma().upsert(
+        where={"name": CHECKPOINT_NAME},
+        data={
+            "create": {"name": CHECKPOINT_NAME, "lastNumber": last_number},
+            "update": {"lastNumber": last_number},
+        },
+    )
+
+
+async def sync_comics(
+    concurrency: int = SYNC_CONCURRENCY, batch_size: int = SYNC_BATCH_SIZE
+) -> int:
+    """
+    Mirrors comic metadata from xkcd into the Comic table, resuming from the last checkpoint.
+
+    Comics are fetched in batches with at most `concurrency` requests in flight. The
+    checkpoint only advances past a batch once every comic in it has been stored, so an
+    interrupted sync picks up at the first unfinished batch.
+
+    Args:
+        concurrency (int): Maximum number of concurrent requests to xkcd.
+        batch_size (int): Number of comics between checkpoints.
+
+    Returns:
+        int: The number of the last comic covered by the checkpoint.
+    """
+    last_number = await _load_checkpoint()
+    latest = await latest_comic_number.refresh()
+    semaphore = asyncio.Semaphore(concurrency)
+    while last_number < latest:
+        batch = range(last_number + 1, min(last_number + batch_size, latest) + 1)
+        results: List[Optional[BaseException]] = await asyncio.gather(
+            *(_mirror_comic(number, semaphore) for number in batch),
+            return_exceptions=True,
+        )
+        failed = [
+            number
+            for number, result in zip(batch, results)
+            if isinstance(result, BaseException)
+        ]
+        if failed:
+            logger.warning("Comic sync stopped, failed to mirror comics %s", failed)
+            if failed[0] > batch.start:
+                last_number = failed[0] - 1
+                await _save_checkpoint(last_number)
+            break
+        last_number = batch[-1]
+        await _save_checkpoint(last_number)
+    return last_number
+
+
+class ComicSyncJob:
+    """
+    Runs sync_comics periodically in the background.
+
+    With several worker processes on a host only the one holding the job lock syncs. The
+    others load the comics it stores into their catalog and search index every
+    refresh_interval, and try to take the lock over at every interval, in case its
+    holder has exited.
+    """
+
+    def __init__(
+        self,
+        interval: float = SYNC_INTERVAL,
+        lock: Optional[HostLock] = None,
+        refresh_interval: float = CATALOG_REFRESH_INTERVAL,
+    ) -> None:
+        self.interval = interval
+        self.refresh_interval = refresh_interval
+        self.lock = lock or HostLock()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def _follow(self) -> None:
+        deadline = time.monotonic() + self.interval
+        while True:
+            await asyncio.sleep(min(self.refresh_interval, self.interval))
+            try:
+                for comic in await comic_catalog.refresh():
+                    search_index.add_comic(comic)
+                    # An imported comic may come with explanations.
+                    search_index.explanation_changed(comic.id)
+            except Exception:
+                logger.warning("Comic catalog refresh failed", exc_info=True)
+            if time.monotonic() >= deadline:
+                return
+
+    async def _run(self) -> None:
+        while True:
+            if self.lock.acquire():
+                try:
+                    await sync_comics()
+                except Exception:
+                    logger.exception("Comic sync failed")
+                await asyncio.sleep(self.interval)
+            else:
+                await self._follow()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.lock.release()
+
+
+comic_sync_job = ComicSyncJob()
+
+
+async def main() -> None:
+    from prisma import Prisma
+
+    from project.http_client import close_http_clients
+
+    db_client = Prisma(auto_register=True)
+    await db_client.connect()
+    try:
+        print(f"Synced comics up to {await sync_comics()}")
+    finally:
+        await close_http_clients()
+        await db_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+import time
+from typing import Any, Dict, List, Optional, Type
+
+from prisma import Prisma
+from pydantic import BaseModel
+
+from project.metrics import db_query_duration, record_phase
+
+
+class InstrumentedPrisma(Prisma):
+    """
+    Prisma client that times every query. All model actions, transactions and raw queries
+    go through _execute, so this is the one place DB latency can be measured.
+    """
+
+    async def _execute(
+        self,
+        *,
+        method: str,
+        arguments: Dict[str, Any],
+        model: Optional[Type[BaseModel]] = None,
+        root_selection: Optional[List[str]] = None,
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            return await super()._execute(
+                method=method,
+                arguments=arguments,
+                model=model,
+                root_selection=root_selection,
+            )
+        finally:
+            elapsed = time.perf_counter() - start
+            db_query_duration.observe(
+                elapsed, model.__name__ if model is not None else "raw", method
+            )
+            record_phase("db", elapsed)
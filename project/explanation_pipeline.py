@@ -0,0 +1,535 @@
+import abc
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import nullcontext
+from typing import (
+    AsyncContextManager,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import orjson
+import prisma.models
+
+from project.admission import OverloadedError, admission
+from project.get_comic_explanation_service import invalidate_explanation
+from project.http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+EXPLANATION_BACKEND = os.environ.get("EXPLANATION_BACKEND", "vision")
+EXPLANATION_CONCURRENCY = int(os.environ.get("EXPLANATION_CONCURRENCY", "4"))
+EXPLANATION_RATE_LIMIT = float(os.environ.get("EXPLANATION_RATE_LIMIT", "1"))
+EXPLANATION_MAX_ATTEMPTS = int(os.environ.get("EXPLANATION_MAX_ATTEMPTS", "4"))
+# Generation slots queue workers leave to viewers, so a bulk run does not turn them away.
+EXPLANATION_VIEWER_SLOTS = int(os.environ.get("EXPLANATION_VIEWER_SLOTS", "1"))
+# Seconds a viewer waits for a free generation slot before being turned away.
+EXPLANATION_ATTACH_WAIT = float(os.environ.get("EXPLANATION_ATTACH_WAIT", "5"))
+EXPLANATION_MODEL = os.environ.get("EXPLANATION_MODEL", "gpt-4-vision-preview")
+EXPLANATION_MODEL_URL = os.environ.get(
+    "EXPLANATION_MODEL_URL", "https://api.openai.com/v1/chat/completions"
+)
+EXPLAINER_EMAIL = os.environ.get("EXPLAINER_EMAIL", "explainer@horser.local")
+
+PROMPT = (
+    "Explain this xkcd comic titled '{title}'. Describe what is drawn, the joke, and any "
+    "scientific or technical background needed to understand it. The comic's alt text "
+    "is: {alt}"
+)
+
+
+class ExplanationBackend(abc.ABC):
+    """
+    Produces the explanation text for a comic. Subclasses talk to a concrete model.
+    """
+
+    name = "backend"
+
+    @abc.abstractmethod
+    async def explain(self, comic: prisma.models.Comic) -> str:
+        """
+        Returns the whole explanation once the model has produced it.
+        """
+
+    @abc.abstractmethod
+    def stream(self, comic: prisma.models.Comic) -> AsyncIterator[str]:
+        """
+        Yields the explanation in pieces as the model produces them. Backends that cannot
+        stream yield the whole text at once.
+        """
+
+
+class VisionModelBackend(ExplanationBackend):
+    """
+    Asks the GPT-4-vision chat completions API to explain the comic image.
+    """
+
+    name = "vision"
+
+    def __init__(
+        self,
+        url: str = EXPLANATION_MODEL_URL,
+        model: str = EXPLANATION_MODEL,
+        api_key: Optional[str] = None,
+    ) -> None:
+        self.url = url
+        self.model = model
+        self.api_key = api_key or os.environ.get("VISION_API_KEY", "")
+
+    def _payload(self, comic: prisma.models.Comic) -> dict:
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": PROMPT.format(title=comic.title, alt=comic.altText),
+                        },
+                        {"type": "image_url", "image_url": {"url": comic.imageUrl}},
+                    ],
+                }
+            ],
+        }
+
+    async def explain(self, comic: prisma.models.Comic) -> str:
+        response = await get_http_client("GPT-4-vision").post(
+            self.url,
+            json=self._payload(comic),
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def stream(self, comic: prisma.models.Comic) -> AsyncIterator[str]:
+        async with get_http_client("GPT-4-vision").stream(
+            "POST",
+            self.url,
+            json={**self._payload(comic), "stream": True},
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        ) as response:
+            response.raise_for_status()
+            # Server-sent events, one completion chunk per "data:" line.
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                choices = orjson.loads(data).get("choices") or [{}]
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
+
+class StubExplanationBackend(ExplanationBackend):
+    """
+    Local stand-in for the model that builds an explanation from the comic's own metadata.
+    """
+
+    name = "stub"
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+
+    async def explain(self, comic: prisma.models.Comic) -> str:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return f"Comic #{comic.number}, '{comic.title}'. {comic.altText}".strip()
+
+    async def stream(self, comic: prisma.models.Comic) -> AsyncIterator[str]:
+        # Spread the delay over the words, like a model emitting tokens.
+        words = f"Comic #{comic.number}, '{comic.title}'. {comic.altText}".split()
+        for position, word in enumerate(words):
+            if self.delay:
+                await asyncio.sleep(self.delay / len(words))
+            yield word if position == 0 else f" {word}"
+
+
+def create_backend(name: str = EXPLANATION_BACKEND) -> ExplanationBackend:
+    """
+    Returns the explanation backend configured by name ('vision' or 'stub').
+    """
+    if name == "stub":
+        return StubExplanationBackend(float(os.environ.get("EXPLANATION_STUB_DELAY", "0")))
+    if name == "vision":
+        return VisionModelBackend()
+    raise ValueError(f"Explanation backend {name} is not supported.")
+
+
+class RateLimiter:
+    """
+    Spaces out calls so no more than `rate` start per second.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ExplanationStream:
+    """
+    The text of one explanation as it is being generated. Every viewer attached to it is
+    replayed the text so far and then follows it live, so any number of viewers share a
+    single model call. If set, on_abandoned is called when the last viewer stops
+    following before the text is complete.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.followers = 0
+        self.on_abandoned: Optional[Callable[[], None]] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[Exception] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """
+        Yields the text generated so far, then every new piece until generation ends.
+        Pieces produced while the viewer was busy are joined into one.
+
+        Raises:
+            Exception: The error generation failed with.
+        """
+        position = 0
+        self.followers += 1
+        try:
+            while True:
+                if position < len(self.chunks):
+                    chunk = "".join(self.chunks[position:])
+                    position = len(self.chunks)
+                    yield chunk
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.followers -= 1
+            if not self.followers and not self.done and self.on_abandoned is not None:
+                self.on_abandoned()
+
+
+class ExplanationPipeline:
+    """
+    Generates explanations off the request path.
+
+    Comics are queued by id and picked up by a fixed pool of workers. A comic that is
+    already queued or being generated is not queued again; callers share its result.
+    Model calls are rate limited and retried with exponential backoff, and the finished
+    text is stored as a new Explanation row.
+
+    Viewers can attach to a comic's generation and receive the text as the model streams
+    it. Attaching starts the generation right away instead of waiting for a worker. A
+    generation only viewers asked for is cancelled once they have all disconnected.
+
+    Workers and viewers share `concurrency` generation slots, so at most that many model
+    calls run at once, and as many wait for the rate limiter. There are viewer_slots
+    fewer workers than slots, at least one, so viewers get a slot even while the queue
+    is long. A viewer who cannot get a slot within attach_wait seconds is turned away.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[ExplanationBackend] = None,
+        concurrency: int = EXPLANATION_CONCURRENCY,
+        rate_limit: float = EXPLANATION_RATE_LIMIT,
+        max_attempts: int = EXPLANATION_MAX_ATTEMPTS,
+        retry_delay: float = 1.0,
+        attach_wait: float = EXPLANATION_ATTACH_WAIT,
+        viewer_slots: int = EXPLANATION_VIEWER_SLOTS,
+    ) -> None:
+        self.backend = backend
+        self.concurrency = concurrency
+        self.workers = max(1, concurrency - viewer_slots)
+        self.attach_wait = attach_wait
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.generated = 0
+        self.failed = 0
+        self.system_user_id: Optional[str] = None
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._jobs: Dict[str, "asyncio.Future[prisma.models.Explanation]"] = {}
+        self._streams: Dict[str, ExplanationStream] = {}
+        self._workers: List["asyncio.Task[None]"] = []
+        # Generations started by viewers rather than by a worker.
+        self._attached: Set["asyncio.Task[None]"] = set()
+        self._slots = asyncio.Semaphore(concurrency)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._jobs)
+
+    def is_pending(self, comic_id: str) -> bool:
+        return comic_id in self._jobs
+
+    def enqueue(self, comic_id: str) -> "asyncio.Future[prisma.models.Explanation]":
+        """
+        Queues a comic for explanation, or returns the job already pending for it.
+
+        Args:
+            comic_id (str): The id of the Comic row to explain.
+
+        Returns:
+            asyncio.Future[prisma.models.Explanation]: Resolves with the stored explanation.
+        """
+        job = self._jobs.get(comic_id)
+        if job is None:
+            job = self._new_job(comic_id)
+            self._queue.put_nowait(comic_id)
+        else:
+            stream = self._streams.get(comic_id)
+            if stream is not None:
+                # Now wanted by more than its viewers, so it runs to the end.
+                stream.on_abandoned = None
+        return job
+
+    def _new_job(self, comic_id: str) -> "asyncio.Future[prisma.models.Explanation]":
+        job = asyncio.get_running_loop().create_future()
+        # Nobody may await the job, so don't report unretrieved failures.
+        job.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._jobs[comic_id] = job
+        return job
+
+    async def attach(
+        self, comic_id: str
+    ) -> Tuple[ExplanationStream, "asyncio.Future[prisma.models.Explanation]"]:
+        """
+        Returns the live text of a comic's explanation and the job storing it. Starts the
+        generation now if it is not running yet, even if the comic is queued, once a
+        generation slot is free.
+
+        Args:
+            comic_id (str): The id of the Comic row to explain.
+
+        Returns:
+            Tuple[ExplanationStream, asyncio.Future[prisma.models.Explanation]]: The text
+            as it is generated, and a future resolving with the stored explanation.
+
+        Raises:
+            OverloadedError: If no generation slot freed up within attach_wait seconds.
+        """
+        stream = self._streams.get(comic_id)
+        if stream is not None:
+            return stream, self._jobs[comic_id]
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.attach_wait)
+        except asyncio.TimeoutError:
+            raise OverloadedError("GPT-4-vision", self.attach_wait) from None
+        stream = self._streams.get(comic_id)
+        if stream is not None:
+            # Started by another viewer or a worker while this one waited.
+            self._slots.release()
+            return stream, self._jobs[comic_id]
+        if self.backend is None:
+            self.backend = create_backend()
+        queued = comic_id in self._jobs
+        if not queued:
+            self._new_job(comic_id)
+        # Registered before the task runs, so a worker dequeuing the comic skips it.
+        stream = self._streams[comic_id] = ExplanationStream()
+        task = asyncio.create_task(self._run(comic_id, stream))
+        if not queued:
+            stream.on_abandoned = task.cancel
+        self._attached.add(task)
+
+        def done(task: "asyncio.Task[None]") -> None:
+            self._attached.discard(task)
+            self._slots.release()
+
+        task.add_done_callback(done)
+        return stream, self._jobs[comic_id]
+
+    async def enqueue_missing(self, batch_size: int = 500) -> int:
+        """
+        Queues every mirrored comic that has no explanation yet.
+
+        Returns:
+            int: The number of comics queued.
+        """
+        queued = 0
+        cursor: Optional[str] = None
+        while True:
+            comics = await prisma.models.Comic.prisma().find_many(
+                where={"Explanations": {"none": {}}},
+                order={"id": "asc"},
+                take=batch_size,
+                skip=1 if cursor else None,
+                cursor={"id": cursor} if cursor else None,
+            )
+            for comic in comics:
+                if not self.is_pending(comic.id):
+                    queued += 1
+                self.enqueue(comic.id)
+            if len(comics) < batch_size:
+                return queued
+            cursor = comics[-1].id
+
+    async def _ensure_system_user(self) -> str:
+        if self.system_user_id is None:
+            user = await prisma.models.User.prisma().upsert(
+                where={"email": EXPLAINER_EMAIL},
+                data={
+                    "create": {"email": EXPLAINER_EMAIL, "passwordHash": "!"},
+                    "update": {},
+                },
+            )
+            self.system_user_id = user.id
+        return self.system_user_id
+
+    def _upstream_slot(self) -> AsyncContextManager[None]:
+        # Model calls count against the same GPT-4-vision cap as proxied requests.
+        limit = admission.upstream_limit("GPT-4-vision")
+        return limit.slot() if limit is not None else nullcontext()
+
+    async def _explain_with_retry(
+        self, comic: prisma.models.Comic, stream: ExplanationStream
+    ) -> str:
+        for attempt in range(1, self.max_attempts + 1):
+            await self.rate_limiter.wait()
+            try:
+                async with self._upstream_slot():
+                    async for chunk in self.backend.stream(comic):
+                        stream.append(chunk)
+                return stream.text
+            except Exception:
+                # Text already sent to viewers cannot be taken back, so a stream that
+                # broke off is not retried.
+                if attempt == self.max_attempts or stream.chunks:
+                    raise
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.warning(
+                    "Explaining comic %s failed (attempt %s), retrying in %.1fs",
+                    comic.id,
+                    attempt,
+                    delay,
+                    exc_info=True,
+                )
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        raise RuntimeError("unreachable")
+
+    async def generate(
+        self, comic_id: str, stream: Optional[ExplanationStream] = None
+    ) -> prisma.models.Explanation:
+        """
+        Generates and stores an explanation for a comic, bypassing the queue.
+
+        Args:
+            comic_id (str): The id of the Comic row to explain.
+            stream (Optional[ExplanationStream]): Receives the text as it is generated. It
+                is finished once the explanation is stored.
+
+        Returns:
+            prisma.models.Explanation: The stored explanation.
+        """
+        if stream is None:
+            stream = ExplanationStream()
+        try:
+            comic = await prisma.models.Comic.prisma().find_unique(where={"id": comic_id})
+            if comic is None:
+                raise ValueError(f"Comic with ID {comic_id} not found.")
+            text = await self._explain_with_retry(comic, stream)
+            generated_by = await self._ensure_system_user()
+            explanation = await prisma.models.Explanation.prisma().create(
+                data={"text": text, "comicId": comic_id, "generatedBy": generated_by}
+            )
+        except asyncio.CancelledError:
+            stream.finish(RuntimeError("Explanation generation was cancelled."))
+            raise
+        except Exception as e:
+            stream.finish(e)
+            raise
+        invalidate_explanation(comic_id)
+        stream.finish()
+        return explanation
+
+    async def _run(self, comic_id: str, stream: ExplanationStream) -> None:
+        job = self._jobs[comic_id]
+        try:
+            explanation = await self.generate(comic_id, stream)
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.exception("Giving up on explaining comic %s", comic_id)
+            job.set_exception(e)
+        else:
+            self.generated += 1
+            job.set_result(explanation)
+        finally:
+            self._jobs.pop(comic_id, None)
+            self._streams.pop(comic_id, None)
+
+    async def _work(self) -> None:
+        while True:
+            comic_id = await self._queue.get()
+            try:
+                async with self._slots:
+                    # A viewer may have started the comic already.
+                    if comic_id in self._jobs and comic_id not in self._streams:
+                        stream = self._streams[comic_id] = ExplanationStream()
+                        await self._run(comic_id, stream)
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        if self.backend is None:
+            self.backend = create_backend()
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._work()) for _ in range(self.workers)
+            ]
+
+    async def stop(self) -> None:
+        tasks = [*self._workers, *self._attached]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+
+
+explanation_pipeline = ExplanationPipeline()
@@ -1,8 +1,53 @@
-from typing import Dict
+import os
+from typing import Dict, Tuple
 
-import httpx
 from pydantic import BaseModel
 
+from project.cache import AsyncTTLCache
+from project.http_client import get_http_client
+from project.resilience import CircuitOpenError, resilient_upstream
+from project.shared_cache import Codec
+
+SERVICES = ("xkcd", "GPT-4-vision")
+
+# The latest-comic document changes a few times a week, numbered comics never change.
+LATEST_COMIC_TTL = (600.0, 3600.0)
+COMIC_TTL = (30 * 24 * 3600.0, 0.0)
+MODEL_TTL = (24 * 3600.0, 0.0)
+
+external_data_cache: AsyncTTLCache[Dict] = AsyncTTLCache(
+    "external_api",
+    max_entries=int(os.environ.get("EXTERNAL_CACHE_MAX_ENTRIES", "4096")),
+    ttl=MODEL_TTL[0],
+    shared=Codec(),
+)
+
+
+def cache_ttl(serviceName: str, action: str) -> Tuple[float, float]:
+    """
+    Returns the (ttl, stale_ttl) pair in seconds for a service action.
+    """
+    if serviceName != "xkcd":
+        return MODEL_TTL
+    if action.strip("/") == "info.0.json":
+        return LATEST_COMIC_TTL
+    return COMIC_TTL
+
+
+async def _fetch(serviceName: str, action: str) -> Dict:
+    client = get_http_client(serviceName)
+
+    async def fetch() -> Dict:
+        if serviceName == "xkcd":
+            response = await client.get(f"/{action}")
+        else:
+            headers = {"Authorization": "Bearer YOUR_API_KEY"}
+            response = await client.post("", params={"prompt": action}, headers=headers)
+        response.raise_for_status()
+        return response.json()
+
+    return await resilient_upstream(serviceName).call(fetch)
+
 
 class FetchExternalAPIDataResponse(BaseModel):
     """
@@ -32,26 +77,20 @@ async def fetch_external_api_data(
         await fetch_external_api_data('xkcd', '614/info.0.json')
         > FetchExternalAPIDataResponse(data={'month': '...', 'num': 614, ...}, service='xkcd', action='614/info.0.json', cached=False)
     """
-    base_urls = {
-        "xkcd": "https://xkcd.com",
-        "GPT-4-vision": "https://api.openai.com/v4/images",
-    }
-    if serviceName not in base_urls:
+    if serviceName not in SERVICES:
         raise ValueError(f"Service {serviceName} is not supported.")
-    url = (
-        f"{base_urls[serviceName]}/{action}"
-        if serviceName == "xkcd"
-        else f"{base_urls[serviceName]}?prompt={action}"
-    )
-    async with httpx.AsyncClient() as client:
-        if serviceName == "xkcd":
-            response = await client.get(url)
-        else:
-            headers = {"Authorization": "Bearer YOUR_API_KEY"}
-            response = await client.post(url, headers=headers)
-        response.raise_for_status()
-        fetched_data = response.json()
-    cached = False
+    key = (serviceName, action)
+    ttl, stale_ttl = cache_ttl(serviceName, action)
+    try:
+        fetched_data, cached = await external_data_cache.get_or_load(
+            key, lambda: _fetch(serviceName, action), ttl=ttl, stale_ttl=stale_ttl
+        )
+    except CircuitOpenError:
+        # Serve the last known value, however old, while the upstream is failing.
+        fetched_data = external_data_cache.peek(key)
+        if fetched_data is None:
+            raise
+        cached = True
     return FetchExternalAPIDataResponse(
         data=fetched_data, service=serviceName, action=action, cached=cached
     )
@@ -1,8 +1,11 @@
 import prisma
+import prisma.enums
 import prisma.models
 from fastapi import HTTPException
 from pydantic import BaseModel
 
+from project.get_comic_explanation_service import invalidate_explanation
+
 
 class FlagExplanationForReviewResponse(BaseModel):
     """
@@ -19,9 +22,8 @@ async def flag_explanation_for_review(
     """
     Submit an explanation for manual review.
 
-    This asynchronous function marks the given explanation as flagged for manual review within the database.
-    It checks if the explanation exists and updates a specific "flagged for review" attribute (assuming such attribute
-    exists in a more comprehensive system). If the explanation does not exist, it raises an HTTP exception.
+    The explanation's status is set to PENDING, which puts it in the moderation queue and
+    stops it from being served as its comic's current explanation until it is approved.
 
     Args:
         explanationId (str): The unique identifier of the explanation to be flagged for manual review.
@@ -36,14 +38,15 @@ async def flag_explanation_for_review(
         response = await flag_explanation_for_review("some-unique-explanation-id")
         > {"message": "Explanation has been flagged for review.", "success": True}
     """
-    explanation = await prisma.models.Explanation.prisma().find_unique(
-        where={"id": explanationId}
+    explanation = await prisma.models.Explanation.prisma().update(
+        where={"id": explanationId},
+        data={"status": prisma.enums.ExplanationStatus.PENDING},
     )
-    if explanation:
-        return FlagExplanationForReviewResponse(
-            message="Explanation has been flagged for review.", success=True
-        )
-    else:
+    if explanation is None:
         raise HTTPException(
             status_code=404, detail=f"Explanation with ID {explanationId} not found."
         )
+    invalidate_explanation(explanation.comicId)
+    return FlagExplanationForReviewResponse(
+        message="Explanation has been flagged for review.", success=True
+    )
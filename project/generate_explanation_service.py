@@ -0,0 +1,73 @@
+import prisma
+import prisma.models
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from project.explanation_pipeline import explanation_pipeline
+
+
+class GenerateExplanationResponse(BaseModel):
+    """
+    Acknowledges that an explanation for the comic is being generated in the background.
+    """
+
+    comicId: str
+    queued: bool
+    message: str
+
+
+class GenerateAllExplanationsResponse(BaseModel):
+    """
+    Reports how many comics were queued for explanation by a bulk generation request.
+    """
+
+    queued: int
+    queueDepth: int
+
+
+async def generate_explanation(comicId: str) -> GenerateExplanationResponse:
+    """
+    Queue a comic for explanation by the vision model.
+
+    Generation happens in the background pipeline. If the comic is already queued or being
+    explained, no new job is created.
+
+    Args:
+        comicId (str): The unique identifier of the comic to explain.
+
+    Returns:
+        GenerateExplanationResponse: Acknowledges that an explanation for the comic is being generated in the background.
+
+    Raises:
+        HTTPException: If the comic with the given id does not exist.
+    """
+    if explanation_pipeline.is_pending(comicId):
+        # Keeps a generation started for viewers going even if they disconnect.
+        explanation_pipeline.enqueue(comicId)
+        return GenerateExplanationResponse(
+            comicId=comicId,
+            queued=False,
+            message="Explanation is already being generated.",
+        )
+    comic = await prisma.models.Comic.prisma().find_unique(where={"id": comicId})
+    if comic is None:
+        raise HTTPException(
+            status_code=404, detail=f"Comic with ID {comicId} not found."
+        )
+    explanation_pipeline.enqueue(comicId)
+    return GenerateExplanationResponse(
+        comicId=comicId, queued=True, message="Explanation generation queued."
+    )
+
+
+async def generate_all_explanations() -> GenerateAllExplanationsResponse:
+    """
+    Queue every comic in the catalog that does not have an explanation yet.
+
+    Returns:
+        GenerateAllExplanationsResponse: Reports how many comics were queued for explanation by a bulk generation request.
+    """
+    queued = await explanation_pipeline.enqueue_missing()
+    return GenerateAllExplanationsResponse(
+        queued=queued, queueDepth=explanation_pipeline.queue_depth
+    )
@@ -0,0 +1,104 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import httpx
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+from project.comic_catalog import comic_catalog
+from project.get_random_comic_service import (
+    RandomComicResponse,
+    comic_response_from_data,
+    comic_response_from_record,
+    fetch_comic_data,
+)
+from project.resilience import CircuitOpenError
+
+MAX_BATCH_SIZE = 100
+UPSTREAM_CONCURRENCY = 8
+
+
+class ComicBatchRequest(BaseModel):
+    """
+    Request model listing the comic numbers to fetch in one call.
+    """
+
+    numbers: List[int]
+
+
+class ComicBatchItem(BaseModel):
+    """
+    The result for one requested comic number: either the comic or an error message.
+    """
+
+    num: int
+    comic: Optional[RandomComicResponse] = None
+    error: Optional[str] = None
+
+
+class ComicBatchResponse(BaseModel):
+    """
+    Response model containing one item per requested comic number, in request order.
+    """
+
+    items: List[ComicBatchItem]
+
+
+async def _fetch_upstream(number: int, semaphore: asyncio.Semaphore) -> ComicBatchItem:
+    async with semaphore:
+        try:
+            comic_data = await fetch_comic_data(number)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                return ComicBatchItem(num=number, error=f"Comic {number} not found.")
+            return ComicBatchItem(num=number, error=str(e))
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            return ComicBatchItem(num=number, error=str(e))
+    return ComicBatchItem(num=number, comic=comic_response_from_data(comic_data))
+
+
+async def get_comic_batch(numbers: List[int]) -> ComicBatchResponse:
+    """
+    Endpoint for fetching several comics by number in one round trip.
+
+    Comics are served from the in-memory catalog when possible, the rest are looked up
+    with a single IN query, and comics missing from the mirror are fetched from xkcd with
+    bounded concurrency.
+
+    Args:
+        numbers (List[int]): The comic numbers to fetch, at most MAX_BATCH_SIZE.
+
+    Returns:
+        ComicBatchResponse: Response model containing one item per requested comic number, in request order.
+    """
+    if len(numbers) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} comics can be requested at once.")
+    items: Dict[int, ComicBatchItem] = {}
+    missing = []
+    for number in dict.fromkeys(numbers):
+        comic = comic_catalog.get(number)
+        if comic is not None:
+            items[number] = ComicBatchItem(
+                num=number, comic=comic_response_from_record(comic)
+            )
+        else:
+            missing.append(number)
+    if missing:
+        comics = await prisma.models.Comic.prisma().find_many(
+            where={"number": {"in": missing}}
+        )
+        for comic in comics:
+            items[comic.number] = ComicBatchItem(
+                num=comic.number, comic=comic_response_from_record(comic)
+            )
+        semaphore = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+        fetched = await asyncio.gather(
+            *(
+                _fetch_upstream(number, semaphore)
+                for number in missing
+                if number not in items
+            )
+        )
+        items.update((item.num, item) for item in fetched)
+    return ComicBatchResponse(items=[items[number] for number in numbers])
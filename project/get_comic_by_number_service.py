@@ -0,0 +1,44 @@
+import httpx
+import prisma
+import prisma.models
+from fastapi import HTTPException
+
+from project.comic_catalog import comic_catalog
+from project.get_random_comic_service import (
+    RandomComicResponse,
+    comic_response_from_data,
+    comic_response_from_record,
+    fetch_comic_data,
+)
+
+
+async def get_comic_by_number(number: int) -> RandomComicResponse:
+    """
+    Endpoint for fetching a specific comic by its number.
+
+    The comic is served from the in-memory catalog when mirrored, then from the database,
+    and only fetched from xkcd if neither has it.
+
+    Args:
+        number (int): The comic number.
+
+    Returns:
+        RandomComicResponse: Response model containing the information of the requested xkcd comic.
+
+    Raises:
+        HTTPException: If xkcd has no comic with the given number.
+    """
+    comic = comic_catalog.get(number)
+    if comic is None:
+        comic = await prisma.models.Comic.prisma().find_unique(where={"number": number})
+    if comic is not None:
+        return comic_response_from_record(comic)
+    try:
+        comic_data = await fetch_comic_data(number)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(
+                status_code=404, detail=f"Comic {number} not found."
+            ) from e
+        raise
+    return comic_response_from_data(comic_data)
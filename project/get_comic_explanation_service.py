@@ -1,7 +1,14 @@
+import os
+
 import prisma
+import prisma.enums
 import prisma.models
 from pydantic import BaseModel
 
+from project.cache import AsyncTTLCache
+from project.search_index import search_index
+from project.shared_cache import Codec
+
 
 class GetComicExplanationResponseModel(BaseModel):
     """
@@ -14,30 +21,91 @@ class GetComicExplanationResponseModel(BaseModel):
     createdAt: str
 
 
+# Entries are invalidated explicitly when an explanation is generated or reviewed, in
+# every worker through the shared cache. The TTLs only bound how long a change made
+# outside the service, or while the shared cache is unavailable, can go unnoticed.
+EXPLANATION_CACHE_TTL = float(os.environ.get("EXPLANATION_CACHE_TTL", "3600"))
+MISSING_EXPLANATION_CACHE_TTL = 30.0
+
+explanation_cache: AsyncTTLCache[GetComicExplanationResponseModel] = AsyncTTLCache(
+    "explanations",
+    max_entries=int(os.environ.get("EXPLANATION_CACHE_MAX_ENTRIES", "10000")),
+    ttl=EXPLANATION_CACHE_TTL,
+    shared=Codec(GetComicExplanationResponseModel),
+    shared_invalidation=True,
+)
+
+
+def invalidate_explanation(comicId: str) -> None:
+    """
+    Drops the cached explanation of a comic after one of its explanations changed, and
+    re-indexes it for search.
+    """
+    explanation_cache.invalidate(comicId)
+    search_index.explanation_changed(comicId)
+
+
+async def find_current_explanation(
+    comicId: str,
+) -> prisma.models.Explanation | None:
+    """
+    Returns the newest approved explanation of a comic, served by the
+    (comicId, status, createdAt) index.
+    """
+    return await prisma.models.Explanation.prisma().find_first(
+        where={"comicId": comicId, "status": prisma.enums.ExplanationStatus.APPROVED},
+        order={"createdAt": "desc"},
+    )
+
+
+def explanation_response(
+    explanation_record: prisma.models.Explanation,
+) -> GetComicExplanationResponseModel:
+    return GetComicExplanationResponseModel(
+        comicId=explanation_record.comicId,
+        explanation=explanation_record.text,
+        generatedBy=explanation_record.generatedBy,
+        createdAt=explanation_record.createdAt.isoformat(),
+    )
+
+
+def placeholder_explanation(comicId: str) -> GetComicExplanationResponseModel:
+    return GetComicExplanationResponseModel(
+        comicId=comicId,
+        explanation="Explanation not available.",
+        generatedBy="Placeholder",
+        createdAt="N/A",
+    )
+
+
+async def _load_explanation(comicId: str) -> GetComicExplanationResponseModel:
+    explanation_record = await find_current_explanation(comicId)
+    if explanation_record:
+        return explanation_response(explanation_record)
+    else:
+        return placeholder_explanation(comicId)
+
+
+def cache_ttl(response: GetComicExplanationResponseModel) -> float:
+    if response.generatedBy == "Placeholder":
+        return MISSING_EXPLANATION_CACHE_TTL
+    return EXPLANATION_CACHE_TTL
+
+
 async def get_comic_explanation(comicId: str) -> GetComicExplanationResponseModel:
     """
     Endpoint to retrieve a generated explanation for a specific comic.
 
+    Reads go through an in-process cache, a miss costs one indexed query for the comic's
+    newest approved explanation.
+
     Args:
     comicId (str): The unique identifier of the comic for which an explanation is being requested. This corresponds to the comic's ID in the database.
 
     Returns:
     GetComicExplanationResponseModel: Model representing the response for a request to fetch an explanation, containing the explanation text along with additional relevant information.
     """
-    explanation_record = await prisma.models.Explanation.prisma().find_unique(
-        where={"comicId": comicId}, include={"Comic": True}
+    response, _ = await explanation_cache.get_or_load(
+        comicId, lambda: _load_explanation(comicId), ttl=cache_ttl
     )
-    if explanation_record:
-        return GetComicExplanationResponseModel(
-            comicId=explanation_record.comicId,
-            explanation=explanation_record.text,
-            generatedBy=explanation_record.generatedBy,
-            createdAt=explanation_record.createdAt.isoformat(),
-        )
-    else:
-        return GetComicExplanationResponseModel(
-            comicId=comicId,
-            explanation="Explanation not available.",
-            generatedBy="Placeholder",
-            createdAt="N/A",
-        )
+    return response
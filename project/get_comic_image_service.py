@@ -0,0 +1,75 @@
+from typing import Optional
+from urllib.parse import urlsplit
+
+import prisma
+import prisma.models
+from fastapi import HTTPException
+from starlette.responses import Response
+
+from project.comic_catalog import comic_catalog
+from project.get_random_comic_service import fetch_comic_data
+from project.http_caching import IMMUTABLE_CACHE_CONTROL, etag_matches
+from project.image_cache import FileRangeResponse, image_cache, parse_range
+
+
+async def _image_url(number: int) -> str:
+    comic = comic_catalog.get(number)
+    if comic is None:
+        comic = await prisma.models.Comic.prisma().find_unique(where={"number": number})
+    if comic is not None:
+        return comic.imageUrl
+    comic_data = await fetch_comic_data(number)
+    return comic_data["img"]
+
+
+async def get_comic_image(
+    number: int, range_header: Optional[str] = None, if_none_match: Optional[str] = None
+) -> Response:
+    """
+    Endpoint for serving a comic's image from the local image cache.
+
+    The image is downloaded from imgs.xkcd.com once and then served from disk, with
+    support for conditional requests and single byte ranges.
+
+    Args:
+        number (int): The comic number.
+        range_header (Optional[str]): The request's Range header, e.g. 'bytes=0-1023'.
+        if_none_match (Optional[str]): The request's If-None-Match header.
+
+    Returns:
+        Response: The image bytes (200 or 206), or 304 if the client's copy is current.
+    """
+    image_url = await _image_url(number)
+    # Opened before the response starts, so an eviction cannot remove it mid-response.
+    image, file = await image_cache.open(urlsplit(image_url).path)
+    headers = {
+        "etag": image.etag,
+        "cache-control": IMMUTABLE_CACHE_CONTROL,
+        "accept-ranges": "bytes",
+    }
+    if etag_matches(if_none_match, image.etag):
+        file.close()
+        return Response(status_code=304, headers=headers)
+    try:
+        byte_range = parse_range(range_header, image.size)
+    except ValueError:
+        file.close()
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable.",
+            headers={"content-range": f"bytes */{image.size}"},
+        )
+    if byte_range is None:
+        return FileRangeResponse(
+            file, 0, image.size - 1, headers=headers, media_type=image.media_type
+        )
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{image.size}"
+    return FileRangeResponse(
+        file,
+        start,
+        end,
+        status_code=206,
+        headers=headers,
+        media_type=image.media_type,
+    )
@@ -0,0 +1,104 @@
+from typing import Dict, List, Optional
+
+import orjson
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+from project.get_comic_explanation_service import (
+    GetComicExplanationResponseModel,
+    cache_ttl,
+    explanation_cache,
+    explanation_response,
+    placeholder_explanation,
+)
+
+MAX_BATCH_SIZE = 100
+
+# The newest approved explanation of each comic passed as a JSON array of ids. Each comic
+# is one probe of the (comicId, status, createdAt) index reading a single row, however
+# often the comic has been regenerated.
+CURRENT_EXPLANATIONS_SQL = (
+    'SELECT e.* FROM jsonb_array_elements_text($1::jsonb) AS c("comicId") '
+    'CROSS JOIN LATERAL (SELECT * FROM "Explanation" WHERE "comicId" = c."comicId" '
+    "AND \"status\" = 'APPROVED' ORDER BY \"createdAt\" DESC LIMIT 1) AS e"
+)
+
+
+class ExplanationBatchRequest(BaseModel):
+    """
+    Request model listing the comic IDs whose explanations should be fetched in one call.
+    """
+
+    comicIds: List[str]
+
+
+class ExplanationBatchItem(BaseModel):
+    """
+    The result for one requested comic: either its explanation or an error message.
+    """
+
+    comicId: str
+    explanation: Optional[GetComicExplanationResponseModel] = None
+    error: Optional[str] = None
+
+
+class ExplanationBatchResponse(BaseModel):
+    """
+    Response model containing one item per requested comic ID, in request order.
+    """
+
+    items: List[ExplanationBatchItem]
+
+
+def _batch_item(response: GetComicExplanationResponseModel) -> ExplanationBatchItem:
+    if response.generatedBy == "Placeholder":
+        return ExplanationBatchItem(comicId=response.comicId, error=response.explanation)
+    return ExplanationBatchItem(comicId=response.comicId, explanation=response)
+
+
+async def get_explanation_batch(comicIds: List[str]) -> ExplanationBatchResponse:
+    """
+    Endpoint for fetching the current explanations of several comics in one round trip.
+
+    Cached explanations are served from memory, the rest are read with a single query
+    and put in the cache. Comics without an approved explanation get an error item.
+
+    Args:
+        comicIds (List[str]): The comic IDs to fetch explanations for, at most MAX_BATCH_SIZE.
+
+    Returns:
+        ExplanationBatchResponse: Response model containing one item per requested comic ID, in request order.
+    """
+    if len(comicIds) > MAX_BATCH_SIZE:
+        raise ValueError(
+            f"At most {MAX_BATCH_SIZE} explanations can be requested at once."
+        )
+    explanations: Dict[str, GetComicExplanationResponseModel] = {}
+    missing = []
+    for comicId in dict.fromkeys(comicIds):
+        cached = explanation_cache.get(comicId)
+        if cached is not None:
+            explanations[comicId] = cached
+        else:
+            missing.append(comicId)
+    if missing:
+        generation = explanation_cache.generation
+        versions = {comicId: explanation_cache.version(comicId) for comicId in missing}
+        records = await prisma.models.Explanation.prisma().query_raw(
+            CURRENT_EXPLANATIONS_SQL, orjson.dumps(missing).decode()
+        )
+        for record in records:
+            explanations[record.comicId] = explanation_response(record)
+        for comicId in missing:
+            response = explanations.setdefault(comicId, placeholder_explanation(comicId))
+            explanation_cache.set(
+                comicId,
+                response,
+                ttl=cache_ttl(response),
+                generation=generation,
+                version=versions[comicId],
+            )
+    return ExplanationBatchResponse(
+        items=[_batch_item(explanations[comicId]) for comicId in comicIds]
+    )
@@ -0,0 +1,140 @@
+import asyncio
+import base64
+import binascii
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+DEFAULT_QUEUE_LIMIT = 50
+MAX_QUEUE_LIMIT = 500
+
+# Prisma cannot declare partial indexes, so this one is created once after
+# `prisma db push`, by running this module. It only holds pending explanations, so it
+# stays small however many reviewed explanations accumulate. It is built concurrently,
+# so writes to the table are not blocked meanwhile. A build that fails leaves an invalid
+# index behind, which has to be dropped before running the module again.
+PENDING_INDEX_SQL = (
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "Explanation_pending_createdAt_id_idx" '
+    'ON "Explanation" ("createdAt", "id") WHERE "status" = \'PENDING\''
+)
+
+# The row comparison lets Postgres seek straight to the cursor position in the partial
+# index. The equivalent Prisma OR filter is not guaranteed to use it.
+QUEUE_SQL = (
+    'SELECT * FROM "Explanation" WHERE "status" = \'PENDING\' '
+    'AND ("createdAt", "id") > ($1::timestamp, $2) '
+    'ORDER BY "createdAt", "id" LIMIT $3'
+)
+QUEUE_HEAD_SQL = (
+    'SELECT * FROM "Explanation" WHERE "status" = \'PENDING\' '
+    'ORDER BY "createdAt", "id" LIMIT $1'
+)
+
+
+class ModerationQueueItem(BaseModel):
+    """
+    An explanation waiting for a moderator's decision.
+    """
+
+    explanationId: str
+    comicId: str
+    explanation: str
+    generatedBy: str
+    createdAt: str
+
+
+class ModerationQueueResponse(BaseModel):
+    """
+    One page of the moderation queue, oldest first.
+    """
+
+    items: List[ModerationQueueItem]
+    next_cursor: Optional[str] = None
+
+
+async def ensure_pending_index() -> None:
+    """
+    Creates the partial index over pending explanations if it does not exist yet.
+    """
+    await prisma.get_client().execute_raw(PENDING_INDEX_SQL)
+
+
+def _utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def encode_cursor(explanation: prisma.models.Explanation) -> str:
+    position = f"{_utc_naive(explanation.createdAt).isoformat()}|{explanation.id}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        position = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, explanation_id = position.split("|", 1)
+        datetime.fromisoformat(created_at)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor.") from e
+    return created_at, explanation_id
+
+
+async def get_moderation_queue(
+    limit: int = DEFAULT_QUEUE_LIMIT, cursor: Optional[str] = None
+) -> ModerationQueueResponse:
+    """
+    Endpoint for moderators to page through pending explanations, oldest first.
+
+    Pages are read by keyset on (createdAt, id) from the partial index of pending
+    explanations, so each page costs the same however deep into the queue it is.
+
+    Args:
+        limit (int): Maximum number of explanations to return.
+        cursor (Optional[str]): The next_cursor of the previous page, if any.
+
+    Returns:
+        ModerationQueueResponse: The pending explanations and the cursor of the next page.
+    """
+    limit = max(1, min(limit, MAX_QUEUE_LIMIT))
+    actions = prisma.models.Explanation.prisma()
+    if cursor is None:
+        explanations = await actions.query_raw(QUEUE_HEAD_SQL, limit + 1)
+    else:
+        created_at, explanation_id = decode_cursor(cursor)
+        explanations = await actions.query_raw(
+            QUEUE_SQL, created_at, explanation_id, limit + 1
+        )
+    page = explanations[:limit]
+    return ModerationQueueResponse(
+        items=[
+            ModerationQueueItem(
+                explanationId=explanation.id,
+                comicId=explanation.comicId,
+                explanation=explanation.text,
+                generatedBy=explanation.generatedBy,
+                createdAt=explanation.createdAt.isoformat(),
+            )
+            for explanation in page
+        ],
+        next_cursor=encode_cursor(page[-1]) if len(explanations) > limit else None,
+    )
+
+
+async def main() -> None:
+    from prisma import Prisma
+
+    db_client = Prisma(auto_register=True)
+    await db_client.connect()
+    try:
+        await ensure_pending_index()
+        print("Created the moderation queue index")
+    finally:
+        await db_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
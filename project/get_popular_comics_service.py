@@ -0,0 +1,66 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from project.comic_catalog import comic_catalog
+from project.popularity import WINDOWS, popularity
+
+DEFAULT_POPULAR_LIMIT = 10
+MAX_POPULAR_LIMIT = 100
+
+
+class PopularComic(BaseModel):
+    """
+    A comic and how often it was viewed during the requested window.
+    """
+
+    comicId: str
+    num: int
+    title: str
+    img_url: str
+    views: int
+
+
+class PopularComicsResponse(BaseModel):
+    """
+    The most viewed comics of a window, most viewed first.
+    """
+
+    window: str
+    comics: List[PopularComic]
+
+
+async def get_popular_comics(
+    window: str = "day", limit: int = DEFAULT_POPULAR_LIMIT
+) -> PopularComicsResponse:
+    """
+    Endpoint for fetching the most viewed comics of the current hour, day or week.
+
+    Served from the in-memory result of the last view rollup, refreshed every
+    POPULARITY_ROLLUP_INTERVAL seconds, so the cost does not depend on how many views
+    are stored.
+
+    Args:
+        window (str): One of "hour", "day" or "week". Windows are aligned to whole hours.
+        limit (int): Maximum number of comics to return.
+
+    Returns:
+        PopularComicsResponse: The most viewed comics and their view counts.
+    """
+    if window not in WINDOWS:
+        raise ValueError(f"Window must be one of {', '.join(WINDOWS)}.")
+    limit = max(1, min(limit, MAX_POPULAR_LIMIT))
+    comics = []
+    for comic_id, views in popularity.top(window, limit):
+        comic = comic_catalog.get_by_id(comic_id)
+        if comic is not None:
+            comics.append(
+                PopularComic(
+                    comicId=comic.id,
+                    num=comic.number,
+                    title=comic.title,
+                    img_url=comic.imageUrl,
+                    views=views,
+                )
+            )
+    return PopularComicsResponse(window=window, comics=comics)
@@ -1,9 +1,31 @@
+import os
 import random
 from datetime import datetime
+from typing import Dict, Optional
 
-import httpx
+import prisma.models
 from pydantic import BaseModel
 
+from project.admission import admission
+from project.cache import AsyncTTLCache
+from project.comic_catalog import comic_catalog
+from project.http_client import get_http_client
+from project.latest_comic_number import latest_comic_number
+from project.resilience import CircuitOpenError, resilient_upstream
+from project.shared_cache import Codec
+from project.view_recorder import view_recorder
+
+# The last comic fetched from xkcd, served by get_random_comic while xkcd is unavailable.
+_last_comic_data: Optional[Dict] = None
+
+# Numbered comic documents never change once published.
+comic_document_cache: AsyncTTLCache[Dict] = AsyncTTLCache(
+    "comic_documents",
+    max_entries=int(os.environ.get("COMIC_CACHE_MAX_ENTRIES", "4096")),
+    ttl=30 * 24 * 3600.0,
+    shared=Codec(),
+)
+
 
 class RandomComicResponse(BaseModel):
     """
@@ -17,43 +39,93 @@ class RandomComicResponse(BaseModel):
     date: str
 
 
-async def get_current_comic_number() -> int:
+def comic_date(comic_data: Dict) -> datetime:
     """
-    Fetches the most recent comic from xkcd and returns its number.
+    Builds the publication date from the year/month/day fields of an xkcd comic document.
+    """
+    return datetime(
+        year=int(comic_data["year"]),
+        month=int(comic_data["month"]),
+        day=int(comic_data["day"]),
+    )
+
+
+def comic_response_from_data(comic_data: Dict) -> RandomComicResponse:
+    """
+    Converts an xkcd info.0.json document into the response model.
+    """
+    return RandomComicResponse(
+        title=comic_data["title"],
+        img_url=comic_data["img"],
+        num=comic_data["num"],
+        alt_text=comic_data["alt"],
+        date=comic_date(comic_data).strftime("%Y-%m-%d"),
+    )
+
+
+def comic_response_from_record(comic: prisma.models.Comic) -> RandomComicResponse:
+    """
+    Converts a mirrored Comic row into the response model.
+    """
+    return RandomComicResponse(
+        title=comic.title,
+        img_url=comic.imageUrl,
+        num=comic.number,
+        alt_text=comic.altText,
+        date=comic.publishedAt.strftime("%Y-%m-%d") if comic.publishedAt else "",
+    )
+
+
+async def fetch_comic_data(number: int) -> Dict:
+    """
+    Fetches the info.0.json document of a single comic from xkcd, through the comic
+    document cache.
+
+    Args:
+        number (int): The comic number.
 
     Returns:
-        int: The number of the most recent xkcd comic.
+        Dict: The raw comic document.
     """
-    url = "https://xkcd.com/info.0.json"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
+
+    async def fetch() -> Dict:
+        response = await get_http_client("xkcd").get(f"/{number}/info.0.json")
         response.raise_for_status()
-        return response.json()["num"]
+        return response.json()
+
+    comic_data, _ = await comic_document_cache.get_or_load(
+        number, lambda: resilient_upstream("xkcd").call(fetch)
+    )
+    return comic_data
 
 
-async def get_random_comic() -> RandomComicResponse:
+async def get_random_comic(user_id: Optional[str] = None) -> RandomComicResponse:
     """
     Endpoint for fetching a random comic from xkcd and displaying its information.
 
+    Args:
+        user_id (Optional[str]): The viewing user. When given, the view is recorded in the background.
+
     Returns:
         RandomComicResponse: Response model containing the information of the randomly selected xkcd comic.
+
+    Raises:
+        OverloadedError: If the catalog is empty and xkcd has no free concurrency slot.
     """
-    current_comic_number = await get_current_comic_number()
-    random_comic_number = random.randint(1, current_comic_number)
-    comic_url = f"https://xkcd.com/{random_comic_number}/info.0.json"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(comic_url)
-        response.raise_for_status()
-        comic_data = response.json()
-        comic_response = RandomComicResponse(
-            title=comic_data["title"],
-            img_url=comic_data["img"],
-            num=comic_data["num"],
-            alt_text=comic_data["alt"],
-            date=datetime(
-                year=int(comic_data["year"]),
-                month=int(comic_data["month"]),
-                day=int(comic_data["day"]),
-            ).strftime("%Y-%m-%d"),
-        )
-        return comic_response
+    comic = comic_catalog.random()
+    if comic is not None:
+        if user_id is not None:
+            view_recorder.record(comic.id, user_id)
+        return comic_response_from_record(comic)
+    global _last_comic_data
+    try:
+        async with admission.upstream_slot("/comic/random", "xkcd"):
+            current_comic_number = await latest_comic_number.get()
+            random_comic_number = random.randint(1, current_comic_number)
+            comic_data = await fetch_comic_data(random_comic_number)
+    except CircuitOpenError:
+        if _last_comic_data is None:
+            raise
+        return comic_response_from_data(_last_comic_data)
+    _last_comic_data = comic_data
+    return comic_response_from_data(comic_data)
@@ -0,0 +1,79 @@
+from typing import List, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from project.comic_catalog import comic_catalog
+from project.recommendations import co_view_model
+
+DEFAULT_RECOMMENDATION_LIMIT = 10
+MAX_RECOMMENDATION_LIMIT = 50
+
+
+class RecommendedComic(BaseModel):
+    """
+    A comic suggested from viewing patterns, with the score it was ranked by.
+    """
+
+    comicId: str
+    num: int
+    title: str
+    img_url: str
+    score: float
+
+
+class SimilarComicsResponse(BaseModel):
+    """
+    The comics most often viewed by the viewers of a comic, most similar first.
+    """
+
+    num: int
+    similar: List[RecommendedComic]
+
+
+def recommended_comics(ranked: List[Tuple[str, float]]) -> List[RecommendedComic]:
+    """
+    Resolves ranked comic ids against the catalog, skipping comics not mirrored yet.
+    """
+    comics = []
+    for comic_id, score in ranked:
+        comic = comic_catalog.get_by_id(comic_id)
+        if comic is not None:
+            comics.append(
+                RecommendedComic(
+                    comicId=comic.id,
+                    num=comic.number,
+                    title=comic.title,
+                    img_url=comic.imageUrl,
+                    score=round(score, 4),
+                )
+            )
+    return comics
+
+
+async def get_similar_comics(
+    number: int, limit: int = DEFAULT_RECOMMENDATION_LIMIT
+) -> SimilarComicsResponse:
+    """
+    Endpoint for fetching the comics most similar to a comic by who viewed them.
+
+    Served from the precomputed neighbour table of the co-view model, without a query.
+
+    Args:
+        number (int): The comic number.
+        limit (int): Maximum number of similar comics to return.
+
+    Returns:
+        SimilarComicsResponse: The similar comics, most similar first.
+
+    Raises:
+        HTTPException: If the comic is not in the catalog.
+    """
+    comic = comic_catalog.get(number)
+    if comic is None:
+        raise HTTPException(status_code=404, detail=f"Comic {number} not found.")
+    limit = max(1, min(limit, MAX_RECOMMENDATION_LIMIT))
+    return SimilarComicsResponse(
+        num=number,
+        similar=recommended_comics(co_view_model.similar(comic.id, limit)),
+    )
@@ -1,9 +1,15 @@
-from typing import List
+import asyncio
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
 
 import prisma
 import prisma.models
 from pydantic import BaseModel
 
+from project.cache import AsyncTTLCache
+
 
 class UserPreferencesResponse(BaseModel):
     """
@@ -12,29 +18,130 @@ class UserPreferencesResponse(BaseModel):
 
     language: str
     favorite_comics: List[str]
+    next_cursor: Optional[str] = None
+
+
+DEFAULT_LANGUAGE = "en"
+DEFAULT_FAVORITES_LIMIT = 100
+MAX_FAVORITES_LIMIT = 1000
+MAX_CACHED_PAGES = 8
+
+
+@dataclass
+class FavoritesPage:
+    comic_ids: Tuple[str, ...]
+    next_cursor: Optional[str]
+
+
+@dataclass
+class CachedPreferences:
+    """
+    Per-user cache entry: the language plus the favorites pages read so far.
+    """
+
+    language: str
+    pages: "OrderedDict[Tuple[Optional[str], int], FavoritesPage]" = field(
+        default_factory=OrderedDict
+    )
+
+    def add_page(
+        self, cursor: Optional[str], limit: int, page: FavoritesPage
+    ) -> None:
+        self.pages[(cursor, limit)] = page
+        while len(self.pages) > MAX_CACHED_PAGES:
+            self.pages.popitem(last=False)
+
+
+preferences_cache: AsyncTTLCache[CachedPreferences] = AsyncTTLCache(
+    "user_preferences",
+    max_entries=int(os.environ.get("PREFERENCES_CACHE_MAX_ENTRIES", "50000")),
+    ttl=float(os.environ.get("PREFERENCES_CACHE_TTL", "300")),
+)
+
+
+def invalidate_user_preferences(user_id: str) -> None:
+    """
+    Drops the cached preferences of a user after they changed.
+    """
+    preferences_cache.invalidate(user_id)
+
+
+def store_user_preferences(user_id: str, entry: CachedPreferences) -> None:
+    """
+    Writes a user's preferences through to the cache after they were saved.
+    """
+    # Bumping the generation first keeps loads that read the old rows from replacing this.
+    preferences_cache.invalidate(user_id)
+    preferences_cache.set(user_id, entry)
 
 
-async def get_user_preferences(user_id: str) -> UserPreferencesResponse:
+def favorites_page(comic_ids: List[str], limit: int) -> FavoritesPage:
+    """
+    Builds the first favorites page from a user's complete, sorted favorites.
+    """
+    return FavoritesPage(
+        comic_ids=tuple(comic_ids[:limit]),
+        next_cursor=comic_ids[limit - 1] if len(comic_ids) > limit else None,
+    )
+
+
+async def _load_language(user_id: str) -> str:
+    preferences = await prisma.models.Preferences.prisma().find_unique(
+        where={"userId": user_id}
+    )
+    return preferences.language if preferences else DEFAULT_LANGUAGE
+
+
+async def _load_favorites(
+    user_id: str, cursor: Optional[str], limit: int
+) -> FavoritesPage:
+    where = {"userId": user_id}
+    if cursor is not None:
+        where["comicId"] = {"gt": cursor}
+    favorites = await prisma.models.Favorite.prisma().find_many(
+        where=where, order={"comicId": "asc"}, take=limit + 1
+    )
+    comic_ids = tuple(favorite.comicId for favorite in favorites[:limit])
+    next_cursor = comic_ids[-1] if len(favorites) > limit else None
+    return FavoritesPage(comic_ids=comic_ids, next_cursor=next_cursor)
+
+
+async def get_user_preferences(
+    user_id: str,
+    limit: int = DEFAULT_FAVORITES_LIMIT,
+    cursor: Optional[str] = None,
+) -> UserPreferencesResponse:
     """
     Endpoint to retrieve the current user preferences.
 
+    Favorites are returned in pages ordered by comic id. Pass the returned next_cursor
+    back as cursor to read the following page.
+
     Args:
     user_id (str): ID of the user whose preferences are being retrieved. This field is assumed to be populated automatically from the user's authentication token rather than being explicitly supplied by the requester.
+    limit (int): Maximum number of favorite comics to return.
+    cursor (Optional[str]): The next_cursor of the previous page, if any.
 
     Returns:
     UserPreferencesResponse: Response model representing the user's saved preferences, including language settings and favorite comics.
     """
-    preferences = await prisma.models.Preferences.prisma().find_unique(
-        where={"userId": user_id}
-    )
-    comic_views = await prisma.models.ComicView.prisma().find_many(
-        where={"userId": user_id}
-    )
-    favorite_comics = (
-        [comic_view.Comic.id for comic_view in comic_views] if comic_views else []
-    )
-    language = preferences.language if preferences else "en"
-    response = UserPreferencesResponse(
-        language=language, favorite_comics=favorite_comics
+    limit = max(1, min(limit, MAX_FAVORITES_LIMIT))
+
+    async def load() -> CachedPreferences:
+        language, page = await asyncio.gather(
+            _load_language(user_id), _load_favorites(user_id, cursor, limit)
+        )
+        entry = CachedPreferences(language=language)
+        entry.add_page(cursor, limit, page)
+        return entry
+
+    entry, _ = await preferences_cache.get_or_load(user_id, load)
+    page = entry.pages.get((cursor, limit))
+    if page is None:
+        page = await _load_favorites(user_id, cursor, limit)
+        entry.add_page(cursor, limit, page)
+    return UserPreferencesResponse(
+        language=entry.language,
+        favorite_comics=list(page.comic_ids),
+        next_cursor=page.next_cursor,
     )
-    return response
@@ -0,0 +1,49 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from project.get_similar_comics_service import (
+    DEFAULT_RECOMMENDATION_LIMIT,
+    MAX_RECOMMENDATION_LIMIT,
+    RecommendedComic,
+    recommended_comics,
+)
+from project.recommendations import co_view_model
+
+
+class UserRecommendationsResponse(BaseModel):
+    """
+    Comics recommended to a user. source is "co_views" when ranked from the user's own
+    views, or "popular" for users without views yet.
+    """
+
+    userId: str
+    source: str
+    recommendations: List[RecommendedComic]
+
+
+async def get_user_recommendations(
+    user_id: str, limit: int = DEFAULT_RECOMMENDATION_LIMIT
+) -> UserRecommendationsResponse:
+    """
+    Endpoint for fetching comics a user has not viewed but is likely to enjoy.
+
+    Comics are ranked by their summed similarity to the comics the user viewed, from the
+    co-view model held in memory. Users without views get the most viewed comics.
+
+    Args:
+        user_id (str): The user to recommend comics to.
+        limit (int): Maximum number of comics to return.
+
+    Returns:
+        UserRecommendationsResponse: The recommended comics, best first, and how they were chosen.
+    """
+    limit = max(1, min(limit, MAX_RECOMMENDATION_LIMIT))
+    ranked = co_view_model.recommend(user_id, limit)
+    source = "co_views"
+    if not ranked:
+        ranked = co_view_model.popular(limit)
+        source = "popular"
+    return UserRecommendationsResponse(
+        userId=user_id, source=source, recommendations=recommended_comics(ranked)
+    )
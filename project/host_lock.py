@@ -0,0 +1,58 @@
+import fcntl
+import logging
+import os
+import tempfile
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Lock file electing the worker process that runs host-wide jobs; empty to run them in
+# every worker.
+JOB_LOCK_PATH = os.environ.get(
+    "JOB_LOCK_PATH", os.path.join(tempfile.gettempdir(), "horser-jobs.lock")
+)
+
+
+class HostLock:
+    """
+    Exclusive lock on a file, so only one of the worker processes on a host runs a job.
+
+    Acquiring never blocks. The lock is held until released or until the process exits,
+    after which another worker can take it over.
+    """
+
+    def __init__(self, path: str = JOB_LOCK_PATH) -> None:
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        """
+        Takes the lock if no other process holds it.
+
+        Returns:
+            bool: Whether this process holds the lock. Always True when the path is empty
+            or the lock file cannot be opened, so the job still runs.
+        """
+        if not self.path or self._fd is not None:
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            logger.warning("Could not open job lock %s", self.path, exc_info=True)
+            return True
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,58 @@
+import hashlib
+from typing import Dict, Optional
+
+from starlette.responses import Response
+
+# Comic metadata and images never change once published.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Explanations change when reviewed or regenerated, so shared caches must revalidate.
+EXPLANATION_CACHE_CONTROL = "public, max-age=0, s-maxage=60, must-revalidate"
+# Preferences are per user and must never be stored by shared caches.
+PREFERENCES_CACHE_CONTROL = "private, no-cache"
+
+
+def strong_etag(*parts: object) -> str:
+    """
+    Builds a quoted strong ETag from the values that identify a representation's version.
+    """
+    digest = hashlib.blake2b(
+        "\x1f".join(str(part) for part in parts).encode(), digest_size=16
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evaluates If-None-Match against an ETag using the weak comparison RFC 9110 requires.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def validators(etag: str, cache_control: str) -> Dict[str, str]:
+    """
+    Returns the ETag and Cache-Control headers for a representation.
+    """
+    return {"etag": etag, "cache-control": cache_control}
+
+
+def not_modified(
+    if_none_match: Optional[str], headers: Dict[str, str]
+) -> Optional[Response]:
+    """
+    Short-circuits a request whose If-None-Match matches the current ETag.
+
+    Args:
+        if_none_match (Optional[str]): The request's If-None-Match header.
+        headers (Dict[str, str]): The validators built by validators().
+
+    Returns:
+        Optional[Response]: A 304 response if the client's copy is current, otherwise None.
+    """
+    if etag_matches(if_none_match, headers["etag"]):
+        return Response(status_code=304, headers=headers)
+    return None
@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpcore
+import httpx
+
+from project.metrics import record_phase, upstream_request_duration
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    """
+    Connection settings for one upstream service. Every value can be overridden through
+    environment variables named after the upstream's prefix, e.g. XKCD_MAX_CONNECTIONS.
+    """
+
+    name: str
+    base_url: str
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    connect_timeout: float
+    read_timeout: float
+    pool_timeout: float
+    http2: bool
+    dns_cache_ttl: float
+
+
+# upstream name -> (environment variable prefix, default base url)
+UPSTREAMS: Dict[str, Tuple[str, str]] = {
+    "xkcd": ("XKCD", "https://xkcd.com"),
+    "xkcd-images": ("XKCD_IMAGES", "https://imgs.xkcd.com"),
+    "GPT-4-vision": ("VISION", "https://api.openai.com/v4/images"),
+}
+
+
+def _env(prefix: str, key: str, default: str) -> str:
+    return os.environ.get(f"{prefix}_{key}", default)
+
+
+def load_upstream_config(name: str) -> UpstreamConfig:
+    """
+    Builds the connection settings for an upstream from the environment.
+
+    Args:
+        name (str): The upstream name as listed in UPSTREAMS, e.g. 'xkcd'.
+
+    Returns:
+        UpstreamConfig: The resolved settings for the upstream.
+    """
+    if name not in UPSTREAMS:
+        raise ValueError(f"Service {name} is not supported.")
+    prefix, base_url = UPSTREAMS[name]
+    return UpstreamConfig(
+        name=name,
+        base_url=_env(prefix, "BASE_URL", base_url),
+        max_connections=int(_env(prefix, "MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(_env(prefix, "MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(_env(prefix, "KEEPALIVE_EXPIRY", "30")),
+        connect_timeout=float(_env(prefix, "CONNECT_TIMEOUT", "3")),
+        read_timeout=float(_env(prefix, "READ_TIMEOUT", "10")),
+        pool_timeout=float(_env(prefix, "POOL_TIMEOUT", "5")),
+        http2=_env(prefix, "HTTP2", "false").lower() in ("1", "true", "yes"),
+        dns_cache_ttl=float(_env(prefix, "DNS_CACHE_TTL", "300")),
+    )
+
+
+class CachingResolverBackend(httpcore.AsyncNetworkBackend):
+    """
+    Network backend that resolves hostnames once per TTL and reuses the addresses for every
+    new connection in the pool. TLS still uses the original hostname for SNI and certificate
+    verification, since httpcore passes the origin host to start_tls separately.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self._backend = httpcore.AnyIOBackend()
+        self._ttl = ttl
+        self._addresses: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        cached = self._addresses.get((host, port))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM
+        )
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._addresses[(host, port)] = (time.monotonic() + self._ttl, addresses)
+        return addresses
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options=None,
+    ) -> httpcore.AsyncNetworkStream:
+        if self._ttl <= 0:
+            return await self._backend.connect_tcp(
+                host, port, timeout, local_address, socket_options
+            )
+        try:
+            addresses = await self._resolve(host, port)
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout, local_address, socket_options
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        # Every cached address failed; resolve again on the next attempt.
+        self._addresses.pop((host, port), None)
+        raise error or httpcore.ConnectError(f"No addresses found for {host}")
+
+    async def connect_unix_socket(
+        self, path: str, timeout: Optional[float] = None, socket_options=None
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+# httpcore errors and the httpx errors they surface as, most specific first.
+HTTPCORE_ERRORS: List[Tuple[type, type]] = [
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+]
+
+
+@contextmanager
+def _httpx_errors(request: httpx.Request) -> Iterator[None]:
+    try:
+        yield
+    except Exception as e:
+        for httpcore_error, httpx_error in HTTPCORE_ERRORS:
+            if isinstance(e, httpcore_error):
+                raise httpx_error(str(e), request=request) from e
+        raise
+
+
+class PooledResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: AsyncIterable[bytes], request: httpx.Request) -> None:
+        self._stream = stream
+        self._request = request
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with _httpx_errors(self._request):
+            async for chunk in self._stream:
+                yield chunk
+
+    async def aclose(self) -> None:
+        if hasattr(self._stream, "aclose"):
+            await self._stream.aclose()
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """
+    Transport sending requests through an httpcore connection pool built by the caller,
+    so the pool can be given its own network backend through httpcore's public API.
+    """
+
+    def __init__(self, pool: httpcore.AsyncConnectionPool) -> None:
+        self._pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _httpx_errors(request):
+            response = await self._pool.handle_async_request(core_request)
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=PooledResponseStream(response.stream, request),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._pool.aclose()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper recording the time until response headers for each upstream request.
+    """
+
+    def __init__(self, name: str, transport: httpx.AsyncBaseTransport) -> None:
+        self._name = name
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        status = "error"
+        start = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            upstream_request_duration.observe(elapsed, self._name, status)
+            record_phase("upstream", elapsed)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client(config: UpstreamConfig) -> httpx.AsyncClient:
+    """
+    Creates a pooled, keep-alive client for a single upstream.
+
+    Args:
+        config (UpstreamConfig): Connection settings for the upstream.
+
+    Returns:
+        httpx.AsyncClient: A client whose relative URLs resolve against the upstream's base url.
+    """
+    http2 = config.http2
+    if http2 and not _http2_available():
+        logger.warning(
+            "HTTP/2 requested for %s but the 'h2' package is not installed", config.name
+        )
+        http2 = False
+    pool = httpcore.AsyncConnectionPool(
+        ssl_context=httpx.create_ssl_context(http2=http2),
+        max_connections=config.max_connections,
+        max_keepalive_connections=config.max_keepalive_connections,
+        keepalive_expiry=config.keepalive_expiry,
+        http1=True,
+        http2=http2,
+        network_backend=CachingResolverBackend(config.dns_cache_ttl),
+    )
+    transport = PooledTransport(pool)
+    return httpx.AsyncClient(
+        base_url=config.base_url,
+        transport=InstrumentedTransport(config.name, transport),
+        timeout=httpx.Timeout(
+            config.read_timeout,
+            connect=config.connect_timeout,
+            pool=config.pool_timeout,
+        ),
+    )
+
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """
+    Returns the shared client for an upstream, creating it on first use.
+
+    Args:
+        name (str): The upstream name as listed in UPSTREAMS, e.g. 'xkcd'.
+
+    Returns:
+        httpx.AsyncClient: The app-scoped pooled client for the upstream.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = create_http_client(load_upstream_config(name))
+        _clients[name] = client
+    return client
+
+
+async def start_http_clients() -> None:
+    """
+    Creates the shared clients for every known upstream. Called from the app lifespan.
+    """
+    for name in UPSTREAMS:
+        get_http_client(name)
+
+
+async def close_http_clients() -> None:
+    """
+    Closes every shared client and releases its pooled connections.
+    """
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(client.aclose() for client in clients))
@@ -0,0 +1,364 @@
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Tuple
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from project.cache import SingleFlight
+from project.http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.environ.get(
+    "IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "horser-images")
+)
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(512 << 20)))
+# A hit moves its blob to the back of the eviction order at most this often, in seconds.
+TOUCH_INTERVAL = 60.0
+# Times an image is looked up again when its blob was evicted before it could be opened.
+OPEN_ATTEMPTS = 3
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    extension TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used);
+"""
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    digest: str
+    path: str
+    size: int
+    media_type: str
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.digest}"'
+
+
+class ImageCache:
+    """
+    Content-addressed on-disk cache for upstream images.
+
+    Image bytes are stored once under their sha256 digest, and a small ref file maps each
+    source path to the digest. Total size is capped by evicting the least recently served
+    blobs. The size and recency of every blob are kept in a SQLite index next to them, so
+    all worker processes sharing the directory account against the same cap. Concurrent
+    misses for the same image share one download.
+    """
+
+    def __init__(
+        self,
+        root: str = IMAGE_CACHE_DIR,
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+        upstream: str = "xkcd-images",
+    ) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.upstream = upstream
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._flights: SingleFlight[CachedImage] = SingleFlight()
+        self._db: Optional[sqlite3.Connection] = None
+        # The index is used from worker threads, one at a time.
+        self._db_lock = threading.Lock()
+
+    def _blob_path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest + extension)
+
+    def _ref_path(self, source: str) -> str:
+        key = hashlib.sha256(source.encode()).hexdigest()
+        return os.path.join(self.root, "refs", key)
+
+    def _index(self) -> sqlite3.Connection:
+        """
+        Opens the index, filling it from the blobs already on disk if it is new. Called
+        with the index lock held.
+        """
+        if self._db is None:
+            os.makedirs(self.root, exist_ok=True)
+            db = sqlite3.connect(
+                os.path.join(self.root, "index.sqlite3"),
+                timeout=5,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(INDEX_SCHEMA)
+            if db.execute("SELECT 1 FROM blobs LIMIT 1").fetchone() is None:
+                self._index_existing(db)
+            self._db = db
+        return self._db
+
+    def _index_existing(self, db: sqlite3.Connection) -> None:
+        """
+        Adds the blobs on disk to the index, ordered by their access times.
+        """
+        rows = []
+        for directory, _, files in os.walk(os.path.join(self.root, "blobs")):
+            for name in files:
+                stat = os.stat(os.path.join(directory, name))
+                digest, extension = os.path.splitext(name)
+                rows.append((digest, extension, stat.st_size, stat.st_atime))
+        db.executemany("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?)", rows)
+
+    def _image(self, digest: str, extension: str, size: int) -> CachedImage:
+        path = self._blob_path(digest, extension)
+        return CachedImage(
+            digest=digest,
+            path=path,
+            size=size,
+            media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        )
+
+    def _lookup(self, source: str) -> Optional[CachedImage]:
+        """
+        Returns the indexed image for a source path, or None. Runs in a worker thread.
+        """
+        try:
+            with open(self._ref_path(source)) as ref:
+                digest, extension = ref.read().split(" ", 1)
+        except (FileNotFoundError, ValueError):
+            return None
+        now = time.time()
+        with self._db_lock:
+            db = self._index()
+            row = db.execute(
+                "SELECT size, last_used FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now - TOUCH_INTERVAL:
+                db.execute(
+                    "UPDATE blobs SET last_used = ? WHERE digest = ?", (now, digest)
+                )
+        return self._image(digest, extension, row[0])
+
+    def _store(self, source: str, content: bytes) -> Tuple[CachedImage, int]:
+        """
+        Writes the blob (unless already present) and the ref file, each atomically, indexes
+        the blob and evicts others beyond max_bytes. Runs in a worker thread.
+
+        Returns:
+            Tuple[CachedImage, int]: The stored image and how many blobs were evicted.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        extension = os.path.splitext(source)[1].lower()
+        path = self._blob_path(digest, extension)
+        if not os.path.exists(path):
+            self._write_atomic(path, content)
+        self._write_atomic(self._ref_path(source), f"{digest} {extension}".encode())
+        with self._db_lock:
+            db = self._index()
+            db.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)",
+                (digest, extension, len(content), time.time()),
+            )
+            evicted = self._evict(db, keep=digest)
+        for evicted_digest in evicted:
+            directory = os.path.dirname(self._blob_path(evicted_digest, ""))
+            for name in os.listdir(directory):
+                if name.startswith(evicted_digest):
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        pass
+        return self._image(digest, extension, len(content)), len(evicted)
+
+    @staticmethod
+    def _write_atomic(path: str, content: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(content)
+        os.replace(tmp_path, path)
+
+    def _evict(self, db: sqlite3.Connection, keep: str) -> List[str]:
+        """
+        Removes the least recently used blobs from the index until the total size is
+        within max_bytes, returning their digests. The write lock is held throughout, so
+        two workers never both evict for the same excess.
+        """
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            evicted = []
+            if total > self.max_bytes:
+                rows = db.execute(
+                    "SELECT digest, size FROM blobs WHERE digest != ? ORDER BY last_used",
+                    (keep,),
+                ).fetchall()
+                for digest, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append(digest)
+                    total -= size
+                db.executemany(
+                    "DELETE FROM blobs WHERE digest = ?", [(digest,) for digest in evicted]
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def _forget(self, digest: str) -> None:
+        with self._db_lock:
+            self._index().execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+
+    async def _download(self, source: str) -> CachedImage:
+        response = await get_http_client(self.upstream).get(source)
+        response.raise_for_status()
+        image, evicted = await asyncio.to_thread(self._store, source, response.content)
+        self.evictions += evicted
+        return image
+
+    async def get(self, source: str) -> CachedImage:
+        """
+        Returns the cached image for an upstream path, downloading it on a miss.
+
+        Args:
+            source (str): The image path on the upstream, e.g. '/comics/barrel_cropped_(1).jpg'.
+
+        Returns:
+            CachedImage: The cached file and its metadata.
+        """
+        image = await asyncio.to_thread(self._lookup, source)
+        if image is not None:
+            self.hits += 1
+            return image
+        self.misses += 1
+        image, _ = await self._flights.do(source, lambda: self._download(source))
+        return image
+
+    async def open(self, source: str) -> Tuple[CachedImage, BinaryIO]:
+        """
+        Returns the cached image for an upstream path and its file opened for reading.
+
+        A blob may be evicted, by any worker, between the lookup and the open. It is then
+        downloaded again. Once open, the file stays readable even if it is evicted.
+
+        Raises:
+            FileNotFoundError: If the blob kept disappearing before it could be opened.
+        """
+        for attempt in range(OPEN_ATTEMPTS):
+            image = await self.get(source)
+            try:
+                return image, await asyncio.to_thread(open, image.path, "rb")
+            except FileNotFoundError:
+                if attempt == OPEN_ATTEMPTS - 1:
+                    raise
+                await asyncio.to_thread(self._forget, image.digest)
+        raise AssertionError("unreachable")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range 'bytes=' Range header into an inclusive (start, end) pair.
+
+    Returns None when the whole file should be served. Raises ValueError when the range
+    cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes=") :].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            start = size - int(end_text)
+            end = size - 1
+    except ValueError:
+        return None
+    start = max(start, 0)
+    end = min(end, size - 1)
+    if start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """
+    Serves a byte range of an open file, using the ASGI zero-copy extension when the
+    server offers it and falling back to chunked reads otherwise. The file is closed once
+    the response has been sent.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        start: int,
+        end: int,
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+        media_type: Optional[str] = None,
+    ) -> None:
+        self.file = file
+        self.start = start
+        self.count = end - start + 1
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        with self.file as file:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            if scope["method"] == "HEAD":
+                await send({"type": "http.response.body", "body": b""})
+                return
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopy",
+                        "file": file,
+                        "offset": self.start,
+                        "count": self.count,
+                        "more_body": False,
+                    }
+                )
+                return
+            file.seek(self.start)
+            remaining = self.count
+            while remaining:
+                chunk = await asyncio.to_thread(
+                    file.read, min(self.chunk_size, remaining)
+                )
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": bool(remaining) and bool(chunk),
+                    }
+                )
+                if not chunk:
+                    break
+
+
+image_cache = ImageCache()
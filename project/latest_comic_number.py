@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from project.cache import SingleFlight
+from project.http_client import get_http_client
+from project.resilience import resilient_upstream
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.environ.get("LATEST_COMIC_POLL_INTERVAL", "900"))
+
+
+async def get_current_comic_number() -> int:
+    """
+    Fetches the most recent comic from xkcd and returns its number.
+
+    Returns:
+        int: The number of the most recent xkcd comic.
+    """
+
+    async def fetch() -> int:
+        response = await get_http_client("xkcd").get("/info.0.json")
+        response.raise_for_status()
+        return response.json()["num"]
+
+    return await resilient_upstream("xkcd").call(fetch)
+
+
+class LatestComicNumber:
+    """
+    Keeps the number of the newest xkcd comic in memory, refreshed by a background task.
+
+    If xkcd is unreachable the last known number is kept, so readers never wait on the
+    upstream once a first value has been fetched.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL) -> None:
+        self.poll_interval = poll_interval
+        self.value: Optional[int] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._flight: SingleFlight[int] = SingleFlight()
+
+    async def refresh(self) -> int:
+        """
+        Fetches the latest comic number from xkcd and stores it.
+
+        Returns:
+            int: The number of the most recent xkcd comic.
+        """
+        number, _ = await self._flight.do("latest", get_current_comic_number)
+        self.value = max(number, self.value or 0)
+        return self.value
+
+    async def get(self) -> int:
+        """
+        Returns the latest known comic number, fetching it only if none is known yet.
+
+        Returns:
+            int: The number of the most recent xkcd comic.
+        """
+        if self.value is not None:
+            return self.value
+        return await self.refresh()
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.warning(
+                    "Could not refresh the latest comic number, keeping %s",
+                    self.value,
+                    exc_info=True,
+                )
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+latest_comic_number = LatestComicNumber()
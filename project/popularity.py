@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import prisma
+import prisma.models
+
+from project.metrics import db_query_duration
+from project.view_recorder import ViewEvent
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_TOP_K = int(os.environ.get("POPULARITY_TOP_K", "100"))
+POPULARITY_ROLLUP_INTERVAL = float(os.environ.get("POPULARITY_ROLLUP_INTERVAL", "60"))
+POPULARITY_RETENTION_DAYS = int(os.environ.get("POPULARITY_RETENTION_DAYS", "8"))
+SKETCH_WIDTH = 4096
+SKETCH_DEPTH = 4
+
+BUCKET = timedelta(hours=1)
+# Windows are aligned to whole hours: "hour" is the current hour so far.
+WINDOWS = {"hour": 1, "day": 24, "week": 7 * 24}
+
+# Each process writes its own rows, so processes never overwrite each other's counts.
+ROLLUP_SOURCE = f"{socket.gethostname()}:{os.getpid()}"
+
+WINDOW_SQL = (
+    'SELECT "comicId", SUM("views")::int AS views FROM "ComicViewRollup" '
+    'WHERE "bucketStart" >= $1::timestamp GROUP BY "comicId" '
+    'ORDER BY views DESC, "comicId" LIMIT $2'
+)
+# Rebuilds rollups from ComicView in one scan, for data stored before rollups existed.
+BACKFILL_SOURCE = "backfill"
+BACKFILL_SQL = (
+    'INSERT INTO "ComicViewRollup" ("bucketStart", "comicId", "source", "views") '
+    "SELECT date_trunc('hour', \"viewDate\"), \"comicId\", $1, COUNT(*) "
+    'FROM "ComicView" WHERE "viewDate" >= $2::timestamp GROUP BY 1, 2 '
+    'ON CONFLICT ("bucketStart", "comicId", "source") DO UPDATE SET "views" = EXCLUDED."views"'
+)
+
+
+def bucket_start(moment: datetime) -> datetime:
+    """
+    Returns the start, in UTC, of the hour bucket a moment falls in.
+    """
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+class CountMinSketch:
+    """
+    Approximate counts of many keys in fixed memory. Estimates never undercount, and
+    overcount by a small fraction of the total count with high probability.
+    """
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH) -> None:
+        self.width = width
+        self._rows = [array("L", [0]) * width for _ in range(depth)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """
+        Adds to a key's count and returns its new estimate.
+        """
+        estimate = None
+        for seed, row in enumerate(self._rows):
+            column = hash((seed, key)) % self.width
+            row[column] += count
+            if estimate is None or row[column] < estimate:
+                estimate = row[column]
+        return estimate
+
+
+class TopK:
+    """
+    The k keys with the highest counts seen so far, fed with count estimates.
+    """
+
+    def __init__(self, k: int) -> None:
+        self.k = k
+        self.counts: Dict[str, int] = {}
+        # A lower bound of the smallest kept count, recomputed only when it matters.
+        self._floor = 0
+
+    def offer(self, key: str, count: int) -> None:
+        if key in self.counts or len(self.counts) < self.k:
+            self.counts[key] = count
+            return
+        if count <= self._floor:
+            return
+        smallest = min(self.counts, key=self.counts.__getitem__)
+        self._floor = self.counts[smallest]
+        if count > self._floor:
+            del self.counts[smallest]
+            self.counts[key] = count
+            self._floor = min(self.counts.values())
+
+
+class HourBucket:
+    """
+    The views of one hour seen by this process: a count-min sketch of every comic and the
+    top-K comics by estimated count.
+    """
+
+    def __init__(self, start: datetime, k: int) -> None:
+        self.start = start
+        self.sketch = CountMinSketch()
+        self.top = TopK(k)
+        self.dirty = False
+
+    def add(self, comic_id: str) -> None:
+        self.top.offer(comic_id, self.sketch.add(comic_id))
+        self.dirty = True
+
+
+class PopularityRollup:
+    """
+    Streaming aggregation of comic views into hourly rollups.
+
+    Stored views are counted in memory per hour bucket, with bounded memory. Every
+    rollup_interval seconds the top-K comics of the open buckets are upserted into
+    ComicViewRollup. Then the top comics of every window are read back, summed over
+    processes from at most top_k rows per process and hour. Requests are served from that
+    result, so their cost does not grow with ComicView.
+    """
+
+    def __init__(
+        self, top_k: int = POPULARITY_TOP_K, interval: float = POPULARITY_ROLLUP_INTERVAL
+    ) -> None:
+        self.top_k = top_k
+        self.interval = interval
+        self.flushes = 0
+        self.failed = 0
+        self._buckets: Dict[datetime, HourBucket] = {}
+        self._windows: Dict[str, List[Tuple[str, int]]] = {}
+        self._pruned_before: Optional[datetime] = None
+        # The newest past bucket written and dropped from memory.
+        self._forgotten: Optional[datetime] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def observe(self, events: Sequence[ViewEvent]) -> None:
+        """
+        Counts newly stored views.
+        """
+        current = bucket_start(datetime.now(timezone.utc))
+        for event in events:
+            start = bucket_start(event.viewed_at)
+            bucket = self._buckets.get(start)
+            forgotten = self._forgotten is not None and start <= self._forgotten
+            if bucket is None and forgotten:
+                # The hour has been written and forgotten already. Its row must not be
+                # overwritten with a count of only the late views.
+                start = current
+                bucket = self._buckets.get(start)
+            if bucket is None:
+                bucket = self._buckets[start] = HourBucket(start, self.top_k)
+            bucket.add(event.comic_id)
+
+    def top(self, window: str, limit: int) -> List[Tuple[str, int]]:
+        """
+        Returns the ids and view counts of the most viewed comics of a window, as of the
+        last rollup.
+        """
+        return self._windows.get(window, [])[:limit]
+
+    async def _write(self, bucket: HourBucket) -> None:
+        batch = prisma.get_client().batch_()
+        for comic_id, views in bucket.top.counts.items():
+            key = {
+                "bucketStart": bucket.start,
+                "comicId": comic_id,
+                "source": ROLLUP_SOURCE,
+            }
+            batch.comicviewrollup.upsert(
+                where={"bucketStart_comicId_source": key},
+                data={"create": {**key, "views": views}, "update": {"views": views}},
+            )
+        # Batches are sent to the engine directly, so they are timed here.
+        start = time.perf_counter()
+        try:
+            await batch.commit()
+        finally:
+            db_query_duration.observe(
+                time.perf_counter() - start, "ComicViewRollup", "batch"
+            )
+
+    async def flush(self) -> None:
+        """
+        Upserts the top-K comics of every bucket with new views, and forgets the buckets
+        of past hours once written.
+        """
+        current = bucket_start(datetime.now(timezone.utc))
+        for start, bucket in sorted(self._buckets.items()):
+            if bucket.dirty:
+                bucket.dirty = False
+                try:
+                    await self._write(bucket)
+                except asyncio.CancelledError:
+                    bucket.dirty = True
+                    raise
+                except Exception:
+                    bucket.dirty = True
+                    self.failed += 1
+                    logger.exception("Failed to write view rollup for %s", start)
+                    continue
+            if start < current:
+                del self._buckets[start]
+                self._forgotten = max(start, self._forgotten or start)
+        self.flushes += 1
+
+    async def query_window(self, window: str, limit: int) -> List[Tuple[str, int]]:
+        """
+        Reads the ids and view counts of the most viewed comics of a window from the
+        rollups.
+        """
+        since = bucket_start(datetime.now(timezone.utc)) - (WINDOWS[window] - 1) * BUCKET
+        rows = await prisma.get_client().query_raw(
+            WINDOW_SQL, since.replace(tzinfo=None).isoformat(), limit
+        )
+        return [(row["comicId"], row["views"]) for row in rows]
+
+    async def refresh(self) -> None:
+        """
+        Re-reads the top comics of every window.
+        """
+        for window in WINDOWS:
+            self._windows[window] = await self.query_window(window, self.top_k)
+
+    async def prune(self) -> None:
+        """
+        Deletes rollups older than the retention period, at most once per hour.
+        """
+        before = bucket_start(datetime.now(timezone.utc)) - timedelta(
+            days=POPULARITY_RETENTION_DAYS
+        )
+        if self._pruned_before == before:
+            return
+        await prisma.models.ComicViewRollup.prisma().delete_many(
+            where={"bucketStart": {"lt": before}}
+        )
+        self._pruned_before = before
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+                await self.refresh()
+                await self.prune()
+            except Exception:
+                logger.exception("View rollup failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the background task and writes the counts not rolled up yet.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+popularity = PopularityRollup()
+
+
+async def backfill_rollups(days: int = POPULARITY_RETENTION_DAYS) -> int:
+    """
+    Computes the rollups of the last days from ComicView. Meant to be run once, when
+    rollups are introduced: views already counted by running processes would be counted
+    twice.
+
+    Args:
+        days (int): How many days of views to roll up.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+    since = bucket_start(datetime.now(timezone.utc)) - timedelta(days=days)
+    return await prisma.get_client().execute_raw(
+        BACKFILL_SQL, BACKFILL_SOURCE, since.replace(tzinfo=None).isoformat()
+    )
+
+
+async def main() -> None:
+    from prisma import Prisma
+
+    db_client = Prisma(auto_register=True)
+    await db_client.connect()
+    try:
+        print(f"Wrote {await backfill_rollups()} view rollups")
+    finally:
+        await db_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+import time
+from typing import List
+
+import prisma
+import prisma.errors
+import prisma.models
+
+from project.get_user_preferences_service import (
+    DEFAULT_FAVORITES_LIMIT,
+    CachedPreferences,
+    favorites_page,
+    preferences_cache,
+    store_user_preferences,
+)
+from project.metrics import db_query_duration, record_phase
+
+
+async def save_language(user_id: str, language: str) -> None:
+    """
+    Sets a user's language with a single upsert and writes it through to the cache.
+
+    Args:
+        user_id (str): The user whose language changes.
+        language (str): The new language code.
+    """
+    try:
+        await prisma.models.Preferences.prisma().upsert(
+            where={"userId": user_id},
+            data={
+                "create": {"userId": user_id, "language": language},
+                "update": {"language": language},
+            },
+        )
+    except prisma.errors.ForeignKeyViolationError as e:
+        raise ValueError(f"User {user_id} does not exist.") from e
+    cached = preferences_cache.get(user_id)
+    # Favorites pages read earlier are still valid, only the language changed.
+    entry = CachedPreferences(language=language)
+    if cached is not None:
+        entry.pages.update(cached.pages)
+    store_user_preferences(user_id, entry)
+
+
+async def save_preferences(
+    user_id: str, language: str, favorite_comics: List[str]
+) -> List[str]:
+    """
+    Replaces a user's language and favorites in one transactional round trip.
+
+    The favorites are diffed in the database: favorites no longer listed are deleted and
+    new ones inserted, while rows that already exist are left untouched.
+
+    Args:
+        user_id (str): The user whose preferences change.
+        language (str): The new language code.
+        favorite_comics (List[str]): The complete list of favorite comic ids.
+
+    Returns:
+        List[str]: The stored favorites, deduplicated and in comic id order.
+    """
+    comic_ids = sorted(set(favorite_comics))
+    batch = prisma.get_client().batch_()
+    batch.preferences.upsert(
+        where={"userId": user_id},
+        data={
+            "create": {"userId": user_id, "language": language},
+            "update": {"language": language},
+        },
+    )
+    batch.favorite.delete_many(
+        where={"userId": user_id, "comicId": {"not_in": comic_ids}}
+    )
+    if comic_ids:
+        batch.favorite.create_many(
+            data=[{"userId": user_id, "comicId": comic_id} for comic_id in comic_ids],
+            skip_duplicates=True,
+        )
+    # Batches are sent to the engine directly, so they are timed here.
+    start = time.perf_counter()
+    try:
+        await batch.commit()
+    except prisma.errors.ForeignKeyViolationError as e:
+        raise ValueError(
+            f"User {user_id} or one of the favorite comics does not exist."
+        ) from e
+    finally:
+        elapsed = time.perf_counter() - start
+        db_query_duration.observe(elapsed, "Preferences", "batch")
+        record_phase("db", elapsed)
+    entry = CachedPreferences(language=language)
+    entry.add_page(
+        None, DEFAULT_FAVORITES_LIMIT, favorites_page(comic_ids, DEFAULT_FAVORITES_LIMIT)
+    )
+    store_user_preferences(user_id, entry)
+    return comic_ids
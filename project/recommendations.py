@@ -0,0 +1,337 @@
+import array
+import asyncio
+import heapq
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import prisma
+
+from project.view_recorder import ViewEvent
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_TOP_K = int(os.environ.get("SIMILAR_TOP_K", "20"))
+# Comics of a user, the most recently viewed, that a new view of theirs is paired with.
+# Bounds the rows one view updates and the pairs a heavy user adds.
+COVIEW_USER_HISTORY = int(os.environ.get("COVIEW_USER_HISTORY", "50"))
+# Co-viewed comics whose counts are kept per comic, the most co-viewed ones. Bounds the
+# model's memory whatever the number of users and views.
+COVIEW_MAX_CANDIDATES = int(os.environ.get("COVIEW_MAX_CANDIDATES", "200"))
+# Distinct (user, comic) pairs read per query while loading.
+LOAD_PAGE_SIZE = 10000
+
+# Pages through the distinct pairs in (userId, comicId) order, served by the ComicView
+# (userId, comicId) index.
+VIEW_PAIRS_SQL = (
+    'SELECT "userId", "comicId" FROM "ComicView" '
+    'WHERE ("userId", "comicId") > ($1, $2) '
+    'GROUP BY "userId", "comicId" ORDER BY "userId", "comicId" LIMIT $3'
+)
+
+
+Neighbors = Tuple["array.array[int]", "array.array[float]"]
+
+NO_NEIGHBORS: Neighbors = (array.array("i"), array.array("f"))
+
+
+@dataclass
+class _Update:
+    """
+    Changes to what the model serves, computed off the event loop and published on it.
+    """
+
+    item_ids: List[str]
+    degrees: Dict[int, int]
+    users: Dict[str, "array.array[int]"]
+    neighbors: Dict[int, Neighbors]
+    views: int
+
+
+class _Counts:
+    """
+    The co-view counts the model is computed from. Only the thread applying views
+    touches them, one batch at a time.
+    """
+
+    def __init__(self, history: int, max_candidates: int) -> None:
+        self.history = history
+        self.max_candidates = max_candidates
+        self.items: Dict[str, int] = {}
+        self.item_ids: List[str] = []
+        self.degrees: List[int] = []
+        self.co: List[Dict[int, int]] = []
+        # A user's recent comics are replaced rather than changed in place, so the
+        # arrays can be shared with the served model.
+        self.users: Dict[str, "array.array[int]"] = {}
+
+    def item_index(self, comic_id: str) -> int:
+        item = self.items.get(comic_id)
+        if item is None:
+            item = self.items[comic_id] = len(self.item_ids)
+            self.item_ids.append(comic_id)
+            self.degrees.append(0)
+            self.co.append({})
+        return item
+
+    def count(self, item: int, other: int) -> None:
+        row = self.co[item]
+        row[other] = row.get(other, 0) + 1
+        if len(row) > 2 * self.max_candidates:
+            keep = heapq.nlargest(
+                self.max_candidates, row.items(), key=lambda e: e[1]
+            )
+            row.clear()
+            row.update(keep)
+
+    def add(self, user_id: str, comic_id: str) -> List[int]:
+        """
+        Counts one view.
+
+        Returns:
+            List[int]: The comics whose counts changed, empty for a repeat view.
+        """
+        item = self.item_index(comic_id)
+        seen = self.users.get(user_id, NO_NEIGHBORS[0])
+        if item in seen:
+            return []
+        for other in seen:
+            self.count(item, other)
+            self.count(other, item)
+        self.degrees[item] += 1
+        recent = seen[max(0, len(seen) + 1 - self.history) :]
+        recent.append(item)
+        self.users[user_id] = recent
+        return [item, *seen]
+
+    def add_pairs(self, pairs: Sequence[Tuple[str, str]]) -> None:
+        for user_id, comic_id in pairs:
+            self.add(user_id, comic_id)
+
+    def rank(self, item: int, top_k: int) -> Neighbors:
+        degree = self.degrees[item]
+        degrees = self.degrees
+        scored = (
+            (other, count / math.sqrt(degree * degrees[other]))
+            for other, count in self.co[item].items()
+        )
+        top = heapq.nlargest(top_k, scored, key=lambda e: (e[1], -e[0]))
+        return (
+            array.array("i", [other for other, _ in top]),
+            array.array("f", [score for _, score in top]),
+        )
+
+
+class CoViewModel:
+    """
+    Item-item similarity between comics, from which users have viewed them.
+
+    Two comics are similar when the same users viewed both, scored by cosine similarity
+    over the binary user-item view matrix. The model keeps, per comic, its viewer count
+    and a sparse map of co-view counts with other comics, and serves a top-K table of
+    its nearest neighbours, as parallel arrays of comic indices and float32 scores.
+    Serving is then an array lookup, and a user's recommendations are a sum over the
+    neighbour arrays of the comics they viewed.
+
+    Memory is bounded: each user's view is paired only with their last history comics,
+    and each comic keeps the counts of its max_candidates most co-viewed comics, dropping
+    the least co-viewed ones when the map grows to twice that.
+
+    The model is built at startup from the view history, read in keyset pages. After that
+    views are queued and folded into the counts by a worker thread, one batch at a time.
+    Each new (user, comic) view updates the counts and recomputes the neighbours of the
+    comics it touched: the new comic and the user's recent ones. Neighbours of other
+    comics drift slightly as viewer counts grow, until the next restart rebuilds them.
+
+    Requests never see the counts. The worker returns what a batch changed and the event
+    loop publishes it between requests, so a request sees a batch applied entirely or
+    not at all.
+    """
+
+    def __init__(
+        self,
+        top_k: int = SIMILAR_TOP_K,
+        history: int = COVIEW_USER_HISTORY,
+        max_candidates: int = COVIEW_MAX_CANDIDATES,
+    ) -> None:
+        self.top_k = top_k
+        self.history = history
+        self.max_candidates = max(max_candidates, top_k)
+        self.ready = False
+        self.updates = 0
+        self._counts = _Counts(history, self.max_candidates)
+        # What requests read, only changed on the event loop.
+        self._items: Dict[str, int] = {}
+        self._item_ids: List[str] = []
+        self._degrees: List[int] = []
+        self._users: Dict[str, "array.array[int]"] = {}
+        self._neighbors: List[Neighbors] = []
+        self._pending: List[ViewEvent] = []
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def items(self) -> int:
+        return len(self._item_ids)
+
+    @property
+    def users(self) -> int:
+        return len(self._users)
+
+    def _rank_all(self, counts: _Counts) -> _Update:
+        return _Update(
+            list(counts.item_ids),
+            dict(enumerate(counts.degrees)),
+            dict(counts.users),
+            {item: counts.rank(item, self.top_k) for item in range(len(counts.co))},
+            0,
+        )
+
+    def _publish(self, update: _Update) -> None:
+        for comic_id in update.item_ids:
+            self._items[comic_id] = len(self._item_ids)
+            self._item_ids.append(comic_id)
+            self._degrees.append(0)
+            self._neighbors.append(NO_NEIGHBORS)
+        for item, degree in update.degrees.items():
+            self._degrees[item] = degree
+        self._users.update(update.users)
+        for item, neighbors in update.neighbors.items():
+            self._neighbors[item] = neighbors
+        self.updates += update.views
+
+    async def load(self, page_size: int = LOAD_PAGE_SIZE) -> int:
+        """
+        Builds the model from every recorded view, then applies views flushed meanwhile.
+
+        Returns:
+            int: The number of comics in the model.
+        """
+        try:
+            # The counts are built in worker threads, page by page, so the build neither
+            # blocks the event loop nor leaves anything half built if cancelled.
+            counts = _Counts(self.history, self.max_candidates)
+            client = prisma.get_client()
+            cursor = ("", "")
+            while True:
+                rows = await client.query_raw(VIEW_PAIRS_SQL, *cursor, page_size)
+                pairs = [(row["userId"], row["comicId"]) for row in rows]
+                await asyncio.to_thread(counts.add_pairs, pairs)
+                if len(rows) < page_size:
+                    break
+                cursor = pairs[-1]
+            update = await asyncio.to_thread(self._rank_all, counts)
+            self._counts = counts
+            self._items, self._item_ids, self._degrees = {}, [], []
+            self._users, self._neighbors = {}, []
+            self._publish(update)
+        finally:
+            # Even without history the model learns from new views from here on.
+            self.ready = True
+            self._schedule()
+        return self.items
+
+    def observe(self, events: Sequence[ViewEvent]) -> None:
+        """
+        Queues newly stored views to be folded into the model. Repeat views of a comic by
+        the same user change nothing.
+        """
+        self._pending.extend(events)
+        if self.ready:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        if self._pending and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._apply_pending())
+
+    async def _apply_pending(self) -> None:
+        while self._pending:
+            events, self._pending = self._pending, []
+            try:
+                update = await asyncio.to_thread(self._apply, events)
+            except Exception:
+                logger.exception(
+                    "Failed to apply %s views to the co-view model", len(events)
+                )
+                continue
+            self._publish(update)
+
+    def _apply(self, events: Sequence[ViewEvent]) -> _Update:
+        counts = self._counts
+        known = len(counts.item_ids)
+        touched = set()
+        users = {}
+        views = 0
+        for event in events:
+            changed = counts.add(event.user_id, event.comic_id)
+            if changed:
+                views += 1
+                touched.update(changed)
+                users[event.user_id] = counts.users[event.user_id]
+        return _Update(
+            counts.item_ids[known:],
+            {item: counts.degrees[item] for item in touched},
+            users,
+            {item: counts.rank(item, self.top_k) for item in touched},
+            views,
+        )
+
+    async def stop(self) -> None:
+        """
+        Waits until the queued views have been applied.
+        """
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def similar(self, comic_id: str, limit: int) -> List[Tuple[str, float]]:
+        """
+        Returns the ids of up to limit comics most often viewed by the viewers of a comic,
+        with their similarity, most similar first.
+        """
+        item = self._items.get(comic_id) if self.ready else None
+        if item is None:
+            return []
+        neighbors, scores = self._neighbors[item]
+        return [
+            (self._item_ids[neighbor], score)
+            for neighbor, score in zip(neighbors[:limit], scores[:limit])
+        ]
+
+    def recommend(self, user_id: str, limit: int) -> List[Tuple[str, float]]:
+        """
+        Returns the ids of up to limit comics a user has not viewed, ranked by their summed
+        similarity to the comics the user has viewed.
+        """
+        seen = self._users.get(user_id) if self.ready else None
+        if not seen:
+            return []
+        viewed = set(seen)
+        weights: Dict[int, float] = {}
+        for item in viewed:
+            for neighbor, score in zip(*self._neighbors[item]):
+                if neighbor not in viewed:
+                    weights[neighbor] = weights.get(neighbor, 0.0) + score
+        return self._top(weights.items(), limit)
+
+    def popular(self, limit: int) -> List[Tuple[str, float]]:
+        """
+        Returns the ids of the comics with the most viewers and their viewer counts.
+        """
+        if not self.ready:
+            return []
+        return self._top(enumerate(self._degrees), limit)
+
+    def _top(
+        self, weights: Iterable[Tuple[int, float]], limit: int
+    ) -> List[Tuple[str, float]]:
+        top = heapq.nlargest(
+            limit,
+            ((item, weight) for item, weight in weights if weight > 0),
+            key=lambda e: (e[1], -e[0]),
+        )
+        return [(self._item_ids[item], float(weight)) for item, weight in top]
+
+
+co_view_model = CoViewModel()
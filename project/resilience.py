@@ -0,0 +1,337 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+
+from project.http_client import UPSTREAMS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open.
+    """
+
+    def __init__(self, name: str, retry_after: float) -> None:
+        super().__init__(f"Upstream {name} is unavailable, retry in {retry_after:.0f}s.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class ResilienceConfig:
+    """
+    Failure handling settings for one upstream, overridable through environment variables
+    named after the upstream's prefix, e.g. XKCD_BREAKER_THRESHOLD.
+    """
+
+    name: str
+    deadline: float
+    breaker_threshold: int
+    breaker_reset: float
+    max_retries: int
+    retry_budget: float
+    hedge: bool
+    hedge_min_delay: float
+
+
+def _env(prefix: str, key: str, default: str) -> str:
+    return os.environ.get(f"{prefix}_{key}", default)
+
+
+def load_resilience_config(name: str) -> ResilienceConfig:
+    """
+    Builds the failure handling settings for an upstream from the environment.
+
+    Args:
+        name (str): The upstream name as listed in UPSTREAMS, e.g. 'xkcd'.
+
+    Returns:
+        ResilienceConfig: The resolved settings for the upstream.
+    """
+    if name not in UPSTREAMS:
+        raise ValueError(f"Service {name} is not supported.")
+    prefix, _ = UPSTREAMS[name]
+    return ResilienceConfig(
+        name=name,
+        deadline=float(_env(prefix, "DEADLINE", "5")),
+        breaker_threshold=int(_env(prefix, "BREAKER_THRESHOLD", "5")),
+        breaker_reset=float(_env(prefix, "BREAKER_RESET", "30")),
+        max_retries=int(_env(prefix, "MAX_RETRIES", "2")),
+        retry_budget=float(_env(prefix, "RETRY_BUDGET", "0.1")),
+        hedge=_env(prefix, "HEDGE", "false").lower() in ("1", "true", "yes"),
+        hedge_min_delay=float(_env(prefix, "HEDGE_MIN_DELAY", "0.05")),
+    )
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for `reset_timeout`
+    seconds. After that a single probe call is let through; its outcome closes the circuit
+    or opens it again.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    @property
+    def probing(self) -> bool:
+        return self._probing
+
+    def end_probe(self) -> None:
+        """
+        Lets another call probe when the probe ended without an outcome, e.g. because it
+        was cancelled. A no-op once its success or failure has been recorded.
+        """
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class RetryBudget:
+    """
+    Limits retries and hedges to a fraction of first attempts, so a struggling upstream
+    sees at most (1 + ratio) times its normal load. Every call deposits `ratio` tokens and
+    every extra attempt withdraws one.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of recent successful calls to estimate the p95 used as hedge delay.
+    """
+
+    def __init__(self, size: int = 512) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._p95: Optional[float] = None
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._p95 = None
+
+    def p95(self) -> Optional[float]:
+        if self._p95 is None and len(self._samples) >= 20:
+            ordered = sorted(self._samples)
+            self._p95 = ordered[int(len(ordered) * 0.95)]
+        return self._p95
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Timeouts, connection failures, 429 and 5xx mean the upstream is struggling. Other
+    errors, e.g. a 404 for a comic that does not exist, are answers and are not retried.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class ResilientUpstream:
+    """
+    Wraps calls to one upstream with a deadline, a circuit breaker, budgeted retries and
+    optionally a hedged second attempt when the first is slower than the recent p95.
+    """
+
+    def __init__(self, config: ResilienceConfig) -> None:
+        self.config = config
+        self.breaker = CircuitBreaker(config.breaker_threshold, config.breaker_reset)
+        self.budget = RetryBudget(config.retry_budget)
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.rejected = 0
+
+    async def _attempt(self, call: Callable[[], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(call(), self.config.deadline)
+        except asyncio.TimeoutError:
+            # Reported like the client's own timeouts, which callers already handle.
+            raise httpx.TimeoutException(
+                f"Upstream {self.config.name} did not answer within "
+                f"{self.config.deadline:g}s."
+            ) from None
+        self.latency.observe(time.monotonic() - start)
+        return result
+
+    async def _hedged(self, call: Callable[[], Awaitable[T]]) -> T:
+        p95 = self.latency.p95()
+        if p95 is None:
+            return await self._attempt(call)
+        pending = {asyncio.ensure_future(self._attempt(call))}
+        try:
+            done, _ = await asyncio.wait(
+                pending, timeout=max(p95, self.config.hedge_min_delay)
+            )
+            if not done and self.budget.withdraw():
+                self.hedges += 1
+                pending.add(asyncio.ensure_future(self._attempt(call)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                errors = [task.exception() for task in done]
+                for task, task_error in zip(done, errors):
+                    if task_error is None:
+                        return task.result()
+                    error = task_error
+            raise error
+        finally:
+            # Whichever attempt lost the race is abandoned.
+            for task in pending:
+                task.cancel()
+
+    async def call(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs an upstream call with the configured failure handling.
+
+        Args:
+            call (Callable[[], Awaitable[T]]): Performs one attempt. Must be idempotent when
+                retries or hedging are enabled.
+
+        Returns:
+            T: The result of the first successful attempt.
+
+        Raises:
+            CircuitOpenError: The upstream has been failing and is not called at all.
+            httpx.TimeoutException: The last attempt ran past the deadline.
+        """
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(self.config.name, self.breaker.retry_after())
+        probe = self.breaker.probing
+        try:
+            return await self._call(call)
+        finally:
+            if probe:
+                self.breaker.end_probe()
+
+    async def _call(self, call: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                if self.config.hedge:
+                    result = await self._hedged(call)
+                else:
+                    result = await self._attempt(call)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The upstream answered, so it is healthy.
+                    self.breaker.record_success()
+                    raise
+                was_closed = self.breaker.state == "closed"
+                self.breaker.record_failure()
+                if was_closed and self.breaker.state == "open":
+                    logger.warning(
+                        "Opening circuit for %s after %d failures",
+                        self.config.name,
+                        self.breaker.failures,
+                    )
+                if (
+                    attempt >= self.config.max_retries
+                    or not self.breaker.allow()
+                    or not self.budget.withdraw()
+                ):
+                    raise
+                attempt += 1
+                self.retries += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+
+_upstreams: Dict[str, ResilientUpstream] = {}
+
+
+def resilient_upstream(name: str) -> ResilientUpstream:
+    """
+    Returns the shared failure handling state for an upstream, creating it on first use.
+
+    Args:
+        name (str): The upstream name as listed in UPSTREAMS, e.g. 'xkcd'.
+
+    Returns:
+        ResilientUpstream: The app-scoped breaker, retry budget and latency tracker.
+    """
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        upstream = _upstreams[name] = ResilientUpstream(load_resilience_config(name))
+    return upstream
+
+
+def upstream_stats() -> Dict[str, Dict[str, object]]:
+    """
+    Returns the breaker state and call counters of every upstream, keyed by upstream name.
+    """
+    return {
+        name: {
+            "state": upstream.breaker.state,
+            "calls": upstream.calls,
+            "retries": upstream.retries,
+            "hedges": upstream.hedges,
+            "rejected": upstream.rejected,
+        }
+        for name, upstream in _upstreams.items()
+    }
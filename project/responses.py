@@ -0,0 +1,27 @@
+from typing import Any, Dict, Optional
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+
+class ORJSONModelResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    Route handlers return their pydantic models wrapped in this response. FastAPI skips
+    response_model processing for Response instances, so each model is serialized exactly
+    once instead of being re-validated against response_model and run through
+    jsonable_encoder first. response_model stays on the routes for the OpenAPI schema.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            content = content.dict()
+        return orjson.dumps(content)
+
+
+def model_response(
+    model: BaseModel, status_code: int = 200, headers: Optional[Dict[str, str]] = None
+) -> ORJSONModelResponse:
+    return ORJSONModelResponse(model, status_code=status_code, headers=headers)
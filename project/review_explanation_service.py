@@ -1,7 +1,10 @@
 import prisma
+import prisma.enums
 import prisma.models
 from pydantic import BaseModel
 
+from project.get_comic_explanation_service import invalidate_explanation
+
 
 class ReviewExplanationResponse(BaseModel):
     """
@@ -27,11 +30,17 @@ async def review_explanation(
     Returns:
     ReviewExplanationResponse: Acknowledges the review action taken by the moderator, including an update on the explanation status.
     """
+    status = (
+        prisma.enums.ExplanationStatus.APPROVED
+        if approvalStatus
+        else prisma.enums.ExplanationStatus.REJECTED
+    )
     explanation = await prisma.models.Explanation.prisma().update(
         where={"id": explanationId},
-        data={"approvalStatus": approvalStatus, "reviewComment": reviewComment},
+        data={"status": status, "reviewComment": reviewComment},
     )
     if explanation:
+        invalidate_explanation(explanation.comicId)
         message = "Approval" if approvalStatus else "Rejection"
         return ReviewExplanationResponse(
             explanationId=explanation.id,
@@ -0,0 +1,75 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from project.search_index import search_index
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_QUERY_LENGTH = 200
+
+
+class SearchResult(BaseModel):
+    """
+    A comic matching a search query, with its relevance score.
+    """
+
+    comicId: str
+    num: int
+    title: str
+    img_url: str
+    score: float
+
+
+class SearchResponse(BaseModel):
+    """
+    One page of search results, best match first.
+    """
+
+    query: str
+    total: int
+    offset: int
+    results: List[SearchResult]
+
+
+async def search_comics(
+    q: str, limit: int = DEFAULT_SEARCH_LIMIT, offset: int = 0
+) -> SearchResponse:
+    """
+    Endpoint to find comics by words in their title, alt text or explanation.
+
+    Queries are answered from the in-process search index with BM25 ranking, the last
+    word of the query also matches as a prefix.
+
+    Args:
+        q (str): The search query.
+        limit (int): Maximum number of results to return.
+        offset (int): Number of results to skip, for pagination.
+
+    Returns:
+        SearchResponse: The matching comics, the total number of matches and the offset.
+    """
+    q = q.strip()
+    if not q:
+        raise ValueError("The search query must not be empty.")
+    if len(q) > MAX_QUERY_LENGTH:
+        raise ValueError(f"The search query must be at most {MAX_QUERY_LENGTH} characters.")
+    if offset < 0:
+        raise ValueError("The offset must not be negative.")
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    total, hits = search_index.search(q, limit, offset)
+    return SearchResponse(
+        query=q,
+        total=total,
+        offset=offset,
+        results=[
+            SearchResult(
+                comicId=hit.comic.id,
+                num=hit.comic.number,
+                title=hit.comic.title,
+                img_url=hit.comic.imageUrl,
+                score=round(hit.score, 4),
+            )
+            for hit in hits
+        ],
+    )
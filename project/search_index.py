@@ -0,0 +1,290 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+
+from project.comic_catalog import comic_catalog
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+# A query term found in the title counts three times as much as one in the explanation.
+FIELD_WEIGHTS = {"title": 3.0, "alt": 1.5, "explanation": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# The last query word also matches longer terms starting with it, as typed so far. Only
+# the most common of those terms are searched.
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 8
+# Words found in more than this share of comics add little to the ranking. When the query
+# has rarer words they only score the comics those matched, instead of every comic.
+COMMON_TERM_RATIO = 0.3
+REFRESH_BATCH_SIZE = 500
+
+CURRENT_EXPLANATIONS_SQL = (
+    'SELECT DISTINCT ON ("comicId") "comicId", "text" FROM "Explanation" '
+    "WHERE \"status\" = 'APPROVED' ORDER BY \"comicId\", \"createdAt\" DESC"
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+@dataclass
+class SearchHit:
+    comic: prisma.models.Comic
+    score: float
+
+
+class SearchIndex:
+    """
+    In-memory inverted index over comic titles, alt text and current explanations.
+
+    Each comic is one document. Postings map a term to the field-weighted term frequency
+    of every document containing it, and documents are ranked with BM25. The vocabulary is
+    also kept sorted, so prefix matches are a bisect away. Documents are replaced in place
+    when a comic is synced or its explanation changes, so the index never needs a rebuild.
+    """
+
+    def __init__(self) -> None:
+        self._comics: List[prisma.models.Comic] = []
+        self._docs: Dict[str, int] = {}
+        self._fields: List[Dict[str, str]] = []
+        self._doc_terms: List[Dict[str, float]] = []
+        self._doc_lengths: List[float] = []
+        self._total_length = 0.0
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._terms: List[str] = []
+        # BM25 length normalisation per document, recomputed after documents change.
+        self._norms: Optional[List[float]] = None
+        self._bulk_loading = False
+        self._stale: Set[str] = set()
+        self._loaded = asyncio.Event()
+        self._refresh_task: Optional["asyncio.Task[None]"] = None
+
+    def __len__(self) -> int:
+        return len(self._comics)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._terms)
+
+    def _index(self, doc: int, fields: Dict[str, str]) -> None:
+        for term in self._doc_terms[doc]:
+            postings = self._postings[term]
+            del postings[doc]
+            if not postings:
+                del self._postings[term]
+                if not self._bulk_loading:
+                    del self._terms[bisect.bisect_left(self._terms, term)]
+        weights: Dict[str, float] = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for term, count in Counter(tokenize(text)).items():
+                weights[term] = weights.get(term, 0.0) + weight * count
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if not self._bulk_loading:
+                    bisect.insort(self._terms, term)
+            postings[doc] = weight
+        length = sum(weights.values())
+        self._total_length += length - self._doc_lengths[doc]
+        self._doc_lengths[doc] = length
+        self._doc_terms[doc] = weights
+        self._fields[doc] = fields
+        self._norms = None
+
+    def _document_norms(self) -> List[float]:
+        if self._norms is None:
+            average_length = self._total_length / len(self._comics) or 1.0
+            self._norms = [
+                BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                for length in self._doc_lengths
+            ]
+        return self._norms
+
+    def add_comic(
+        self, comic: prisma.models.Comic, explanation: Optional[str] = None
+    ) -> None:
+        """
+        Indexes a comic, or re-indexes its title and alt text. The explanation is kept
+        unless a new one is given.
+        """
+        doc = self._docs.get(comic.id)
+        if doc is None:
+            doc = self._docs[comic.id] = len(self._comics)
+            self._comics.append(comic)
+            self._fields.append({})
+            self._doc_terms.append({})
+            self._doc_lengths.append(0.0)
+        self._comics[doc] = comic
+        if explanation is None:
+            explanation = self._fields[doc].get("explanation", "")
+        self._index(
+            doc, {"title": comic.title, "alt": comic.altText, "explanation": explanation}
+        )
+
+    def set_explanation(self, comic_id: str, explanation: str) -> None:
+        doc = self._docs.get(comic_id)
+        if doc is not None:
+            self._index(doc, {**self._fields[doc], "explanation": explanation})
+
+    def _expand(self, token: str, prefix: bool) -> List[str]:
+        if not prefix or len(token) < MIN_PREFIX_LENGTH:
+            return [token] if token in self._postings else []
+        start = bisect.bisect_left(self._terms, token)
+        end = bisect.bisect_left(self._terms, token + "\U0010ffff", start)
+        # While bulk loading the vocabulary can lag behind the postings.
+        terms = heapq.nlargest(
+            MAX_PREFIX_EXPANSIONS,
+            (term for term in self._terms[start:end] if term in self._postings),
+            key=lambda term: len(self._postings[term]),
+        )
+        # The word as typed may already be complete.
+        if token in self._postings and token not in terms:
+            terms.append(token)
+        return terms
+
+    def search(
+        self, query: str, limit: int, offset: int = 0
+    ) -> Tuple[int, List[SearchHit]]:
+        """
+        Ranks the comics matching any word of the query, or any of its rarer words when it
+        also has common ones.
+
+        Args:
+            query (str): Free text. The last word also matches as a prefix.
+            limit (int): Maximum number of hits to return.
+            offset (int): Number of top hits to skip, for pagination.
+
+        Returns:
+            Tuple[int, List[SearchHit]]: The number of matching comics and the requested page of hits, best first.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self._comics:
+            return 0, []
+        documents = len(self._comics)
+        norms = self._document_norms()
+        groups = [
+            [self._postings[term] for term in self._expand(token, prefix=last)]
+            for token, last in zip(tokens, [False] * (len(tokens) - 1) + [True])
+        ]
+        common = [
+            all(len(postings) > COMMON_TERM_RATIO * documents for postings in group)
+            for group in groups
+        ]
+        if all(common):
+            common = [False] * len(groups)
+        scores: Dict[int, float] = {}
+        # Rare words first, so common ones can be restricted to the comics they matched.
+        for group, is_common in sorted(zip(groups, common), key=lambda item: item[1]):
+            # A document matching several expansions of one word scores its best one.
+            token_scores: Dict[int, float] = {}
+            for postings in group:
+                matches = len(postings)
+                idf = math.log(1 + (documents - matches + 0.5) / (matches + 0.5))
+                boost = idf * (BM25_K1 + 1)
+                if is_common:
+                    candidates = (
+                        (doc, postings[doc]) for doc in scores if doc in postings
+                    )
+                else:
+                    candidates = postings.items()
+                for doc, frequency in candidates:
+                    score = boost * frequency / (frequency + norms[doc])
+                    if score > token_scores.get(doc, 0.0):
+                        token_scores[doc] = score
+            for doc, score in token_scores.items():
+                scores[doc] = scores.get(doc, 0.0) + score
+        top = heapq.nlargest(
+            offset + limit, scores.items(), key=lambda item: (item[1], -item[0])
+        )
+        return len(scores), [
+            SearchHit(self._comics[doc], score) for doc, score in top[offset:]
+        ]
+
+    async def load(self) -> int:
+        """
+        Indexes every comic in the catalog with its current explanation. Runs once the
+        catalog has been loaded.
+
+        Returns:
+            int: The number of indexed comics.
+        """
+        try:
+            rows = await prisma.get_client().query_raw(CURRENT_EXPLANATIONS_SQL)
+            explanations = {row["comicId"]: row["text"] for row in rows}
+            # The vocabulary is sorted once at the end instead of on every new term.
+            self._bulk_loading = True
+            for count, comic in enumerate(list(comic_catalog), 1):
+                self.add_comic(comic, explanations.get(comic.id, ""))
+                if count % 50 == 0:
+                    # Indexing is CPU bound, let requests through between chunks.
+                    await asyncio.sleep(0)
+        finally:
+            self._terms = sorted(self._postings)
+            self._bulk_loading = False
+            # Explanation changes seen meanwhile are applied from here on.
+            self._loaded.set()
+        return len(self)
+
+    def explanation_changed(self, comic_id: str) -> None:
+        """
+        Schedules a comic's current explanation to be re-read and re-indexed.
+        """
+        self._stale.add(comic_id)
+        if self._refresh_task is None or self._refresh_task.done():
+            try:
+                self._refresh_task = asyncio.get_running_loop().create_task(
+                    self._refresh()
+                )
+            except RuntimeError:
+                # No event loop, nothing is being served.
+                pass
+
+    async def _refresh(self) -> None:
+        await self._loaded.wait()
+        while self._stale:
+            comic_ids = list(self._stale)[:REFRESH_BATCH_SIZE]
+            self._stale.difference_update(comic_ids)
+            try:
+                explanations = await prisma.models.Explanation.prisma().find_many(
+                    where={
+                        "comicId": {"in": comic_ids},
+                        "status": prisma.enums.ExplanationStatus.APPROVED,
+                    },
+                    order={"createdAt": "desc"},
+                )
+            except Exception:
+                logger.warning(
+                    "Failed to re-index %d explanations", len(comic_ids), exc_info=True
+                )
+                continue
+            texts: Dict[str, str] = {}
+            for explanation in explanations:
+                texts.setdefault(explanation.comicId, explanation.text)
+            for comic_id in comic_ids:
+                self.set_explanation(comic_id, texts.get(comic_id, ""))
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+
+
+search_index = SearchIndex()
@@ -1,58 +1,320 @@
+import asyncio
 import logging
+import math
 from contextlib import asynccontextmanager
-from typing import List
+from typing import List, Optional
 
+import httpx
+import project.bulk_review_explanations_service
+import project.bulk_transfer_service
 import project.fetch_external_api_data_service
 import project.flag_explanation_for_review_service
+import project.generate_explanation_service
+import project.get_comic_batch_service
+import project.get_comic_by_number_service
 import project.get_comic_explanation_service
+import project.get_comic_image_service
+import project.get_explanation_batch_service
+import project.get_moderation_queue_service
+import project.get_popular_comics_service
 import project.get_random_comic_service
+import project.get_similar_comics_service
 import project.get_user_preferences_service
+import project.get_user_recommendations_service
+import project.http_caching
 import project.review_explanation_service
+import project.search_comics_service
 import project.set_language_preference_service
+import project.stream_comic_explanation_service
 import project.update_user_preferences_service
-from fastapi import FastAPI
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import Response
-from prisma import Prisma
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import ValidationError
+from project.admission import (
+    AdmissionMiddleware,
+    OverloadedError,
+    admission,
+    upstream_concurrency_stats,
+)
+from project.cache import cache_stats
+from project.comic_catalog import comic_catalog
+from project.comic_sync import comic_sync_job
+from project.db import InstrumentedPrisma
+from project.explanation_pipeline import explanation_pipeline
+from project.http_client import close_http_clients, start_http_clients
+from project.image_cache import image_cache
+from project.latest_comic_number import latest_comic_number
+from project.metrics import CallbackMetric, MetricsMiddleware, registry
+from project.popularity import popularity
+from project.recommendations import co_view_model
+from project.resilience import CircuitOpenError, upstream_stats
+from project.responses import ORJSONModelResponse, model_response
+from project.search_index import search_index
+from project.shared_cache import close_shared_cache, get_shared_cache
+from project.view_recorder import view_recorder
+from project.warmup import readiness, warm_up
 
 logger = logging.getLogger(__name__)
 
-db_client = Prisma(auto_register=True)
+db_client = InstrumentedPrisma(auto_register=True)
+
+CallbackMetric(
+    "cache_events_total",
+    "Hits, stale hits, misses, coalesced loads and evictions of in-process caches.",
+    "counter",
+    ("cache", "event"),
+    lambda: {
+        (name, event): value
+        for name, stats in cache_stats().items()
+        for event, value in stats.items()
+        if event != "entries"
+    },
+)
+CallbackMetric(
+    "cache_entries",
+    "Number of entries held by each in-process cache.",
+    "gauge",
+    ("cache",),
+    lambda: {(name,): stats["entries"] for name, stats in cache_stats().items()},
+)
+CallbackMetric(
+    "image_cache_events_total",
+    "Hits, misses and evictions of the on-disk image cache.",
+    "counter",
+    ("event",),
+    lambda: {
+        ("hit",): image_cache.hits,
+        ("miss",): image_cache.misses,
+        ("eviction",): image_cache.evictions,
+    },
+)
+CallbackMetric(
+    "queue_depth",
+    "Items waiting in background work queues.",
+    "gauge",
+    ("queue",),
+    lambda: {
+        ("views",): view_recorder.queue_depth,
+        ("explanations",): explanation_pipeline.queue_depth,
+        ("explanations_in_flight",): explanation_pipeline.in_flight,
+    },
+)
+CallbackMetric(
+    "upstream_circuit_open",
+    "1 while an upstream's circuit breaker rejects calls, 0.5 while probing, else 0.",
+    "gauge",
+    ("upstream",),
+    lambda: {
+        (name,): {"closed": 0, "half_open": 0.5, "open": 1}[stats["state"]]
+        for name, stats in upstream_stats().items()
+    },
+)
+CallbackMetric(
+    "upstream_calls_total",
+    "Upstream calls, budgeted retries, hedged attempts and calls rejected by the breaker.",
+    "counter",
+    ("upstream", "kind"),
+    lambda: {
+        (name, kind): stats[kind]
+        for name, stats in upstream_stats().items()
+        for kind in ("calls", "retries", "hedges", "rejected")
+    },
+)
+CallbackMetric(
+    "shared_cache_events_total",
+    "Hits, misses, writes, evictions and errors of the host-wide cache shared by workers.",
+    "counter",
+    ("event",),
+    lambda: {
+        (event,): getattr(shared_cache, event)
+        for shared_cache in filter(None, [get_shared_cache()])
+        for event in ("hits", "misses", "writes", "evictions", "errors")
+    },
+)
+CallbackMetric(
+    "search_index_size",
+    "Comics and distinct terms in the in-process search index.",
+    "gauge",
+    ("kind",),
+    lambda: {
+        ("documents",): len(search_index),
+        ("terms",): search_index.vocabulary_size,
+    },
+)
+CallbackMetric(
+    "co_view_model_size",
+    "Comics and users in the co-view model, and the views folded in since it was built.",
+    "gauge",
+    ("kind",),
+    lambda: {
+        ("comics",): co_view_model.items,
+        ("users",): co_view_model.users,
+        ("updates",): co_view_model.updates,
+    },
+)
+CallbackMetric(
+    "admission_requests_total",
+    "Requests admitted, and shed by client rate, route rate or upstream concurrency.",
+    "counter",
+    ("route", "outcome"),
+    admission.stats,
+)
+CallbackMetric(
+    "admission_upstream_requests",
+    "Requests holding or waiting for an upstream's concurrency slots.",
+    "gauge",
+    ("upstream", "state"),
+    lambda: {
+        key: value
+        for name, active, waiting in upstream_concurrency_stats()
+        for key, value in (((name, "active"), active), ((name, "waiting"), waiting))
+    },
+)
+CallbackMetric(
+    "startup_phase_seconds",
+    "Duration of each startup and warm-up phase; 'ready' is the time until ready.",
+    "gauge",
+    ("phase",),
+    lambda: {(phase,): seconds for phase, seconds in readiness.phases.items()},
+)
+CallbackMetric(
+    "view_events_total",
+    "Comic view events by outcome.",
+    "counter",
+    ("outcome",),
+    lambda: {
+        ("recorded",): view_recorder.recorded,
+        ("dropped",): view_recorder.dropped,
+        ("flushed",): view_recorder.flushed,
+        ("failed",): view_recorder.failed,
+        ("rejected",): view_recorder.rejected,
+    },
+)
+CallbackMetric(
+    "explanations_total",
+    "Explanations produced by the generation pipeline by outcome.",
+    "counter",
+    ("outcome",),
+    lambda: {
+        ("generated",): explanation_pipeline.generated,
+        ("failed",): explanation_pipeline.failed,
+    },
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    readiness.record("import", readiness.uptime())
     await db_client.connect()
+    await start_http_clients()
+    readiness.record("connect", readiness.uptime() - readiness.phases["import"])
+    latest_comic_number.start()
+    comic_sync_job.start()
+    explanation_pipeline.start()
+    view_recorder.add_listener(co_view_model.observe)
+    view_recorder.add_listener(popularity.observe)
+    view_recorder.start()
+    popularity.start()
+    # Requests are accepted from here on; /readyz reports ready once warm-up is done.
+    warm_up_task = asyncio.create_task(warm_up())
     yield
+    readiness.ready = False
+    readiness.draining = True
+    warm_up_task.cancel()
+    await search_index.stop()
+    await view_recorder.stop()
+    await co_view_model.stop()
+    await popularity.stop()
+    await explanation_pipeline.stop()
+    await comic_sync_job.stop()
+    await latest_comic_number.stop()
+    await close_http_clients()
     await db_client.disconnect()
+    await close_shared_cache()
 
 
 app = FastAPI(
     title="horser",
     lifespan=lifespan,
+    default_response_class=ORJSONModelResponse,
     description="Based on the details provided in our conversation and the research conducted, the final product is a web application designed to fetch and display a random xkcd comic every time it is called. The application utilizes GPT-4-vision to provide detailed explanations of the comics, which often delve into complex or scientific principles that are represented in a humorous and accessible manner. Specifically, the application is built with the following technology stack:\n\n- **Programming Language**: Python, chosen for its widespread use in both web development and machine learning, making it the perfect fit for integrating the GPT-4-vision API for comic explanations.\n- **API Framework**: FastAPI, selected for its high performance and easy-to-use features for building APIs. FastAPI's asynchronous support is ideal for handling requests to the xkcd API and GPT-4-vision API efficiently.\n- **Database**: PostgreSQL, used for storing metadata about the comics and user preferences if needed. Its reliability and powerful features support complex queries efficiently.\n- **ORM**: Prisma, to facilitate easy and secure interactions with the database using Python. Prisma provides type-safe database access, simplifying data manipulation and queries.\n\nThe application flow is as follows:\n1. The user accesses the web application.\n2. The application calls the xkcd API to fetch a random comic by generating a random number within the range of available comics and using the specific URL 'https://xkcd.com/[random_number]/info.0.json'.\n3. The comic, along with its image URL, title, and number, is displayed to the user.\n4. To provide an explanation, the application sends the comic's image URL to the GPT-4-vision API, along with a prompt to generate a detailed explanation of the comic.\n5. The GPT-4-vision API processes the image and returns a comprehensive explanation, which is then displayed to the user beneath the comic.\n\nThis tool addresses the user's requirements for a simple, intuitive interface that is accessible cloud-based for scalability and ease of access. It also meets the need for detailed explanations of xkcd comics, enhancing the appreciation and understanding of each piece.",
 )
+# FastAPI 0.75 accepts but ignores the lifespan argument, so install it on the router.
+app.router.lifespan_context = lifespan
+# Added first so it runs inside the metrics middleware, which then also times rejections.
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(ValueError)
+async def value_error_handler(request: Request, exc: ValueError) -> Response:
+    # Services raise ValueError for bad input. A pydantic ValidationError is also a
+    # ValueError, but one raised while building a response is a server bug.
+    if isinstance(exc, ValidationError):
+        return await unhandled_error_handler(request, exc)
+    return ORJSONModelResponse({"error": str(exc)}, status_code=400)
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError) -> Response:
+    return ORJSONModelResponse(
+        {"error": str(exc)},
+        status_code=503,
+        headers={"retry-after": str(max(1, round(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError) -> Response:
+    return ORJSONModelResponse(
+        {"error": str(exc)},
+        status_code=503,
+        headers={"retry-after": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(httpx.TransportError)
+async def upstream_error_handler(
+    request: Request, exc: httpx.TransportError
+) -> Response:
+    # An upstream that timed out or could not be reached is not a bug of this service.
+    logger.warning("Upstream request failed: %s", exc)
+    status_code = 504 if isinstance(exc, httpx.TimeoutException) else 502
+    return ORJSONModelResponse({"error": str(exc)}, status_code=status_code)
+
+
+@app.exception_handler(Exception)
+async def unhandled_error_handler(request: Request, exc: Exception) -> Response:
+    logger.exception("Error processing request", exc_info=exc)
+    return ORJSONModelResponse({"error": str(exc)}, status_code=500)
 
 
 @app.get(
     "/comic/random", response_model=project.get_random_comic_service.RandomComicResponse
 )
-async def api_get_get_random_comic() -> project.get_random_comic_service.RandomComicResponse | Response:
+async def api_get_get_random_comic(
+    user_id: Optional[str] = None,
+) -> Response:
     """
     Endpoint for fetching a random comic from xkcd and displaying its information.
     """
-    try:
-        res = await project.get_random_comic_service.get_random_comic()
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    res = await project.get_random_comic_service.get_random_comic(user_id)
+    return model_response(res)
+
+
+@app.get(
+    "/comic/popular",
+    response_model=project.get_popular_comics_service.PopularComicsResponse,
+)
+async def api_get_get_popular_comics(
+    window: str = "day",
+    limit: int = project.get_popular_comics_service.DEFAULT_POPULAR_LIMIT,
+) -> Response:
+    """
+    Endpoint for fetching the most viewed comics of the current hour, day or week.
+    """
+    res = await project.get_popular_comics_service.get_popular_comics(window, limit)
+    return model_response(res)
 
 
 @app.post(
@@ -61,24 +323,14 @@ async def api_get_get_random_comic() -> project.get_random_comic_service.RandomC
 )
 async def api_post_flag_explanation_for_review(
     explanationId: str,
-) -> project.flag_explanation_for_review_service.FlagExplanationForReviewResponse | Response:
+) -> Response:
     """
     Submit an explanation for manual review.
     """
-    try:
-        res = await project.flag_explanation_for_review_service.flag_explanation_for_review(
-            explanationId
-        )
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    res = await project.flag_explanation_for_review_service.flag_explanation_for_review(
+        explanationId
+    )
+    return model_response(res)
 
 
 @app.put(
@@ -87,24 +339,45 @@ async def api_post_flag_explanation_for_review(
 )
 async def api_put_update_user_preferences(
     userId: str, language: str, favorite_comics: List[str]
-) -> project.update_user_preferences_service.UpdateUserPreferencesResponse | Response:
+) -> Response:
     """
     Endpoint to update user preferences.
     """
-    try:
-        res = await project.update_user_preferences_service.update_user_preferences(
-            userId, language, favorite_comics
-        )
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    res = await project.update_user_preferences_service.update_user_preferences(
+        userId, language, favorite_comics
+    )
+    return model_response(res)
+
+
+@app.get(
+    "/moderation/queue",
+    response_model=project.get_moderation_queue_service.ModerationQueueResponse,
+)
+async def api_get_get_moderation_queue(
+    limit: int = project.get_moderation_queue_service.DEFAULT_QUEUE_LIMIT,
+    cursor: Optional[str] = None,
+) -> Response:
+    """
+    Endpoint for moderators to page through explanations waiting for review.
+    """
+    res = await project.get_moderation_queue_service.get_moderation_queue(limit, cursor)
+    return model_response(res)
+
+
+@app.post(
+    "/moderation/review",
+    response_model=project.bulk_review_explanations_service.BulkReviewResponse,
+)
+async def api_post_bulk_review_explanations(
+    request: project.bulk_review_explanations_service.BulkReviewRequest,
+) -> Response:
+    """
+    Endpoint for moderators to approve or reject many explanations in one transaction.
+    """
+    res = await project.bulk_review_explanations_service.bulk_review_explanations(
+        request.explanationIds, request.approvalStatus, request.reviewComment
+    )
+    return model_response(res)
 
 
 @app.put(
@@ -113,24 +386,14 @@ async def api_put_update_user_preferences(
 )
 async def api_put_review_explanation(
     explanationId: str, approvalStatus: bool, reviewComment: str
-) -> project.review_explanation_service.ReviewExplanationResponse | Response:
+) -> Response:
     """
     Endpoint for moderators to review and approve or reject explanations.
     """
-    try:
-        res = await project.review_explanation_service.review_explanation(
-            explanationId, approvalStatus, reviewComment
-        )
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    res = await project.review_explanation_service.review_explanation(
+        explanationId, approvalStatus, reviewComment
+    )
+    return model_response(res)
 
 
 @app.get(
@@ -139,22 +402,42 @@ async def api_put_review_explanation(
 )
 async def api_get_get_user_preferences(
     user_id: str,
-) -> project.get_user_preferences_service.UserPreferencesResponse | Response:
+    limit: int = project.get_user_preferences_service.DEFAULT_FAVORITES_LIMIT,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
     """
     Endpoint to retrieve the current user preferences.
     """
-    try:
-        res = await project.get_user_preferences_service.get_user_preferences(user_id)
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    res = await project.get_user_preferences_service.get_user_preferences(
+        user_id, limit, cursor
+    )
+    headers = project.http_caching.validators(
+        project.http_caching.strong_etag(
+            res.language, res.next_cursor, *res.favorite_comics
+        ),
+        project.http_caching.PREFERENCES_CACHE_CONTROL,
+    )
+    return project.http_caching.not_modified(if_none_match, headers) or model_response(
+        res, headers=headers
+    )
+
+
+@app.get(
+    "/user/recommendations",
+    response_model=project.get_user_recommendations_service.UserRecommendationsResponse,
+)
+async def api_get_get_user_recommendations(
+    user_id: str,
+    limit: int = project.get_similar_comics_service.DEFAULT_RECOMMENDATION_LIMIT,
+) -> Response:
+    """
+    Endpoint for fetching comics a user has not viewed but is likely to enjoy.
+    """
+    res = await project.get_user_recommendations_service.get_user_recommendations(
+        user_id, limit
+    )
+    return model_response(res)
 
 
 @app.get(
@@ -163,22 +446,48 @@ async def api_get_get_user_preferences(
 )
 async def api_get_get_comic_explanation(
     comicId: str,
-) -> project.get_comic_explanation_service.GetComicExplanationResponseModel | Response:
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
     """
     Endpoint to retrieve a generated explanation for a specific comic.
     """
-    try:
-        res = await project.get_comic_explanation_service.get_comic_explanation(comicId)
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    res = await project.get_comic_explanation_service.get_comic_explanation(comicId)
+    # Hashes the text too, as a review or an import can change a row in place.
+    headers = project.http_caching.validators(
+        project.http_caching.strong_etag(
+            res.comicId, res.generatedBy, res.createdAt, res.explanation
+        ),
+        project.http_caching.EXPLANATION_CACHE_CONTROL,
+    )
+    return project.http_caching.not_modified(if_none_match, headers) or model_response(
+        res, headers=headers
+    )
+
+
+@app.get("/explanation/{comicId}/stream", response_class=StreamingResponse)
+async def api_get_stream_comic_explanation(
+    comicId: str, format: str = "sse"
+) -> StreamingResponse:
+    """
+    Endpoint to receive a comic's explanation as it is written, as server-sent events
+    (format=sse) or newline-delimited JSON (format=ndjson).
+    """
+    media_type = project.stream_comic_explanation_service.STREAM_FORMATS.get(format)
+    if media_type is None:
+        raise ValueError("Format must be one of sse, ndjson.")
+    events = await project.stream_comic_explanation_service.stream_comic_explanation(
+        comicId
+    )
+    body = (
+        project.stream_comic_explanation_service.encode_event(event, format)
+        async for event in events
+    )
+    # Ask proxies not to buffer, or viewers would only see the text once it is complete.
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
 
 
 @app.put(
@@ -187,24 +496,14 @@ async def api_get_get_comic_explanation(
 )
 async def api_put_set_language_preference(
     user_id: str, language: str
-) -> project.set_language_preference_service.SetLanguagePreferenceResponse | Response:
+) -> Response:
     """
     Endpoint for users to update their language preference.
     """
-    try:
-        res = await project.set_language_preference_service.set_language_preference(
-            user_id, language
-        )
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    res = await project.set_language_preference_service.set_language_preference(
+        user_id, language
+    )
+    return model_response(res)
 
 
 @app.get(
@@ -213,21 +512,213 @@ async def api_put_set_language_preference(
 )
 async def api_get_fetch_external_api_data(
     serviceName: str, action: str
-) -> project.fetch_external_api_data_service.FetchExternalAPIDataResponse | Response:
+) -> Response:
     """
     Generalized endpoint for fetching data from the xkcd API or GPT-4-vision with caching.
     """
-    try:
-        res = await project.fetch_external_api_data_service.fetch_external_api_data(
-            serviceName, action
-        )
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    res = await project.fetch_external_api_data_service.fetch_external_api_data(
+        serviceName, action
+    )
+    return model_response(res)
+
+
+@app.post(
+    "/explanation/generate-all",
+    status_code=202,
+    response_model=project.generate_explanation_service.GenerateAllExplanationsResponse,
+)
+async def api_post_generate_all_explanations() -> Response:
+    """
+    Queue every comic in the catalog that does not have an explanation yet.
+    """
+    res = await project.generate_explanation_service.generate_all_explanations()
+    return model_response(res, status_code=202)
+
+
+@app.post(
+    "/explanation/{comicId}/generate",
+    status_code=202,
+    response_model=project.generate_explanation_service.GenerateExplanationResponse,
+)
+async def api_post_generate_explanation(
+    comicId: str,
+) -> Response:
+    """
+    Queue a comic for explanation by the vision model.
+    """
+    res = await project.generate_explanation_service.generate_explanation(comicId)
+    return model_response(res, status_code=202)
+
+
+@app.post(
+    "/comic/batch",
+    response_model=project.get_comic_batch_service.ComicBatchResponse,
+)
+async def api_post_get_comic_batch(
+    request: project.get_comic_batch_service.ComicBatchRequest,
+) -> Response:
+    """
+    Endpoint for fetching several comics by number in one round trip.
+    """
+    res = await project.get_comic_batch_service.get_comic_batch(request.numbers)
+    return model_response(res)
+
+
+@app.post(
+    "/explanation/batch",
+    response_model=project.get_explanation_batch_service.ExplanationBatchResponse,
+)
+async def api_post_get_explanation_batch(
+    request: project.get_explanation_batch_service.ExplanationBatchRequest,
+) -> Response:
+    """
+    Endpoint for fetching the current explanations of several comics in one round trip.
+    """
+    res = await project.get_explanation_batch_service.get_explanation_batch(
+        request.comicIds
+    )
+    return model_response(res)
+
+
+@app.get(
+    "/search",
+    response_model=project.search_comics_service.SearchResponse,
+)
+async def api_get_search_comics(
+    q: str,
+    limit: int = project.search_comics_service.DEFAULT_SEARCH_LIMIT,
+    offset: int = 0,
+) -> Response:
+    """
+    Endpoint to find comics by words in their title, alt text or explanation.
+    """
+    res = await project.search_comics_service.search_comics(q, limit, offset)
+    return model_response(res)
+
+
+@app.get(
+    "/comic/{number}",
+    response_model=project.get_random_comic_service.RandomComicResponse,
+)
+async def api_get_get_comic_by_number(
+    number: int,
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """
+    Endpoint for fetching a specific comic by its number.
+    """
+    headers = project.http_caching.validators(
+        project.http_caching.strong_etag("comic", number),
+        project.http_caching.IMMUTABLE_CACHE_CONTROL,
+    )
+    # Published comics are immutable, so a matching client copy needs no lookup at all.
+    not_modified = project.http_caching.not_modified(if_none_match, headers)
+    if not_modified:
+        return not_modified
+    res = await project.get_comic_by_number_service.get_comic_by_number(number)
+    return model_response(res, headers=headers)
+
+
+@app.get(
+    "/comic/{number}/similar",
+    response_model=project.get_similar_comics_service.SimilarComicsResponse,
+)
+async def api_get_get_similar_comics(
+    number: int,
+    limit: int = project.get_similar_comics_service.DEFAULT_RECOMMENDATION_LIMIT,
+) -> Response:
+    """
+    Endpoint for fetching the comics most often viewed by the viewers of a comic.
+    """
+    res = await project.get_similar_comics_service.get_similar_comics(number, limit)
+    return model_response(res)
+
+
+@app.get("/comic/{number}/image", response_class=Response)
+async def api_get_get_comic_image(
+    number: int,
+    range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """
+    Endpoint for serving a comic's image from the local image cache.
+    """
+    return await project.get_comic_image_service.get_comic_image(
+        number, range, if_none_match
+    )
+
+
+@app.get("/export/{model}", response_class=StreamingResponse)
+async def api_get_export_records(
+    model: str, after: Optional[str] = None, gzip: bool = False
+) -> StreamingResponse:
+    """
+    Endpoint for exporting every comic, explanation or view as newline-delimited JSON,
+    gzip compressed with gzip=true.
+    """
+    body = await project.bulk_transfer_service.export_records(model, after)
+    headers = {"cache-control": "no-store"}
+    if gzip:
+        body = project.bulk_transfer_service.gzip_chunks(body)
+        headers["content-encoding"] = "gzip"
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+
+@app.post(
+    "/import/{model}",
+    response_model=project.bulk_transfer_service.ImportResponse,
+)
+async def api_post_import_records(
+    model: str,
+    request: Request,
+    content_encoding: Optional[str] = Header(None),
+) -> Response:
+    """
+    Endpoint for upserting comics, explanations or views from newline-delimited JSON, as
+    written by the export. Send Content-Encoding: gzip for a compressed body.
+    """
+    res = await project.bulk_transfer_service.import_records(
+        model, request.stream(), gzipped=(content_encoding or "").lower() == "gzip"
+    )
+    return model_response(res)
+
+
+@app.get("/cache/stats")
+async def api_get_cache_stats() -> dict:
+    """
+    Hit, miss and eviction counters for every in-process cache.
+    """
+    return cache_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def api_get_metrics() -> Response:
+    """
+    Request, upstream, database, cache and queue metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/healthz")
+async def api_get_healthz() -> Response:
+    """
+    Liveness probe: the process is up and its event loop is serving requests.
+    """
+    return ORJSONModelResponse({"status": "ok", "uptime": readiness.uptime()})
+
+
+@app.get("/readyz")
+async def api_get_readyz() -> Response:
+    """
+    Readiness probe: 200 once warm-up has finished, 503 while warming up or draining.
+    """
+    if readiness.ready:
+        status, status_code = "ready", 200
+    else:
+        status, status_code = ("draining" if readiness.draining else "warming_up"), 503
+    return ORJSONModelResponse(
+        {"status": status, "phases": readiness.phases, "failed": readiness.failed},
+        status_code=status_code,
+    )
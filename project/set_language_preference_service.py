@@ -1,7 +1,7 @@
-import prisma
-import prisma.models
 from pydantic import BaseModel
 
+from project.preferences_store import save_language
+
 
 class SetLanguagePreferenceResponse(BaseModel):
     """
@@ -18,8 +18,8 @@ async def set_language_preference(
     """
     Endpoint for users to update their language preference.
 
-    This function checks if the user's preferences exist. If so, it updates the language preference;
-    if not, it creates a new preference entry with the specified language.
+    The preference row is created or updated with a single upsert, and the new language is
+    written through to the preferences cache.
 
     Args:
         user_id (str): The unique identifier of the user updating their language preference.
@@ -32,17 +32,7 @@ async def set_language_preference(
         await set_language_preference("some-user-id", "en")
         > SetLanguagePreferenceResponse(success=True, message="Language preference updated successfully.")
     """
-    preference = await prisma.models.Preferences.prisma().find_unique(
-        where={"userId": user_id}
-    )
-    if preference:
-        await prisma.models.Preferences.prisma().update(
-            where={"userId": user_id}, data={"language": language}
-        )
-    else:
-        await prisma.models.Preferences.prisma().create(
-            data={"userId": user_id, "language": language}
-        )
+    await save_language(user_id, language)
     return SetLanguagePreferenceResponse(
         success=True, message="Language preference updated successfully."
     )
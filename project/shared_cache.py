@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+import orjson
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_PATH = os.environ.get(
+    "SHARED_CACHE_PATH", os.path.join(tempfile.gettempdir(), "horser-shared-cache.sqlite3")
+)
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_BYTES", str(256 << 20)))
+# Total size is recomputed, and eviction run, after this many writes.
+EVICTION_CHECK_INTERVAL = 256
+# How long versions bumped by other workers may go unnoticed. Versions are kept in memory
+# and re-read in the background once older than this. After a quiet period of ten times
+# this they are re-read before answering.
+SHARED_CACHE_VERSION_TTL = float(os.environ.get("SHARED_CACHE_VERSION_TTL", "0.5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    fresh_until REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    stored_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at);
+CREATE TABLE IF NOT EXISTS versions (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class Codec:
+    """
+    Converts cached values to bytes and back. Values are JSON, optionally a pydantic model.
+    """
+
+    model: Optional[Type[BaseModel]] = None
+
+    def encode(self, value: Any) -> bytes:
+        return orjson.dumps(value.dict() if self.model is not None else value)
+
+    def decode(self, data: bytes) -> Any:
+        value = orjson.loads(data)
+        # The data was validated before it was stored, so skip validation.
+        return self.model.construct(**value) if self.model is not None else value
+
+
+class SharedCache:
+    """
+    Host-wide cache tier shared by every worker process, backed by SQLite in WAL mode.
+
+    Readers never block writers or each other, and each write is one atomic INSERT OR
+    REPLACE, so a worker sees either the old or the new value. Reads are run inline since
+    they only touch the page cache. Writes go to a single background thread, so the event
+    loop never waits for the write lock. Entries past their stale time, then the oldest
+    entries, are evicted to keep the file under max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+        self._reader = self._connect()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache")
+        self._writes_since_check = 0
+        # Versions only grow, so reads are merged by taking the larger one. The lock keeps
+        # a background read from undoing a bump made meanwhile.
+        self._versions: Dict[str, int] = {}
+        self._versions_lock = threading.Lock()
+        self._versions_read_at = -math.inf
+        self._versions_refreshing = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path, timeout=0.05, isolation_level=None, check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        # The cache can always be rebuilt, so commits need not wait for fsync.
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float, float]]:
+        """
+        Returns (value, fresh_until, stale_until) of an unexpired entry, or None. The times
+        are wall-clock timestamps, since they are shared between processes.
+        """
+        try:
+            row = self._reader.execute(
+                "SELECT value, fresh_until, stale_until FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            logger.debug("Shared cache read failed", exc_info=True)
+            return None
+        if row is None or row[1] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row
+
+    def _read_versions(self, connection: sqlite3.Connection) -> None:
+        rows = connection.execute("SELECT key, version FROM versions").fetchall()
+        with self._versions_lock:
+            for key, version in rows:
+                if version > self._versions.get(key, 0):
+                    self._versions[key] = version
+        self._versions_read_at = time.monotonic()
+
+    def _refresh_versions(self, connection: sqlite3.Connection) -> None:
+        try:
+            self._read_versions(connection)
+        finally:
+            self._versions_refreshing = False
+
+    def versions(self, *keys: str) -> Tuple[int, ...]:
+        """
+        Returns how many times each key has been bumped by any worker, as of at most
+        SHARED_CACHE_VERSION_TTL seconds ago while the cache is in use.
+        """
+        age = time.monotonic() - self._versions_read_at
+        if age >= 10 * SHARED_CACHE_VERSION_TTL:
+            try:
+                self._read_versions(self._reader)
+            except sqlite3.Error:
+                self.errors += 1
+                logger.debug("Shared cache read failed", exc_info=True)
+                # Retried in the background rather than on every call.
+                self._versions_read_at = time.monotonic()
+        elif age >= SHARED_CACHE_VERSION_TTL and not self._versions_refreshing:
+            self._versions_refreshing = True
+            if self._run(self._refresh_versions) is None:
+                self._versions_refreshing = False
+        return tuple(self._versions.get(key, 0) for key in keys)
+
+    def _run(
+        self, operation: Callable[[sqlite3.Connection], None]
+    ) -> Optional["Future[None]"]:
+        def run() -> None:
+            try:
+                if self._writer is None:
+                    self._writer = self._connect()
+                    self._writer.execute("PRAGMA busy_timeout=1000")
+                operation(self._writer)
+            except sqlite3.Error:
+                self.errors += 1
+                logger.debug("Shared cache write failed", exc_info=True)
+
+        try:
+            return self._executor.submit(run)
+        except RuntimeError:
+            # The executor has been shut down.
+            return None
+
+    def put(self, key: str, value: bytes, fresh_until: float, stale_until: float) -> None:
+        """
+        Publishes a value to every worker. Returns immediately; the write happens in the
+        background.
+        """
+
+        def write(connection: sqlite3.Connection) -> None:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, fresh_until, stale_until, time.time(), len(value)),
+            )
+            self.writes += 1
+            self._writes_since_check += 1
+            if self._writes_since_check >= EVICTION_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._evict(connection)
+
+        self._run(write)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        self.evictions += connection.execute(
+            "DELETE FROM entries WHERE stale_until <= ?", (time.time(),)
+        ).rowcount
+        (total,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        while total > self.max_bytes:
+            rows = connection.execute(
+                "SELECT key, size FROM entries ORDER BY stored_at LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            connection.executemany(
+                "DELETE FROM entries WHERE key = ?", [(key,) for key, _ in rows]
+            )
+            self.evictions += len(rows)
+            total -= sum(size for _, size in rows)
+
+    def delete(self, key: str) -> Optional["Future[None]"]:
+        """
+        Removes an entry in the background. The returned future is done once it is gone.
+        """
+        return self._run(lambda c: c.execute("DELETE FROM entries WHERE key = ?", (key,)))
+
+    def bump_version(self, key: str) -> Optional["Future[None]"]:
+        """
+        Increments a key's version in the background, telling other workers that values
+        they hold for it are outdated. The returned future is done once it is applied.
+        """
+        # This worker sees its own bump at once.
+        with self._versions_lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+        return self._run(
+            lambda c: c.execute(
+                "INSERT INTO versions VALUES (?, 1) "
+                "ON CONFLICT (key) DO UPDATE SET version = version + 1",
+                (key,),
+            )
+        )
+
+    def delete_prefix(self, prefix: str) -> Optional["Future[None]"]:
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self._run(
+            lambda c: c.execute(
+                "DELETE FROM entries WHERE key >= ? AND key < ?", (prefix, upper)
+            )
+        )
+
+    async def flush(self) -> None:
+        """
+        Waits until every write submitted so far has been applied.
+        """
+        await asyncio.get_running_loop().run_in_executor(self._executor, lambda: None)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._reader.close()
+        if self._writer is not None:
+            self._writer.close()
+
+
+_shared_cache: Optional[SharedCache] = None
+_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """
+    Returns this process's handle on the host-wide cache, opening it on first use, or None
+    if SHARED_CACHE_PATH is empty or the file cannot be opened.
+    """
+    global _shared_cache
+    if _shared_cache is None and SHARED_CACHE_PATH:
+        with _lock:
+            if _shared_cache is None:
+                try:
+                    _shared_cache = SharedCache(SHARED_CACHE_PATH, SHARED_CACHE_MAX_BYTES)
+                except sqlite3.Error:
+                    logger.warning(
+                        "Could not open shared cache at %s", SHARED_CACHE_PATH, exc_info=True
+                    )
+                    return None
+    return _shared_cache
+
+
+async def close_shared_cache() -> None:
+    """
+    Applies pending writes and closes this process's handle on the shared cache.
+    """
+    global _shared_cache
+    shared_cache, _shared_cache = _shared_cache, None
+    if shared_cache is not None:
+        await shared_cache.flush()
+        shared_cache.close()
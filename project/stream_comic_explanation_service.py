@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+import prisma.models
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from project.explanation_pipeline import ExplanationStream, explanation_pipeline
+from project.get_comic_explanation_service import (
+    GetComicExplanationResponseModel,
+    explanation_response,
+    get_comic_explanation,
+)
+
+logger = logging.getLogger(__name__)
+
+STREAM_FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+
+class ExplanationStreamEvent(BaseModel):
+    """
+    One event of a streamed explanation: a "chunk" of text, the stored explanation once
+    it is "done", or an "error" if generation failed.
+    """
+
+    type: str
+    text: Optional[str] = None
+    explanation: Optional[GetComicExplanationResponseModel] = None
+    detail: Optional[str] = None
+
+
+def encode_event(event: ExplanationStreamEvent, format: str) -> bytes:
+    """
+    Serializes an event as a server-sent event or as one line of NDJSON.
+    """
+    data = event.json(exclude_none=True)
+    if format == "sse":
+        return f"event: {event.type}\ndata: {data}\n\n".encode()
+    return f"{data}\n".encode()
+
+
+async def _complete(
+    explanation: GetComicExplanationResponseModel,
+) -> AsyncIterator[ExplanationStreamEvent]:
+    yield ExplanationStreamEvent(type="chunk", text=explanation.explanation)
+    yield ExplanationStreamEvent(type="done", explanation=explanation)
+
+
+async def _generated(
+    comicId: str,
+    stream: ExplanationStream,
+    job: "asyncio.Future[prisma.models.Explanation]",
+) -> AsyncIterator[ExplanationStreamEvent]:
+    try:
+        async for chunk in stream.follow():
+            yield ExplanationStreamEvent(type="chunk", text=chunk)
+        explanation = await job
+    except Exception as e:
+        # The response has started already, so the failure is reported in-band.
+        logger.warning("Streaming the explanation of comic %s failed: %s", comicId, e)
+        yield ExplanationStreamEvent(type="error", detail="Explanation generation failed.")
+        return
+    yield ExplanationStreamEvent(type="done", explanation=explanation_response(explanation))
+
+
+async def stream_comic_explanation(
+    comicId: str,
+) -> AsyncIterator[ExplanationStreamEvent]:
+    """
+    Endpoint to receive a comic's explanation as it is written.
+
+    A stored explanation is sent at once, from the explanation cache. So is the
+    placeholder of a comic whose explanations are all awaiting review or rejected.
+    Otherwise the viewer attaches to the comic's generation, starting it if needed, and
+    receives the text as the model streams it. Concurrent viewers of the same comic share one model
+    call, and the finished text is stored like any generated explanation. A generation
+    started for viewers is stopped once they have all disconnected, unless the comic was
+    also queued for generation.
+
+    Args:
+        comicId (str): The unique identifier of the comic to explain.
+
+    Returns:
+        AsyncIterator[ExplanationStreamEvent]: Chunks of the explanation text, followed by a
+        "done" event with the stored explanation, or an "error" event.
+
+    Raises:
+        HTTPException: If the comic with the given id does not exist.
+        OverloadedError: If every generation slot stayed busy.
+    """
+    explanation = await get_comic_explanation(comicId)
+    if explanation.generatedBy != "Placeholder":
+        return _complete(explanation)
+    if not explanation_pipeline.is_pending(comicId):
+        comic = await prisma.models.Comic.prisma().find_unique(
+            where={"id": comicId}, include={"Explanations": {"take": 1}}
+        )
+        if comic is None:
+            raise HTTPException(
+                status_code=404, detail=f"Comic with ID {comicId} not found."
+            )
+        if comic.Explanations:
+            # Its explanations are all flagged or rejected. Replacing them is up to the
+            # moderators, not to whoever views the comic next.
+            return _complete(explanation)
+    # Attached before the response starts, so a busy pipeline is answered with 503.
+    stream, job = await explanation_pipeline.attach(comicId)
+    return _generated(comicId, stream, job)
@@ -2,6 +2,8 @@ from typing import List
 
 from pydantic import BaseModel
 
+from project.preferences_store import save_preferences
+
 
 class UserPreferences(BaseModel):
     """
@@ -28,6 +30,9 @@ async def update_user_preferences(
     """
     Endpoint to update user preferences.
 
+    The language and the complete favorites list are saved in one transactional round
+    trip and written through to the preferences cache.
+
     Args:
         userId (str): Unique identifier for the user whose preferences are being updated.
         language (str): Preferred user language setting.
@@ -37,25 +42,11 @@ async def update_user_preferences(
         UpdateUserPreferencesResponse: Response model returned after updating user preferences
         indicating success and possibly returning the updated preferences.
     """
-    import prisma.models
-
-    current_preferences = await prisma.models.Preferences.prisma().find_unique(
-        where={"userId": userId}
-    )
-    if current_preferences:
-        await prisma.models.Preferences.prisma().update(
-            where={"userId": userId}, data={"language": language}
-        )
-        success = True
-        message = "User preferences updated successfully."
-    else:
-        success = False
-        message = "User preferences could not be found for the provided userId."
-    updated_user_preferences = UserPreferences(
-        language=language, favorite_comics=favorite_comics
-    )
+    saved_favorites = await save_preferences(userId, language, favorite_comics)
     return UpdateUserPreferencesResponse(
-        success=success,
-        message=message,
-        updated_preferences=updated_user_preferences if success else None,
+        success=True,
+        message="User preferences updated successfully.",
+        updated_preferences=UserPreferences(
+            language=language, favorite_comics=saved_favorites
+        ),
     )
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+import prisma.errors
+import prisma.models
+
+logger = logging.getLogger(__name__)
+
+VIEW_QUEUE_SIZE = int(os.environ.get("VIEW_QUEUE_SIZE", "10000"))
+VIEW_BATCH_SIZE = int(os.environ.get("VIEW_BATCH_SIZE", "500"))
+VIEW_FLUSH_INTERVAL = float(os.environ.get("VIEW_FLUSH_INTERVAL", "1"))
+
+
+@dataclass(frozen=True)
+class ViewEvent:
+    comic_id: str
+    user_id: str
+    viewed_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class ViewRecorder:
+    """
+    Buffers ComicView events in memory and writes them with create_many.
+
+    Recording only puts the event on a bounded queue. A background task flushes the queue
+    whenever batch_size events are waiting or flush_interval seconds have passed. When the
+    queue is full new events are dropped and counted instead of slowing the request down.
+    Listeners are called with every batch once it has been written.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = VIEW_QUEUE_SIZE,
+        batch_size: int = VIEW_BATCH_SIZE,
+        flush_interval: float = VIEW_FLUSH_INTERVAL,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._queue: "asyncio.Queue[ViewEvent]" = asyncio.Queue(maxsize=max_queue)
+        self._batch_ready = asyncio.Event()
+        self._stopping = False
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._listeners: List[Callable[[List[ViewEvent]], None]] = []
+
+    def add_listener(self, listener: Callable[[List[ViewEvent]], None]) -> None:
+        self._listeners.append(listener)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def record(self, comic_id: str, user_id: str) -> bool:
+        """
+        Queues a view without waiting for it to be written.
+
+        Args:
+            comic_id (str): The id of the viewed Comic row.
+            user_id (str): The id of the viewing user.
+
+        Returns:
+            bool: False if the queue was full and the view was dropped.
+        """
+        try:
+            self._queue.put_nowait(ViewEvent(comic_id=comic_id, user_id=user_id))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.recorded += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    def _take_batch(self) -> List[ViewEvent]:
+        batch = []
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _existing(self, batch: List[ViewEvent]) -> List[ViewEvent]:
+        """
+        Drops the events whose user or comic does not exist, counting them as rejected.
+        """
+        users = await prisma.models.User.prisma().find_many(
+            where={"id": {"in": list({event.user_id for event in batch})}}
+        )
+        comics = await prisma.models.Comic.prisma().find_many(
+            where={"id": {"in": list({event.comic_id for event in batch})}}
+        )
+        user_ids = {user.id for user in users}
+        comic_ids = {comic.id for comic in comics}
+        existing = [
+            event
+            for event in batch
+            if event.user_id in user_ids and event.comic_id in comic_ids
+        ]
+        if len(existing) < len(batch):
+            self.rejected += len(batch) - len(existing)
+            logger.warning(
+                "Dropped %s comic views of unknown users or comics",
+                len(batch) - len(existing),
+            )
+        return existing
+
+    async def _write(self, batch: List[ViewEvent]) -> None:
+        await prisma.models.ComicView.prisma().create_many(
+            data=[
+                {
+                    "comicId": event.comic_id,
+                    "userId": event.user_id,
+                    "viewDate": event.viewed_at,
+                }
+                for event in batch
+            ]
+        )
+
+    async def _flush(self, batch: List[ViewEvent]) -> None:
+        try:
+            try:
+                await self._write(batch)
+            except prisma.errors.ForeignKeyViolationError:
+                # One unknown user or comic fails the whole statement, so write the rest.
+                batch = await self._existing(batch)
+                if not batch:
+                    return
+                await self._write(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Failed to write %s comic views", len(batch))
+        else:
+            self.flushed += len(batch)
+            for listener in self._listeners:
+                try:
+                    listener(batch)
+                except Exception:
+                    logger.exception("View listener %r failed", listener)
+
+    async def flush(self) -> None:
+        """
+        Writes every queued event now.
+        """
+        while batch := self._take_batch():
+            await self._flush(batch)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the background task and drains whatever is still queued.
+        """
+        if self._task is not None:
+            # Let an in-progress write finish rather than cancelling it mid-batch.
+            self._stopping = True
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+
+
+view_recorder = ViewRecorder()
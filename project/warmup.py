@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import prisma
+
+from project import IMPORT_STARTED_AT
+from project.comic_catalog import comic_catalog
+from project.get_explanation_batch_service import MAX_BATCH_SIZE, get_explanation_batch
+from project.http_client import get_http_client
+from project.latest_comic_number import latest_comic_number
+from project.popularity import popularity
+from project.recommendations import co_view_model
+from project.search_index import search_index
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", "30"))
+WARMUP_DB_CONNECTIONS = int(os.environ.get("WARMUP_DB_CONNECTIONS", "4"))
+WARMUP_HTTP_CONNECTIONS = int(os.environ.get("WARMUP_HTTP_CONNECTIONS", "4"))
+WARMUP_POPULAR_EXPLANATIONS = int(os.environ.get("WARMUP_POPULAR_EXPLANATIONS", "500"))
+# Upstreams whose connection pools are opened during warm-up. The model API is left out,
+# it is only called by the background explanation pipeline.
+WARMUP_UPSTREAMS = ("xkcd", "xkcd-images")
+
+
+class Readiness:
+    """
+    Tracks startup progress for the /healthz and /readyz probes.
+
+    The process is live as soon as it serves requests, but only ready once warm-up has
+    finished, so the load balancer keeps traffic away from a pod with cold caches.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = IMPORT_STARTED_AT
+        self.ready = False
+        self.draining = False
+        self.phases: Dict[str, float] = {}
+        self.failed: List[str] = []
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = round(seconds, 4)
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+readiness = Readiness()
+
+
+async def _timed(name: str, step: Callable[[], Awaitable[object]]) -> None:
+    start = time.monotonic()
+    try:
+        await asyncio.wait_for(step(), WARMUP_TIMEOUT)
+    except Exception:
+        readiness.failed.append(name)
+        logger.warning("Warm-up step %s failed", name, exc_info=True)
+    finally:
+        readiness.record(name, time.monotonic() - start)
+
+
+async def prime_db_connections(connections: int = WARMUP_DB_CONNECTIONS) -> None:
+    """
+    Runs concurrent trivial queries so the query engine opens that many pool connections.
+    """
+    client = prisma.get_client()
+    await asyncio.gather(*(client.query_raw("SELECT 1") for _ in range(connections)))
+
+
+async def prime_http_connections(connections: int = WARMUP_HTTP_CONNECTIONS) -> None:
+    """
+    Opens keep-alive connections, including TLS handshakes, to the upstreams on the hot path.
+    """
+    await asyncio.gather(
+        *(
+            get_http_client(name).head("/")
+            for name in WARMUP_UPSTREAMS
+            for _ in range(connections)
+        )
+    )
+
+
+async def popular_comic_ids(limit: int) -> List[str]:
+    """
+    Returns the ids of the comics viewed most over the last week, from the view rollups.
+    """
+    return [comic_id for comic_id, _ in await popularity.query_window("week", limit)]
+
+
+async def preload_popular_explanations(limit: int = WARMUP_POPULAR_EXPLANATIONS) -> None:
+    """
+    Loads the explanations of the most viewed comics into the explanation cache.
+    """
+    comic_ids = await popular_comic_ids(limit)
+    for start in range(0, len(comic_ids), MAX_BATCH_SIZE):
+        await get_explanation_batch(comic_ids[start : start + MAX_BATCH_SIZE])
+
+
+async def load_comics() -> None:
+    """
+    Loads the comic catalog, then builds the search index from it.
+    """
+    await _timed("comic_catalog", comic_catalog.load)
+    await _timed("search_index", search_index.load)
+
+
+async def warm_up() -> None:
+    """
+    Preloads hot data and primes connections, then marks the process ready.
+
+    Steps run concurrently and a failing or slow step only delays readiness up to
+    WARMUP_TIMEOUT: a pod with one cold cache is still better than no pod.
+    """
+    start = time.monotonic()
+    await asyncio.gather(
+        load_comics(),
+        _timed("latest_comic_number", latest_comic_number.refresh),
+        _timed("popular_explanations", preload_popular_explanations),
+        _timed("co_view_model", co_view_model.load),
+        _timed("popular_comics", popularity.refresh),
+        _timed("db_connections", prime_db_connections),
+        _timed("http_connections", prime_http_connections),
+    )
+    readiness.record("warm_up", time.monotonic() - start)
+    readiness.ready = True
+    readiness.record("ready", readiness.uptime())
+    logger.info(
+        "Ready %.2fs after start, warm-up phases: %s", readiness.uptime(), readiness.phases
+    )